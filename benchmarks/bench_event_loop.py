@@ -0,0 +1,157 @@
+"""
+Сравнение стандартного event loop asyncio и uvloop на реальных обработчиках бота
+
+Поднимается локальный фейковый MAX API (отдельный процесс), затем для каждого loop
+в отдельном процессе измеряется:
+- пропускная способность обработки нажатий кнопок (handle_track_info: удаление + отправка)
+- скорость рассылки (send_feedback_request: состояние FSM + отправка вопроса)
+
+Запуск из корня репозитория:
+    python benchmarks/bench_event_loop.py --callbacks 2000 --broadcast 200
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import importlib.util
+import tempfile
+import subprocess
+import multiprocessing
+from types import SimpleNamespace
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_fake_api(port: int):
+    """Фейковый MAX API: POST/DELETE /messages"""
+    from aiohttp import web
+
+    counter = {"mid": 0}
+
+    async def post_message(request):
+        await request.read()
+        counter["mid"] += 1
+        return web.json_response({"message": {"body": {"mid": f"mid.{counter['mid']}"}}})
+
+    async def delete_message(request):
+        return web.json_response({"success": True})
+
+    app = web.Application()
+    app.add_routes([web.post("/messages", post_message), web.delete("/messages", delete_message)])
+    web.run_app(app, host="127.0.0.1", port=port, print=None, access_log=None)
+
+
+def make_callback_event(user_id: int, payload: str):
+    """Минимальный объект события MessageCallback для обработчиков"""
+    return SimpleNamespace(
+        callback=SimpleNamespace(
+            payload=payload,
+            callback_id=f"cb.{user_id}.{time.monotonic_ns()}",
+            user=SimpleNamespace(user_id=user_id),
+            message=None,
+        ),
+        message=SimpleNamespace(
+            recipient=SimpleNamespace(chat_id=user_id),
+            chat_id=user_id,
+            body=SimpleNamespace(mid=f"mid.old.{user_id}"),
+        ),
+    )
+
+
+async def bench_worker(port: int, callbacks: int, broadcast: int, concurrency: int):
+    """Замер на текущем event loop (бот импортируется во временном каталоге)"""
+    import aiohttp
+    import main as bot_main
+
+    bot_main.API_BASE_URL = f"http://127.0.0.1:{port}"
+    bot_main.http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency))
+    track_keys = list(bot_main.content.current.tracks.keys())
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_callback(i: int):
+        async with semaphore:
+            await bot_main.handle_track_info(make_callback_event(i, track_keys[i % len(track_keys)]),
+                                             track_keys[i % len(track_keys)])
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(one_callback(i) for i in range(callbacks)))
+        callbacks_time = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for user_id in range(broadcast):
+            await bot_main.send_feedback_request(user_id, user_id)
+        broadcast_time = time.perf_counter() - started
+    finally:
+        await bot_main.http_session.close()
+
+    return {
+        "callbacks_per_sec": callbacks / callbacks_time,
+        "broadcast_per_sec": broadcast / broadcast_time,
+    }
+
+
+def worker_main(args):
+    """Процесс замера для одного типа loop"""
+    if args.loop == "uvloop":
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+    # Файлы бота (Excel, состояния, очереди) создаются во временном каталоге
+    workdir = tempfile.mkdtemp(prefix="bench_loop_")
+    os.chdir(workdir)
+    os.environ.setdefault("CONTENT_FILE", os.path.join(REPO_DIR, "content.json"))
+    sys.path.insert(0, REPO_DIR)
+    os.environ.setdefault("BOT_TOKEN", "bench-token")
+
+    result = asyncio.run(bench_worker(args.port, args.callbacks, args.broadcast, args.concurrency))
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение asyncio и uvloop на обработчиках бота")
+    parser.add_argument("--callbacks", type=int, default=2000, help="количество нажатий кнопок")
+    parser.add_argument("--broadcast", type=int, default=200, help="количество получателей рассылки")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных обработчиков")
+    parser.add_argument("--port", type=int, default=8787, help="порт фейкового API")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--loop", default="asyncio", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        worker_main(args)
+        return
+
+    loops = ["asyncio"]
+    if importlib.util.find_spec("uvloop"):
+        loops.append("uvloop")
+    else:
+        print("uvloop не установлен - замер только для asyncio (pip install uvloop)")
+
+    api = multiprocessing.Process(target=run_fake_api, args=(args.port,), daemon=True)
+    api.start()
+    time.sleep(1)
+
+    results = {}
+    try:
+        for loop_name in loops:
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", "--loop", loop_name,
+                 "--port", str(args.port), "--callbacks", str(args.callbacks),
+                 "--broadcast", str(args.broadcast), "--concurrency", str(args.concurrency)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            # Последняя строка вывода - результат, остальное - логи бота
+            results[loop_name] = json.loads(output.strip().splitlines()[-1])
+    finally:
+        api.terminate()
+
+    print(f"{'loop':<10}{'нажатий/с':>14}{'рассылка/с':>14}")
+    for loop_name, result in results.items():
+        print(f"{loop_name:<10}{result['callbacks_per_sec']:>14.1f}{result['broadcast_per_sec']:>14.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Проверка отзыва рассылки (/recall) во время недоступности MAX API
+
+Фейковый API из stress_feedback.py: администратор запускает /send_feedback, затем API
+перестает принимать сообщения пользователям (503) и бот складывает сообщения опроса
+в очередь исходящих. Во время сбоя администратор отзывает кампанию, после чего API
+восстанавливается. Проверяется:
+- каждое доставленное пользователю сообщение кампании есть в ее индексе и удалено
+  (в том числе доставленные из очереди исходящих до того, как отмена дошла до drain_outbox)
+- сообщения, ждавшие в очереди во время отзыва, сняты с нее без отправки (<id>.purged)
+Итог отчета: всего сообщений кампании = отправлено (индекс) + снято с очереди.
+
+Запуск из корня репозитория:
+    python benchmarks/check_recall.py --users 40
+"""
+import os
+import re
+import sys
+import json
+import time
+import signal
+import asyncio
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import stress_feedback  # noqa: E402
+from stress_feedback import FakeMaxApi, ADMIN_ID, FIRST_USER_ID  # noqa: E402
+
+
+class OutageMaxApi(FakeMaxApi):
+    """Фейковый API, который на время сбоя отвечает 503 на сообщения пользователям"""
+
+    def __init__(self, users: list, think: float):
+        super().__init__(users, think)
+        self.outage = False
+        self.delivered = {}  # id сообщения пользователю -> время доставки
+        self.admin_texts = []
+
+    async def post_message(self, request):
+        from aiohttp import web
+        chat_id = int(request.query.get("chat_id") or request.query.get("user_id") or 0)
+        if chat_id != ADMIN_ID and self.outage:
+            return web.json_response({"code": "service.unavailable"}, status=503)
+        text = (await request.json()).get("text") or ""
+        response = await super().post_message(request)
+        if chat_id == ADMIN_ID:
+            self.admin_texts.append(text)
+        else:
+            self.delivered[f"out.{self.mid}"] = time.time()
+        return response
+
+    def campaign_id(self):
+        for text in self.admin_texts:
+            match = re.search(r"Кампания: (\S+)", text)
+            if match:
+                return match.group(1)
+        return None
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="check_recall_")
+    users = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+    with open(os.path.join(workdir, "users_db.json"), 'w', encoding='utf-8') as f:
+        json.dump({"users": {str(user_id): {"user_id": user_id, "chat_id": user_id} for user_id in users},
+                   "user_ids": users}, f)
+    # Предохранитель размыкается быстро, пробный запрос - раз в 2 секунды
+    os.environ.update(API_FAILURE_THRESHOLD="2", API_RECOVERY_TIMEOUT="2")
+
+    api = OutageMaxApi(users, args.think)
+    runner = await api.start(args.port)
+    api.push(ADMIN_ID, "/send_feedback", "in.admin.1")
+    print(f"Каталог бота: {workdir}, пользователей: {args.users}")
+
+    log = open(os.path.join(workdir, "bot.log"), 'ab')
+    process = await stress_feedback.start_bot(args, workdir, log)
+    try:
+        await asyncio.sleep(args.before)
+        api.outage = True
+        print("⚠️ API недоступно для сообщений пользователям")
+        await asyncio.sleep(args.outage)
+        campaign_id = api.campaign_id()
+        if not campaign_id:
+            print("❌ Бот не сообщил id кампании")
+            return 1
+        recall_at = time.time()
+        api.push(ADMIN_ID, f"/recall {campaign_id}", "in.admin.2")
+        print(f"🗑 /recall {campaign_id}")
+        await asyncio.sleep(2)
+        api.outage = False
+        print("✅ API восстановлено")
+        await asyncio.sleep(args.after)
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), timeout=60)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        log.close()
+        await runner.cleanup()
+
+    campaigns_dir = os.path.join(workdir, "campaigns")
+    with open(os.path.join(campaigns_dir, f"{campaign_id}.mids"), 'r', encoding='utf-8') as f:
+        indexed = set(f.read().split())
+    purged_path = os.path.join(campaigns_dir, f"{campaign_id}.purged")
+    purged = 0
+    if os.path.exists(purged_path):
+        with open(purged_path, 'r', encoding='utf-8') as f:
+            purged = sum(int(line) for line in f.read().split())
+
+    violations = []
+    # Доставка из очереди после отзыва допустима, только если сообщение затем удалено
+    for mid in api.delivered:
+        if mid not in api.deleted:
+            violations.append(f"сообщение {mid} доставлено и не удалено")
+    if indexed != set(api.delivered):
+        violations.append(f"индекс кампании ({len(indexed)}) не совпадает с доставленными ({len(api.delivered)})")
+    if not purged:
+        violations.append("за время сбоя ни одно сообщение не снято с очереди")
+
+    late = sum(1 for delivered_at in api.delivered.values() if delivered_at > recall_at)
+    print(f"\nДоставлено: {len(api.delivered)} (после отзыва: {late}), в индексе: {len(indexed)}, "
+          f"удалено: {len(api.deleted & set(api.delivered))}, снято с очереди: {purged}")
+    print(f"Всего сообщений кампании: {len(indexed) + purged} = отправлено {len(indexed)} + снято {purged}")
+    reports = [text for text in api.admin_texts if "Отзыв кампании" in text]
+    if reports:
+        print(f"Отчет: {reports[-1]}")
+    if violations:
+        print(f"\n❌ Нарушений: {len(violations)}")
+        for violation in violations[:20]:
+            print(f"  {violation}")
+        return 1
+    print("\n✅ Отозванная рассылка не дошла до пользователей")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверка отзыва рассылки во время недоступности API")
+    parser.add_argument("--users", type=int, default=40, help="количество виртуальных пользователей")
+    parser.add_argument("--before", type=float, default=6, help="секунд рассылки до сбоя API")
+    parser.add_argument("--outage", type=float, default=5, help="секунд сбоя до отзыва")
+    parser.add_argument("--after", type=float, default=15, help="секунд работы после восстановления API")
+    parser.add_argument("--think", type=float, default=3, help="максимальная пауза пользователя перед ответом (с)")
+    parser.add_argument("--port", type=int, default=8789, help="порт фейкового API")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == '__main__':
+    main()
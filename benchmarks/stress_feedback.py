@@ -0,0 +1,279 @@
+"""
+Нагрузочный тест опроса (q1 -> q2 -> q3) с аварийными перезапусками бота
+
+Поднимается локальный фейковый MAX API с виртуальными пользователями: каждый отвечает
+на полученный вопрос опроса через случайную паузу. Бот запускается отдельным процессом
+во временном каталоге, администратор запускает рассылку опроса, а тест в случайные
+моменты убивает бот (SIGKILL) и запускает заново. В конце проверяется лист "Отзывы":
+- нет повторных строк одного пользователя
+- ответы в строке ровно те, что отправил пользователь
+- нет потерянных отзывов (пользователь ответил на вопрос 3, а строки нет)
+
+Запуск из корня репозитория:
+    python benchmarks/stress_feedback.py --users 1000 --kills 5
+"""
+import os
+import sys
+import json
+import time
+import random
+import signal
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ADMIN_ID = 1
+FIRST_USER_ID = 1000
+THANKS_PREFIX = "✅ Спасибо за обратную связь"
+
+
+def answer_text(user_id: int, number: int) -> str:
+    return f"{user_id}:q{number}"
+
+
+class FakeMaxApi:
+    """Фейковый MAX API: очередь обновлений для long polling и виртуальные пользователи"""
+
+    def __init__(self, users: list, think: float):
+        self.users = users
+        self.think = think  # Максимальная пауза пользователя перед ответом (секунды)
+        self.updates = []  # Все обновления по порядку, marker - индекс в списке
+        self.new_update = asyncio.Event()
+        self.mid = 0
+        self.questions = Counter()  # (user_id, номер вопроса) -> сколько раз получен
+        self.answered = {}  # user_id -> номер последнего отправленного ответа
+        self.thanks = Counter()  # user_id -> сколько раз получена благодарность
+        self.answers_sent = 0
+        self.deleted = set()  # id удаленных сообщений (отзыв рассылки)
+        self.last_progress = time.monotonic()
+
+    def push(self, user_id: int, text: str, mid: str):
+        ts = int(time.time() * 1000)
+        self.updates.append({
+            "update_type": "message_created",
+            "timestamp": ts,
+            "message": {
+                "sender": {"user_id": user_id, "first_name": f"user{user_id}", "is_bot": False},
+                "recipient": {"chat_id": user_id, "chat_type": "dialog"},
+                "timestamp": ts,
+                "body": {"mid": mid, "seq": len(self.updates), "text": text},
+            },
+        })
+        self.new_update.set()
+
+    async def answer_later(self, user_id: int, number: int):
+        """
+        Виртуальный пользователь отвечает на вопрос number через случайную паузу.
+        На каждый вопрос отвечает один раз: вопрос, повторно отправленный после аварийной
+        остановки между отправкой и сохранением состояния, только учитывается в отчете
+        """
+        await asyncio.sleep(random.uniform(0, self.think))
+        if self.thanks[user_id] or self.answered.get(user_id, 0) >= number:
+            return
+        self.answered[user_id] = max(self.answered.get(user_id, 0), number)
+        self.answers_sent += 1
+        self.push(user_id, answer_text(user_id, number), f"in.{user_id}.{number}")
+
+    async def get_updates(self, request):
+        from aiohttp import web
+        marker = int(request.query.get("marker") or 0)
+        if marker >= len(self.updates):
+            self.new_update.clear()
+            try:
+                await asyncio.wait_for(self.new_update.wait(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+        return web.json_response({"updates": self.updates[marker:marker + 100],
+                                  "marker": min(len(self.updates), marker + 100)})
+
+    async def post_message(self, request):
+        from aiohttp import web
+        body = await request.json()
+        text = body.get("text") or ""
+        chat_id = int(request.query.get("chat_id") or request.query.get("user_id") or 0)
+        for number in (1, 2, 3):
+            if f"Вопрос {number} из 3" in text:
+                self.questions[chat_id, number] += 1
+                self.last_progress = time.monotonic()
+                asyncio.create_task(self.answer_later(chat_id, number))
+        if text.startswith(THANKS_PREFIX):
+            self.thanks[chat_id] += 1
+            self.last_progress = time.monotonic()
+        self.mid += 1
+        return web.json_response({"message": {
+            "recipient": {"chat_id": chat_id, "chat_type": "dialog"},
+            "timestamp": int(time.time() * 1000),
+            "body": {"mid": f"out.{self.mid}", "seq": self.mid, "text": text},
+        }})
+
+    async def delete_message(self, request):
+        from aiohttp import web
+        self.deleted.add(request.query.get("message_id"))
+        return web.json_response({"success": True})
+
+    async def start(self, port: int):
+        from aiohttp import web
+
+        async def ok(request):
+            return web.json_response({"success": True})
+
+        async def me(request):
+            return web.json_response({"user_id": 1, "first_name": "bot", "is_bot": True})
+
+        async def chat(request):
+            return web.json_response({"chat_id": int(request.match_info["chat_id"]), "type": "dialog",
+                                      "status": "active", "last_event_time": 0,
+                                      "participants_count": 2, "is_public": False})
+
+        app = web.Application()
+        app.add_routes([
+            web.get("/updates", self.get_updates),
+            web.post("/messages", self.post_message),
+            web.delete("/messages", self.delete_message),
+            web.get("/me", me),
+            web.get("/chats/{chat_id}", chat),
+            web.get("/subscriptions", lambda request: web.json_response({"subscriptions": []})),
+            web.route("*", "/{tail:.*}", ok),
+        ])
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        return runner
+
+
+def bot_main(api_url: str):
+    """Процесс бота: настоящий main.py, запросы идут в фейковый API"""
+    sys.path.insert(0, REPO_DIR)
+    # Адрес API подменяется до импорта бота - maxapi создает соединение при импорте main
+    from maxapi.connection.base import BaseConnection
+    BaseConnection.API_URL = api_url
+    import main as bot
+    bot.API_BASE_URL = api_url
+    bot.image_cache.api_base_url = api_url
+    bot.install_event_loop()
+    asyncio.run(bot.main())
+
+
+async def start_bot(args, workdir: str, log):
+    env = dict(os.environ, BOT_TOKEN="stress-token", ADMIN_ID=str(ADMIN_ID),
+               CONTENT_FILE=os.path.join(REPO_DIR, "content.json"))
+    return await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--bot", "--api-url", f"http://127.0.0.1:{args.port}",
+        cwd=workdir, env=env, stdout=log, stderr=log
+    )
+
+
+def read_feedback_rows(workdir: str) -> list:
+    """Строки листа "Отзывы" всех секций (после остановки бота)"""
+    os.chdir(workdir)
+    os.environ.setdefault("BOT_TOKEN", "stress-token")
+    sys.path.insert(0, REPO_DIR)
+    from utils.sheets import ExcelManager
+    return [row for row in ExcelManager().iter_feedback_rows() if row and row[0] is not None]
+
+
+def verify(api: FakeMaxApi, rows: list) -> list:
+    """Проверка листа "Отзывы". Возвращает список нарушений"""
+    violations = []
+    rows_by_user = Counter(str(row[0]) for row in rows)
+    for user_id, count in rows_by_user.items():
+        if count > 1:
+            violations.append(f"пользователь {user_id}: {count} строк отзыва")
+    for row in rows:
+        user_id = int(row[0])
+        expected = [answer_text(user_id, number) for number in (1, 2, 3)]
+        if [value or "" for value in row[2:5]] != expected:
+            violations.append(f"пользователь {user_id}: ответы {list(row[2:5])} вместо {expected}")
+    for user_id in api.users:
+        if api.answered.get(user_id) == 3 and str(user_id) not in rows_by_user:
+            violations.append(f"пользователь {user_id}: ответ на вопрос 3 отправлен, строки отзыва нет")
+    return violations
+
+
+async def run(args):
+    workdir = tempfile.mkdtemp(prefix="stress_feedback_")
+    users = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users))
+    with open(os.path.join(workdir, "users_db.json"), 'w', encoding='utf-8') as f:
+        json.dump({"users": {str(user_id): {"user_id": user_id, "chat_id": user_id} for user_id in users},
+                   "user_ids": users}, f)
+
+    api = FakeMaxApi(users, args.think)
+    runner = await api.start(args.port)
+    api.push(ADMIN_ID, f"/schedule_feedback now {args.window:g}", "in.admin.1")
+    print(f"Каталог бота: {workdir}, пользователей: {args.users}, аварийных остановок: {args.kills}")
+
+    log = open(os.path.join(workdir, "bot.log"), 'ab')
+    started = time.monotonic()
+    process = await start_bot(args, workdir, log)
+    kills = 0
+    try:
+        while True:
+            await asyncio.sleep(random.uniform(args.kill_min, args.kill_max) if kills < args.kills else 1)
+            done = sum(1 for user_id in users if api.thanks[user_id])
+            if done == len(users) or time.monotonic() - api.last_progress > args.idle:
+                break
+            if kills < args.kills:
+                process.kill()
+                await process.wait()
+                kills += 1
+                print(f"💥 SIGKILL #{kills}: завершили опрос {done}/{len(users)}, ответов {api.answers_sent}")
+                process = await start_bot(args, workdir, log)
+                api.last_progress = time.monotonic()
+        elapsed = time.monotonic() - started
+    finally:
+        if process.returncode is None:
+            process.send_signal(signal.SIGTERM)
+            try:
+                await asyncio.wait_for(process.wait(), timeout=60)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+        log.close()
+        await runner.cleanup()
+
+    rows = read_feedback_rows(workdir)
+    violations = verify(api, rows)
+    completed = sum(1 for user_id in users if api.thanks[user_id])
+    stuck = [user_id for user_id in users if api.answered.get(user_id, 0) < 3 and api.questions[user_id, 1]]
+    repeated = sum(count - 1 for count in api.questions.values() if count > 1)
+
+    print(f"\nВремя: {elapsed:.1f} с, аварийных остановок: {kills}")
+    print(f"Ответов пользователей: {api.answers_sent} ({api.answers_sent / elapsed:.1f}/с)")
+    print(f"Строк отзывов: {len(rows)} ({len(rows) / elapsed:.1f}/с), завершили опрос: {completed}/{len(users)}")
+    print(f"Повторно отправленных вопросов: {repeated}, повторных благодарностей: "
+          f"{sum(count - 1 for count in api.thanks.values() if count > 1)}")
+    if stuck:
+        print(f"⚠️ Не дошли до вопроса 3: {len(stuck)} (например {stuck[:5]})")
+    if violations:
+        print(f"\n❌ Нарушений: {len(violations)}")
+        for violation in violations[:20]:
+            print(f"  {violation}")
+        return 1
+    print("\n✅ Потерянных и повторных отзывов нет")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест опроса с аварийными перезапусками бота")
+    parser.add_argument("--users", type=int, default=1000, help="количество виртуальных пользователей")
+    parser.add_argument("--kills", type=int, default=5, help="количество аварийных остановок (SIGKILL)")
+    parser.add_argument("--kill-min", type=float, default=3, help="минимальная пауза между остановками (с)")
+    parser.add_argument("--kill-max", type=float, default=10, help="максимальная пауза между остановками (с)")
+    parser.add_argument("--window", type=float, default=0, help="окно рассылки опроса (минуты)")
+    parser.add_argument("--think", type=float, default=0.5, help="максимальная пауза пользователя перед ответом (с)")
+    parser.add_argument("--idle", type=float, default=30, help="завершение, если столько секунд нет прогресса")
+    parser.add_argument("--port", type=int, default=8788, help="порт фейкового API")
+    parser.add_argument("--bot", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.bot:
+        bot_main(args.api_url)
+        return
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == '__main__':
+    main()
@@ -23,9 +23,108 @@ TRACK_IMAGES = {
     "track_media": os.getenv("TRACK_MEDIA_IMAGE", ""),
 }
 
-# Путь к Excel файлу для хранения вопросов и отзывов
+# Файл кэша токенов загруженных изображений и время жизни токена (секунды)
+IMAGE_CACHE_FILE = os.getenv("IMAGE_CACHE_FILE", "image_tokens.json")
+IMAGE_TOKEN_TTL = int(os.getenv("IMAGE_TOKEN_TTL", "86400"))
+
+# Защита от недоступности MAX API: таймаут запроса (секунды), количество ошибок подряд
+# до размыкания предохранителя, пауза до пробного запроса (секунды) и файл очереди сообщений
+API_REQUEST_TIMEOUT = float(os.getenv("API_REQUEST_TIMEOUT", "10"))
+API_FAILURE_THRESHOLD = int(os.getenv("API_FAILURE_THRESHOLD", "5"))
+API_RECOVERY_TIMEOUT = float(os.getenv("API_RECOVERY_TIMEOUT", "30"))
+OUTBOX_FILE = os.getenv("OUTBOX_FILE", "outbox.jsonl")
+
+# Планировщик обработки обновлений: количество воркеров, лимит очереди одного пользователя,
+# общий лимит очередей и сколько ждать места при переполнении (секунды)
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "8"))
+USER_QUEUE_LIMIT = int(os.getenv("USER_QUEUE_LIMIT", "20"))
+QUEUE_LIMIT = int(os.getenv("QUEUE_LIMIT", "1000"))
+QUEUE_OVERFLOW_WAIT = float(os.getenv("QUEUE_OVERFLOW_WAIT", "5"))
+
+# Ограничение частоты событий от одного пользователя: событий в секунду и емкость "корзины"
+MESSAGE_RATE_LIMIT = float(os.getenv("MESSAGE_RATE_LIMIT", "1"))
+MESSAGE_RATE_BURST = int(os.getenv("MESSAGE_RATE_BURST", "5"))
+CALLBACK_RATE_LIMIT = float(os.getenv("CALLBACK_RATE_LIMIT", "2"))
+CALLBACK_RATE_BURST = int(os.getenv("CALLBACK_RATE_BURST", "8"))
+
+# Время на корректную остановку бота (секунды): дообработка очередей, рассылок, сохранение данных
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "20"))
+
+# Контроль задержек event loop: период измерения и порог для вывода стека (секунды)
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "1"))
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.5"))
+
+# Использовать uvloop вместо стандартного event loop (если пакет установлен); по умолчанию выключено
+USE_UVLOOP = os.getenv("USE_UVLOOP", "0").lower() in ("1", "true", "yes")
+
+# Файл с контентом форума (тексты, треки, расписание) и период проверки его изменений (секунды)
+CONTENT_FILE = os.getenv("CONTENT_FILE", "content.json")
+CONTENT_RELOAD_INTERVAL = float(os.getenv("CONTENT_RELOAD_INTERVAL", "5"))
+
+# Каталог запланированных рассылок (кампании и прогресс отправки)
+CAMPAIGNS_DIR = os.getenv("CAMPAIGNS_DIR", "campaigns")
+
+# Восстановление после перезапуска: файл с маркером обновлений и обработанными callback_id,
+# возраст нажатия кнопки из накопившейся очереди, после которого оно отбрасывается (секунды)
+UPDATES_STATE_FILE = os.getenv("UPDATES_STATE_FILE", "updates_state.json")
+CATCHUP_STALE_SECONDS = float(os.getenv("CATCHUP_STALE_SECONDS", "60"))
+
+# Файл со счетчиками воронки опроса для /stats
+FEEDBACK_FUNNEL_FILE = os.getenv("FEEDBACK_FUNNEL_FILE", "feedback_funnel.json")
+
+# Многопроцессный режим: количество процессов-воркеров (1 - обычный режим в одном процессе),
+# размер очереди обновлений каждого воркера и файл общего хранилища состояний (SQLite)
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_QUEUE_SIZE = int(os.getenv("WORKER_QUEUE_SIZE", "1000"))
+SHARED_STORE_FILE = os.getenv("SHARED_STORE_FILE", "bot_state.db")
+# Номер процесса-воркера (задается главным процессом при запуске воркера)
+WORKER_INDEX = int(os.getenv("BOT_WORKER_INDEX")) if os.getenv("BOT_WORKER_INDEX") else None
+
+# Вопросы спикерам: журнал еще не записанных в Excel вопросов, период записи пачкой (секунды),
+# размер пачки для немедленной записи и сколько последних вопросов к докладу держать в памяти
+QUESTIONS_JOURNAL_FILE = os.getenv("QUESTIONS_JOURNAL_FILE", "questions_pending.jsonl")
+QUESTIONS_FLUSH_INTERVAL = float(os.getenv("QUESTIONS_FLUSH_INTERVAL", "10"))
+QUESTIONS_BATCH_SIZE = int(os.getenv("QUESTIONS_BATCH_SIZE", "50"))
+QUESTIONS_INDEX_LIMIT = int(os.getenv("QUESTIONS_INDEX_LIMIT", "200"))
+# ID модераторов через запятую (могут смотреть вопросы командой /questions)
+MODERATOR_IDS = [int(value) for value in os.getenv("MODERATOR_IDS", "").split(",") if value.strip()]
+
+# Каталог для результатов профилирования (/profile_start, /mem_snapshot)
+PROFILES_DIR = os.getenv("PROFILES_DIR", "profiles")
+
+# Несколько мероприятий в одном процессе: JSON файл со списком мероприятий (id, каталог данных
+# и переопределения настроек этого файла, в том числе BOT_TOKEN). Пусто - одно мероприятие
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+
+# Прогрев при запуске: сколько соединений с MAX API открыть заранее и держать открытыми
+# (0 - без прогрева), время жизни простаивающего соединения в пуле и лимит ожидания прогрева (секунды)
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+KEEPALIVE_TIMEOUT = float(os.getenv("KEEPALIVE_TIMEOUT", "60"))
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "10"))
+
+# Отзыв ошибочной рассылки (/recall): удалений сообщений в секунду и одновременных запросов
+RECALL_RATE = float(os.getenv("RECALL_RATE", "20"))
+RECALL_CONCURRENCY = int(os.getenv("RECALL_CONCURRENCY", "10"))
+
+# Напоминание о незаконченном опросе: через сколько минут без ответа на вопрос 1 или 2
+# напомнить (0 - не напоминать), напоминаний в секунду и журнал таймеров
+FEEDBACK_REMINDER_DELAY = float(os.getenv("FEEDBACK_REMINDER_DELAY", "180"))
+FEEDBACK_REMINDER_RATE = float(os.getenv("FEEDBACK_REMINDER_RATE", "10"))
+FEEDBACK_REMINDERS_FILE = os.getenv("FEEDBACK_REMINDERS_FILE", "feedback_reminders.log")
+
+# Путь к Excel файлу для хранения вопросов и отзывов (до разбиения на секции)
 EXCEL_FILE_PATH = os.getenv("EXCEL_FILE_PATH", "forum_data.xlsx")
 
+# Секции Excel: каталог, смена секции (event - по мероприятию, day - по дню, none - только по размеру),
+# максимум строк в секции и идентификатор текущего мероприятия
+EXCEL_PARTITIONS_DIR = os.getenv("EXCEL_PARTITIONS_DIR", "forum_data")
+EXCEL_PARTITION_BY = os.getenv("EXCEL_PARTITION_BY", "day")
+EXCEL_PARTITION_MAX_ROWS = int(os.getenv("EXCEL_PARTITION_MAX_ROWS", "2000"))
+FORUM_EVENT_ID = os.getenv("FORUM_EVENT_ID", "")
+
+# Каталог для выгрузок (объединенные таблицы)
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+
 # ID админа для рассылки (опционально)
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0")) if os.getenv("ADMIN_ID") else None
 
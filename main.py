@@ -1,31 +1,135 @@
+import time
+# Момент запуска процесса: от него считается холодный старт (включая импорт модулей)
+STARTED_AT = time.monotonic()
 import os
 import asyncio
 import json
+import signal
+import importlib.util
+from datetime import datetime
 import aiohttp
 import fcntl  # для блокировок файлов на Linux/Unix
 from maxapi import Bot, Dispatcher
 from maxapi.types import BotStarted, Command, MessageCreated, MessageCallback, CallbackButton, LinkButton
-from config import BOT_TOKEN, REGISTRATION_URL, FORUM_SITE_URL, QUESTION_FORM_URL, TRACK_IMAGES
-from utils.sheets import excel_manager
+from maxapi.methods.types.getted_updates import process_update_webhook
+from config import API_REQUEST_TIMEOUT, API_FAILURE_THRESHOLD, API_RECOVERY_TIMEOUT
+from config import WORKER_COUNT, USER_QUEUE_LIMIT, QUEUE_LIMIT, QUEUE_OVERFLOW_WAIT
+from config import MESSAGE_RATE_LIMIT, MESSAGE_RATE_BURST, CALLBACK_RATE_LIMIT, CALLBACK_RATE_BURST
+from config import SHUTDOWN_TIMEOUT, LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD, USE_UVLOOP
+from config import CATCHUP_STALE_SECONDS
+from config import WORKER_PROCESSES, WORKER_QUEUE_SIZE, SHARED_STORE_FILE, WORKER_INDEX
+from config import PROFILES_DIR
+from config import TENANTS_FILE
+from config import WARMUP_CONNECTIONS, KEEPALIVE_TIMEOUT, WARMUP_TIMEOUT
+import config
+from utils.sheets import ExcelManager
+from utils.images import ImageTokenCache
+from utils.audience import AudienceIndex, SEGMENT_ANSWERED
+from utils.outbox import CircuitBreaker, Outbox
+from utils.scheduler import UpdateScheduler
+from utils.metrics import metrics
+from utils.ratelimit import FloodControl
+from utils.watchdog import LoopLagMonitor, sd_notify
+from utils.content import ContentStore
+from utils.campaigns import CampaignScheduler
+from utils.catchup import CatchUp, UpdatesState
+from utils.stats import FeedbackStats, STATS_PREFIX
+from utils.store import SharedStore
+from utils.cluster import Cluster, WorkerAcks, shard_index
+from utils.profiling import Profiler
+from utils.questions import QuestionBook
+from utils.export import EXPORT_SHEETS, export_csv, upload_file
+from utils.tenants import Tenant, TenantRegistry, TenantLocal, base_settings, load_tenants
+from utils.warmup import StartupTimings, ConnectionKeeper, TokenError, check_token
+from utils.tracks import TrackNormalizer, OTHER_TRACK
+from utils.reminders import ReminderScheduler
 
 API_BASE_URL = "https://platform-api.max.ru"
 
-# Инициализация бота и диспетчера
-bot = Bot(BOT_TOKEN)
+# Замеры холодного старта (выводятся в лог перед началом polling)
+startup_timings = StartupTimings(STARTED_AT)
+startup_timings.add("импорт модулей", time.monotonic() - STARTED_AT)
+
+
+def worker_file(path: str) -> str:
+    """Отдельный файл для процесса-воркера в многопроцессном режиме (outbox.w0.jsonl и т.п.)"""
+    if WORKER_INDEX is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.w{WORKER_INDEX}{ext}"
+
+
+# Инициализация диспетчера (обработчики общие для всех мероприятий)
 dp = Dispatcher()
 
+# Мероприятия процесса: в обычном режиме одно (настройки из config.py), с TENANTS_FILE - несколько.
+# Имена ниже переадресуют обращения объектам текущего мероприятия (создаются в setup_tenant)
+tenants = TenantRegistry()
+settings = TenantLocal(tenants, "settings")
+bot = TenantLocal(tenants, "bot")
+updates_state = TenantLocal(tenants, "updates_state")
+processed_callbacks = TenantLocal(tenants, "processed_callbacks")
+outbox = TenantLocal(tenants, "outbox")
+image_cache = TenantLocal(tenants, "image_cache")
+user_states = TenantLocal(tenants, "user_states")
+audience = TenantLocal(tenants, "audience")
+feedback_stats = TenantLocal(tenants, "feedback_stats")
+excel_manager = TenantLocal(tenants, "excel_manager")
+questions = TenantLocal(tenants, "questions")
+content = TenantLocal(tenants, "content")
+campaigns = TenantLocal(tenants, "campaigns")
+reminders = TenantLocal(tenants, "reminders")
+
+
+def tenant_file(path: str) -> str:
+    """Путь файла текущего мероприятия (относительные пути - в каталоге мероприятия)"""
+    return tenants.current().path(path)
+
+# Планировщик обработчиков: ограниченное число воркеров, события пользователя по порядку
+update_scheduler = UpdateScheduler(WORKER_COUNT, USER_QUEUE_LIMIT, QUEUE_LIMIT, QUEUE_OVERFLOW_WAIT)
+
+# Накопившиеся за время простоя устаревшие нажатия кнопок отбрасываются
+catchup = CatchUp(CATCHUP_STALE_SECONDS)
+
+# Ограничение частоты сообщений и нажатий кнопок от одного пользователя (лимиты мероприятия)
+message_flood_control = FloodControl(
+    "messages", MESSAGE_RATE_LIMIT, MESSAGE_RATE_BURST,
+    limits=lambda: (settings.MESSAGE_RATE_LIMIT, settings.MESSAGE_RATE_BURST)
+)
+callback_flood_control = FloodControl(
+    "callbacks", CALLBACK_RATE_LIMIT, CALLBACK_RATE_BURST,
+    limits=lambda: (settings.CALLBACK_RATE_LIMIT, settings.CALLBACK_RATE_BURST)
+)
+
 # Глобальная сессия aiohttp для всех запросов
 http_session: aiohttp.ClientSession = None
 
-# Состояния для FSM (конечный автомат состояний)
-user_states = {}
+# Предохранитель для запросов к MAX API (общий - API одно для всех мероприятий)
+api_breaker = CircuitBreaker(API_FAILURE_THRESHOLD, API_RECOVERY_TIMEOUT)
+metrics.set_gauge("outbox_pending", lambda: len(outbox))
+metrics.set_gauge("api_breaker_state", lambda: api_breaker.state)
+api_timeout = aiohttp.ClientTimeout(total=API_REQUEST_TIMEOUT)
 
-# Файлы для хранения данных
+# Общее хранилище состояний для процессов-воркеров (в обычном режиме - None, данные в JSON файлах)
+shared_store = SharedStore(SHARED_STORE_FILE) if WORKER_INDEX is not None else None
+
+# Файлы для хранения данных (в каталоге мероприятия)
 USERS_DB_FILE = "users_db.json"
 STATES_DB_FILE = "user_states.json"
+AUDIENCE_SEGMENTS_FILE = "audience_segments.log"
+
 
-# Множество обработанных callback_id для защиты от повторной обработки
-processed_callbacks = set()
+async def save_questions_batch(rows: list) -> bool:
+    """Запись пачки вопросов в Excel в отдельном потоке (не блокирует обработку событий)"""
+    async with excel_manager._excel_lock:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, excel_manager.save_questions, rows)
+
+
+# Сегменты для /send_feedback: треки и "не ответившие на опрос"
+SEGMENT_NO_ANSWER = "no_answer"
+# Пауза между сообщениями /send_feedback (секунды) - из нее считается окно кампании
+FEEDBACK_SEND_INTERVAL = 0.5
 
 # Блокировки для синхронизации доступа к файлам
 _states_file_lock = asyncio.Lock()
@@ -35,9 +139,12 @@ _excel_file_lock = asyncio.Lock()
 
 def load_users_db():
     """Загрузка базы пользователей из файла"""
+    if shared_store:
+        return shared_store.users_db()
+    users_file = tenant_file(USERS_DB_FILE)
     try:
-        if os.path.exists(USERS_DB_FILE):
-            with open(USERS_DB_FILE, 'r', encoding='utf-8') as f:
+        if os.path.exists(users_file):
+            with open(users_file, 'r', encoding='utf-8') as f:
                 return json.load(f)
     except Exception as e:
         print(f"Ошибка загрузки базы пользователей: {e}")
@@ -46,10 +153,14 @@ def load_users_db():
 
 def load_user_states():
     """Загрузка состояний пользователей из файла (синхронная версия для внутреннего использования)"""
-    global user_states
+    if shared_store:
+        # Состояния читаются из общего хранилища при каждом обращении
+        return
+    tenant = tenants.current()
+    states_file = tenant.path(STATES_DB_FILE)
     try:
-        if os.path.exists(STATES_DB_FILE):
-            with open(STATES_DB_FILE, 'r', encoding='utf-8') as f:
+        if os.path.exists(states_file):
+            with open(states_file, 'r', encoding='utf-8') as f:
                 # Блокировка файла для чтения (Linux/Unix)
                 try:
                     fcntl.flock(f.fileno(), fcntl.LOCK_SH)
@@ -62,23 +173,27 @@ def load_user_states():
                     loaded_states = json.load(f)
                 
                 # Преобразуем строковые ключи обратно в int для user_id
-                user_states = {}
+                tenant.user_states = {}
                 for key, value in loaded_states.items():
                     try:
                         # Если ключ - число, преобразуем в int
                         if key.isdigit():
-                            user_states[int(key)] = value
+                            tenant.user_states[int(key)] = value
                         else:
-                            user_states[key] = value
+                            tenant.user_states[key] = value
                     except:
-                        user_states[key] = value
+                        tenant.user_states[key] = value
     except Exception as e:
         print(f"Ошибка загрузки состояний пользователей: {e}")
-        user_states = {}
+        tenant.user_states = {}
 
 
 async def save_user_states():
     """Сохранение состояний пользователей в файл (асинхронная версия с блокировкой)"""
+    if shared_store:
+        # Каждое изменение уже записано в общее хранилище
+        return
+    states_file = tenant_file(STATES_DB_FILE)
     async with _states_file_lock:
         try:
             # Преобразуем int ключи в строки для JSON
@@ -87,7 +202,7 @@ async def save_user_states():
                 states_to_save[str(key)] = value
             
             # Используем временный файл для атомарной записи
-            temp_file = STATES_DB_FILE + '.tmp'
+            temp_file = states_file + '.tmp'
             with open(temp_file, 'w', encoding='utf-8') as f:
                 # Блокировка файла для записи (Linux/Unix)
                 try:
@@ -105,7 +220,7 @@ async def save_user_states():
                     os.fsync(f.fileno())
             
             # Атомарное переименование (на Linux это атомарная операция)
-            os.replace(temp_file, STATES_DB_FILE)
+            os.replace(temp_file, states_file)
         except Exception as e:
             print(f"Ошибка сохранения состояний пользователей: {e}")
             # Удаляем временный файл при ошибке
@@ -118,6 +233,11 @@ async def save_user_states():
 
 async def save_user_id(user_id: int, chat_id: int = None):
     """Сохранение ID пользователя и chat_id в базу (асинхронная версия с блокировкой)"""
+    if shared_store:
+        shared_store.save_user(user_id, chat_id)
+        audience.add(user_id, chat_id)
+        return
+    users_file = tenant_file(USERS_DB_FILE)
     try:
         async with _users_file_lock:
             db = load_users_db()
@@ -138,9 +258,10 @@ async def save_user_id(user_id: int, chat_id: int = None):
             # Обновляем chat_id, если передан
             if chat_id:
                 db["users"][str(user_id)]["chat_id"] = chat_id
+            audience.add(user_id, chat_id)
             
             # Используем временный файл для атомарной записи
-            temp_file = USERS_DB_FILE + '.tmp'
+            temp_file = users_file + '.tmp'
             try:
                 with open(temp_file, 'w', encoding='utf-8') as f:
                     # Блокировка файла для записи (Linux/Unix)
@@ -159,7 +280,7 @@ async def save_user_id(user_id: int, chat_id: int = None):
                         os.fsync(f.fileno())
                 
                 # Атомарное переименование
-                os.replace(temp_file, USERS_DB_FILE)
+                os.replace(temp_file, users_file)
             except Exception as e:
                 print(f"Ошибка сохранения базы пользователей: {e}")
                 import traceback
@@ -176,6 +297,42 @@ async def save_user_id(user_id: int, chat_id: int = None):
         traceback.print_exc()
 
 
+def get_user_id_from_event(event):
+    """Получение user_id из события (MessageCreated или MessageCallback)"""
+    if hasattr(event, 'callback') and event.callback and hasattr(event.callback, 'user'):
+        return event.callback.user.user_id
+    if hasattr(event, 'message') and event.message and getattr(event.message, 'sender', None):
+        return event.message.sender.user_id
+    return None
+
+
+def get_user_key(event):
+    """
+    Ключ пользователя в пределах мероприятия: очереди планировщика и лимиты частоты
+    у одного и того же пользователя в ботах разных мероприятий независимы
+    """
+    user_id = get_user_id_from_event(event)
+    return None if user_id is None else (tenants.current().id, user_id)
+
+
+# Нажатия кнопок, которые только переключают экран: из нескольких ожидающих подряд выполняется последнее
+SCREEN_PAYLOADS = ("registered", "show_menu", "send_question")
+
+
+def get_screen_collapse_key(event):
+    """Ключ схлопывания для нажатий кнопок навигации (None - событие не схлопывается)"""
+    payload = getattr(event.callback, 'payload', None) or ""
+    if payload in SCREEN_PAYLOADS or payload.startswith(("track_", "ask_track:")):
+        return "screen"
+    return None
+
+
+async def notify_throttled(event):
+    """Однократное уведомление пользователя о превышении частоты запросов"""
+    chat_id = get_chat_id_from_event(event)
+    await send_message_with_buttons(chat_id, "⏳ Слишком много запросов. Подождите несколько секунд.", [])
+
+
 def get_chat_id_from_event(event):
     """
     Получение chat_id из события (MessageCreated или MessageCallback)
@@ -201,30 +358,43 @@ async def delete_message(message_id: str):
     Удаление сообщения через raw MAX API
     Правильный формат: DELETE /messages?message_id={message_id}
     """
+    return await delete_message_status(message_id) == 200
+
+
+async def delete_message_status(message_id: str):
+    """
+    Удаление сообщения. Возвращает HTTP статус ответа (404 - сообщения уже нет)
+    или None, если API недоступно или запрос не удался
+    """
     if not message_id or not http_session:
-        return False
+        return None
+    
+    # API недоступно - не ждем таймаута
+    if not api_breaker.allow():
+        return None
     
     url = f"{API_BASE_URL}/messages"
     headers = {
-        "Authorization": BOT_TOKEN,
+        "Authorization": settings.BOT_TOKEN,
         "Content-Type": "application/json"
     }
     params = {"message_id": message_id}
     
     try:
-        async with http_session.delete(url, headers=headers, params=params) as response:
-            if response.status == 200:
-                return True
-            elif response.status == 404:
-                # Сообщение уже удалено - это нормально
-                return False
+        async with http_session.delete(url, headers=headers, params=params, timeout=api_timeout) as response:
+            if response.status >= 500 or response.status == 429:
+                api_breaker.record_failure()
             else:
+                api_breaker.record_success()
+            if response.status not in (200, 404):
+                # 404 - сообщение уже удалено, это нормально
                 error_text = await response.text()
                 print(f"⚠️ Ошибка удаления сообщения {message_id}: {response.status} - {error_text[:200]}")
-                return False
+            return response.status
     except Exception as e:
+        api_breaker.record_failure()
         print(f"⚠️ Исключение при удалении сообщения {message_id}: {e}")
-        return False
+        return None
 
 
 def get_message_id_from_event(event):
@@ -248,27 +418,20 @@ def get_message_id_from_event(event):
     return message_id
 
 
-async def send_message_with_buttons(chat_id: int, text: str, buttons: list, image_url: str = None):
-    """
-    Отправка сообщения с кнопками через raw MAX API
-    Формат кнопок: массив массивов, где каждый внутренний массив - это строка кнопок
-    Пример: [[{"type": "callback", "text": "Кнопка", "payload": "test"}]]
-    image_url: опциональная ссылка на изображение для отправки
-    """
-    if not http_session:
-        return None
-        
-    url = f"{API_BASE_URL}/messages"
-    headers = {
-        "Authorization": BOT_TOKEN,
-        "Content-Type": "application/json"
-    }
-    params = {"chat_id": chat_id}
-    
+def build_message_body(text: str, buttons: list, image_url: str = None, image_token: str = None,
+                       file_token: str = None):
+    """Тело запроса POST /messages: текст, изображение или файл и кнопки"""
     attachments = []
     
     # Добавляем изображение, если указано
-    if image_url:
+    if image_token:
+        attachments.append({
+            "type": "image",
+            "payload": {
+                "token": image_token
+            }
+        })
+    elif image_url:
         attachments.append({
             "type": "image",
             "payload": {
@@ -276,6 +439,15 @@ async def send_message_with_buttons(chat_id: int, text: str, buttons: list, imag
             }
         })
     
+    # Добавляем загруженный файл, если указан
+    if file_token:
+        attachments.append({
+            "type": "file",
+            "payload": {
+                "token": file_token
+            }
+        })
+    
     # Добавляем кнопки, если указаны
     if buttons:
         attachments.append({
@@ -285,66 +457,147 @@ async def send_message_with_buttons(chat_id: int, text: str, buttons: list, imag
             }
         })
     
-    body = {
+    return {
         "text": text,
         "attachments": attachments if attachments else []
     }
+
+
+async def post_message(chat_id: int, body: dict):
+    """
+    Один запрос POST /messages через raw MAX API с учетом предохранителя
+    Возвращает (status, result): status None - сетевая ошибка или таймаут;
+    при ответе с ошибкой result - тело ошибки API (например {"code": "attachment.not.ready"}) или None
+    """
+    url = f"{API_BASE_URL}/messages"
+    headers = {
+        "Authorization": settings.BOT_TOKEN,
+        "Content-Type": "application/json"
+    }
+    params = {"chat_id": chat_id}
     
     try:
-        async with http_session.post(url, headers=headers, params=params, json=body) as response:
+        async with http_session.post(url, headers=headers, params=params, json=body, timeout=api_timeout) as response:
             if response.status == 200:
-                return await response.json()
+                api_breaker.record_success()
+                return response.status, await response.json()
+            if response.status >= 500 or response.status == 429:
+                api_breaker.record_failure()
             else:
-                error_text = await response.text()
-                print(f"Ошибка отправки сообщения с кнопками: {response.status} - {error_text[:200]}")
-                return None
+                api_breaker.record_success()
+            error_text = await response.text()
+            print(f"Ошибка отправки сообщения с кнопками: {response.status} - {error_text[:200]}")
+            try:
+                return response.status, json.loads(error_text)
+            except ValueError:
+                return response.status, None
     except Exception as e:
+        api_breaker.record_failure()
         print(f"Исключение при отправке сообщения с кнопками: {e}")
+        return None, None
+
+
+async def send_message_with_buttons(chat_id: int, text: str, buttons: list, image_url: str = None,
+                                    image_token: str = None, campaign_id: str = None):
+    """
+    Отправка сообщения с кнопками через raw MAX API
+    Формат кнопок: массив массивов, где каждый внутренний массив - это строка кнопок
+    Пример: [[{"type": "callback", "text": "Кнопка", "payload": "test"}]]
+    image_url: опциональная ссылка на изображение для отправки
+    image_token: токен ранее загруженного изображения (приоритетнее image_url)
+    campaign_id: кампания рассылки - сообщение из очереди попадет в ее индекс при отправке
+    Если API недоступно, сообщение ставится в очередь и возвращается {"queued": True}
+    """
+    if not http_session:
         return None
+    
+    # Пока API недоступно или у чата есть неотправленные сообщения - ставим в очередь,
+    # чтобы не ждать таймаута и сохранить порядок сообщений в чате
+    if outbox.has_pending(chat_id) or not api_breaker.allow():
+        outbox.put(chat_id, build_message_body(text, buttons, image_url=image_url), campaign_id)
+        return {"queued": True}
+    
+    body = build_message_body(text, buttons, image_url=image_url, image_token=image_token)
+    status, result = await post_message(chat_id, body)
+    if status == 200:
+        return result
+    
+    if status is None or status >= 500 or status == 429:
+        # Временная ошибка API - отправим позже
+        outbox.put(chat_id, build_message_body(text, buttons, image_url=image_url), campaign_id)
+        return {"queued": True}
+    
+    # Токен изображения мог устареть - сбрасываем его и повторяем отправку по URL
+    if image_token and image_url:
+        image_cache.invalidate(image_url)
+        return await send_message_with_buttons(chat_id, text, buttons, image_url=image_url, campaign_id=campaign_id)
+    return None
 
-# Данные о треках
-TRACKS_DATA = {
-    "track_gamedev": {
-        "name": "🎮 БЛОК 1: «Творцы Цифровых Вселенных»",
-        "description": "ГЕЙМДЕВ / РАЗРАБОТКА ИГР",
-        "speakers": [],
-        "schedule": [
-            {"time": "11:20-11:50", "event": "(Большой зал) Спикер: Владимир Ковтун — Лекция — «Трудное счастье: зачем нам строить игровую индустрию в каждом городе»"},
-            {"time": "11:50-12:20", "event": "(Большой зал) Спикер: Иван Робанишвили — Лекция — «Как стать разработчиком видеоигр в провинции?»"},
-            {"time": "11:50-12:20", "event": "(Малый зал) Спикер: Болотов Илья — Лекция — «Лёгкая прогулка или игра на выживание: какие навыки нужны программисту в геймдеве»"}
-        ]
-    },
-    "track_ai": {
-        "name": "🤖 БЛОК 3: «Первопроходцы цифровой трансформации»",
-        "description": "ИСКУССТВЕННЫЙ ИНТЕЛЛЕКТ",
-        "speakers": [],
-        "schedule": [
-            {"time": "12:50-13:30", "event": "(Малый зал) Спикер: Махмутдинов Ринат — Практическое занятие — «Инновационные виды спорта - двигатель цифровой трансформации общества»"},
-            {"time": "12:50-13:30", "event": "(Большой зал) Спикер: Роман Хазеев — Лекция — «Кирпичики ИИ: сервисы, которые нужны всем»"},
-            {"time": "14:30-15:00", "event": "(Малый зал) Спикер: Грудин Егор — Практическое занятие — «Спортивное программирование CTF и виды тасков»"}
-        ]
-    },
-    "track_drones": {
-        "name": "🚁 БЛОК 2: «Герои Воздушного Фронтира»",
-        "description": "БЕСПИЛОТНЫЕ ЛЕТАТЕЛЬНЫЕ АППАРАТЫ",
-        "speakers": [],
-        "schedule": [
-            {"time": "11:20-11:50", "event": "(Малый зал) Спикер: Александр Боровлев — Мастер-класс — «Какую роль играют БПЛА в пространственном моделировании»"},
-            {"time": "13:30-14:00", "event": "(Малый зал) Спикер: Денис Петров — Практическое занятие/соревнования — «FPV-дроны: от конструкции до применения»"},
-            {"time": "15:00-15:30", "event": "(Малый зал) Спикер: Александр Низовцев — Лекция — «Применение БПЛА в электросетях: дистанционный мониторинг, диагностика и повышение надёжности»"}
-        ]
-    },
-    "track_media": {
-        "name": "📡 БЛОК 4:  «Медиа будущего: ценности и смыслы»",
-        "description": "МЕДИА",
-        "speakers": [],
-        "schedule": [
-            {"time": "13:30-14:00", "event": "(Большой зал) Спикер: Неймиллер Светлана — Тренинг — «Тренды видеоконтента в 2026 году. Какой видеоконтент снимать, чтобы набирать просмотры, охваты и новых подписчиков»"},
-            {"time": "14:30-15:00", "event": "(Большой зал) Спикер: Инесса Орел — Тренинг — «Новые медиа: ценности и смыслы»"},
-            {"time": "11:00-15:00", "event": "(Подкаст-студия) Активность: Съемка видеоподкастов с IT-специалистами — Формат: Подкаст-студия"}
-        ]
-    }
-}
+
+async def send_file(chat_id: int, file_path: str, text: str, attempts: int = 5) -> bool:
+    """
+    Загрузка файла в MAX и отправка его в чат (без очереди - файл остается на диске).
+    Пока предохранитель разомкнут, API не опрашивается; повторяются только временные ошибки
+    """
+    if not http_session or not api_breaker.allow():
+        return False
+    try:
+        file_token = await upload_file(http_session, API_BASE_URL, settings.BOT_TOKEN, file_path)
+    except Exception as e:
+        api_breaker.record_failure()
+        print(f"Исключение при загрузке файла {file_path}: {e}")
+        return False
+    if not file_token:
+        return False
+    
+    body = build_message_body(text, [], file_token=file_token)
+    for attempt in range(attempts):
+        if attempt:
+            await asyncio.sleep(2 ** (attempt - 1))
+            if not api_breaker.allow():
+                return False
+        status, result = await post_message(chat_id, body)
+        if status == 200:
+            return True
+        # Повторяем, только если загруженный файл еще обрабатывается на сервере
+        # (attachment.not.ready), API перегружено (429, 5xx) или запрос не дошел
+        not_ready = isinstance(result, dict) and result.get("code") == "attachment.not.ready"
+        if not (not_ready or status is None or status == 429 or status >= 500):
+            return False
+    return False
+
+
+async def drain_outbox(interval: float = 1.0):
+    """Фоновая отправка сообщений из очереди после восстановления API (порядок внутри чата сохраняется)"""
+    while True:
+        await asyncio.sleep(interval)
+        # Сообщения отмененных и отозванных кампаний снимаются с очереди без отправки
+        # (в многопроцессном режиме каждый воркер видит отмену, перечитывая кампании)
+        for campaign_id in outbox.campaigns():
+            if campaigns.stopped(campaign_id):
+                campaigns.record_purged(campaign_id, outbox.discard(campaign_id))
+        if not len(outbox) or not http_session:
+            continue
+        for chat_id in outbox.chats():
+            item = outbox.peek(chat_id)
+            while item and api_breaker.allow():
+                message_id, body, campaign_id = item
+                if campaign_id and campaigns.stopped(campaign_id):
+                    campaigns.record_purged(campaign_id, outbox.discard(campaign_id))
+                    item = outbox.peek(chat_id)
+                    continue
+                status, result = await post_message(chat_id, body)
+                if status is None or status >= 500 or status == 429:
+                    # API снова недоступно - продолжим на следующей итерации
+                    break
+                # Отправлено или отклонено окончательно (4xx) - убираем из очереди
+                if status == 200 and result:
+                    # Сообщение кампании попадает в ее индекс для отзыва рассылки
+                    campaigns.record_message(campaign_id, (result.get("message") or {}).get("body", {}).get("mid"))
+                outbox.ack(chat_id, message_id)
+                item = outbox.peek(chat_id)
+            if api_breaker.state != "closed":
+                break
 
 
 @dp.bot_started()
@@ -353,81 +606,68 @@ async def on_bot_start(event: BotStarted):
     print("Бот готов к работе!")
 
 
+def sync_audience():
+    """В многопроцессном режиме дополняет индекс аудитории пользователями других процессов"""
+    if shared_store:
+        audience.load(load_users_db())
+
+
+async def parse_segments(event: MessageCreated, args: list):
+    """
+    Разбор сегментов рассылки (track_... и no_answer) в списки include/exclude для индекса аудитории.
+    При неизвестном сегменте отвечает администратору и возвращает (None, None).
+    """
+    include = [arg for arg in args if arg != SEGMENT_NO_ANSWER]
+    exclude = [SEGMENT_ANSWERED] if SEGMENT_NO_ANSWER in args else []
+    tracks = content.current.tracks
+    unknown = [arg for arg in include if arg not in tracks]
+    if unknown:
+        await event.message.answer(
+            f"Неизвестные сегменты: {', '.join(unknown)}\n"
+            f"Доступные: {', '.join(tracks.keys())}, {SEGMENT_NO_ANSWER}"
+        )
+        return None, None
+    return include, exclude
+
+
 @dp.message_created(Command('send_feedback'))
 async def cmd_send_feedback(event: MessageCreated):
     """Команда для рассылки запросов на обратную связь (только для администратора)"""
     user_id = event.message.sender.user_id
     
     # Проверка на администратора
-    from config import ADMIN_ID
+    ADMIN_ID = settings.ADMIN_ID
     if ADMIN_ID and user_id != ADMIN_ID:
         await event.message.answer("У вас нет прав для выполнения этой команды.")
         return
     
-    chat_id = get_chat_id_from_event(event)
-    await event.message.answer("Начинаю рассылку запросов на обратную связь...")
+    # Сегменты рассылки: /send_feedback [track_...] [no_answer]
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    include, exclude = await parse_segments(event, args)
+    if include is None:
+        return
     
-    # Загружаем список пользователей
-    db = load_users_db()
-    users = db.get("users", {})
-    user_ids = db.get("user_ids", [])
-    
-    # Формируем список пользователей для рассылки
-    user_list = []
-    
-    # Используем новую структуру с chat_id
-    if users:
-        for user_id_str, user_data in users.items():
-            user_id_val = user_data.get("user_id") or int(user_id_str)
-            chat_id_val = user_data.get("chat_id")
-            if chat_id_val:
-                user_list.append({"user_id": user_id_val, "chat_id": chat_id_val})
-    
-    # Добавляем пользователей из старой структуры
-    if user_ids:
-        existing_user_ids = {u["user_id"] for u in user_list}
-        for user_id_val in user_ids:
-            if user_id_val not in existing_user_ids:
-                user_list.append({"user_id": user_id_val, "chat_id": None})
-    
-    if not user_list:
+    sync_audience()
+    if not len(audience):
         await event.message.answer("⚠️ Список пользователей пуст. Попросите пользователей нажать /start.")
         return
     
-    success_count = 0
-    error_count = 0
-    skipped_count = 0
-    
-    # Загружаем состояния перед рассылкой
-    load_user_states()
-    
-    for i, user_data in enumerate(user_list, 1):
-        user_id_val = user_data["user_id"]
-        chat_id_val = user_data.get("chat_id")
-        
-        if not chat_id_val:
-            skipped_count += 1
-            continue
-        
-        try:
-            await send_feedback_request(user_id_val, chat_id_val)
-            # Состояние уже сохранено в send_feedback_request
-            success_count += 1
-            # Задержка между отправками
-            if i < len(user_list):
-                await asyncio.sleep(0.5)
-        except Exception as e:
-            error_count += 1
-            print(f"Ошибка отправки пользователю {user_id_val}: {e}")
-    
-    # Отправляем отчет
+    # Рассылка идет кампанией со стартом сейчас и прежним темпом (сообщение в 0.5 с): у нее есть id,
+    # по которому сообщения опроса попадают в индекс для /recall, а после перезапуска
+    # она продолжается без повторной отправки. Отчет приходит по завершении кампании
+    recipients = audience.count_recipients(include, exclude)
+    campaign = campaigns.schedule(datetime.now().timestamp(), recipients * FEEDBACK_SEND_INTERVAL, include, exclude,
+                                  get_chat_id_from_event(event),
+                                  source_mid=event.message.body.mid if event.message.body else None)
+    skipped_count = audience.count_without_chat_id()
     report = (
-        f"✅ Рассылка завершена!\n\n"
-        f"Успешно: {success_count}\n"
-        f"Ошибок: {error_count}\n"
-        f"Пропущено (нет chat_id): {skipped_count}\n"
-        f"Всего: {len(user_list)}"
+        f"Начинаю рассылку запросов на обратную связь...\n\n"
+        f"Кампания: {campaign['id']}\n"
+        f"Получателей: {recipients}\n"
+        f"Пропущено (нет chat_id): {skipped_count}"
     )
+    if args:
+        report += f"\nСегменты: {' '.join(args)}"
     
     if skipped_count > 0:
         report += "\n\n💡 Пользователи без chat_id должны нажать /start в боте."
@@ -435,170 +675,586 @@ async def cmd_send_feedback(event: MessageCreated):
     await event.message.answer(report)
 
 
-@dp.message_created(Command('start'))
-async def cmd_start(event: MessageCreated):
-    """Приветственное сообщение"""
-    try:
-        user_id = event.message.sender.user_id
-        chat_id = get_chat_id_from_event(event)
-        print(f"Команда /start получена от пользователя {user_id}, chat_id: {chat_id}")
-        
-        # Сохраняем ID пользователя и chat_id для рассылки
-        try:
-            await save_user_id(user_id, chat_id)
-        except Exception as e:
-            print(f"Ошибка сохранения пользователя {user_id}: {e}")
-            import traceback
-            traceback.print_exc()
-            # Продолжаем работу даже если сохранение не удалось
-        
-        welcome_text = (
-            "Рады приветствовать вас на форуме «Цифровая республика. ИТ-герои»\n\n"
-            "Это будет точка сборки IT-сообщества, где можно пообщаться с будущими работодателями, "
-            "вдохновиться историями успеха и определиться со своей траекторией в IT.\n\n"
-            "Когда - 14 ноября 2025 г.\n"
-            "Где - Ресурсный молодежный центр\n"
-            "г. Сыктывкар, ул. Первомайская, д. 72, 4 этаж"
-        )
-        
-        # Отправляем сообщение с кнопками (структура сохранена)
-        buttons = [
-            [
-                {
-                    "type": "link",
-                    "text": "Зарегистрироваться",
-                    "url": REGISTRATION_URL
-                }
-            ],
-            [
-                {
-                    "type": "link",
-                    "text": "📄 Программа форума",
-                    "url": "https://olddigital.rkomi.ru/uploads/documents/programa_it_foruma_na_sayt_2025-10-23_16-15-15.pdf"
-                }
-            ],
-            [
-                {
-                    "type": "link",
-                    "text": "📝 Обратная связь",
-                    "url": "https://forms.yandex.ru/u/690b936a84227c94f1ef077f"
-                }
-            ],
-            [
-                {
-                    "type": "callback",
-                    "text": "Я зарегистрировался",
-                    "payload": "registered"
-                }
-            ]
-        ]
-        
-        # Проверяем наличие http_session перед отправкой
-        if not http_session:
-            print("⚠️ Ошибка: http_session не инициализирован! Бот еще не полностью запущен.")
-            await event.message.answer(welcome_text)
-            return
-        
-        result = await send_message_with_buttons(chat_id, welcome_text, buttons)
-        if not result:
-            # Fallback: используем стандартный метод отправки
-            await event.message.answer(welcome_text)
-            
-    except Exception as e:
-        print(f"Критическая ошибка в cmd_start: {e}")
-        import traceback
-        traceback.print_exc()
-        # Пытаемся отправить хотя бы простое сообщение
-        try:
-            await event.message.answer("Произошла ошибка при обработке команды. Попробуйте позже.")
-        except:
-            pass
-
-
-
-
-@dp.message_callback()
-async def handle_all_callbacks(event: MessageCallback):
-    """Универсальный обработчик всех callback - маршрутизация по payload"""
-    payload = getattr(event.callback, 'payload', None)
-    if not payload:
-        return
+@dp.message_created(Command('schedule_feedback'))
+async def cmd_schedule_feedback(event: MessageCreated):
+    """
+    Команда для планирования рассылки опроса (только для администратора):
+    /schedule_feedback <ДД.ММ.ГГГГ ЧЧ:ММ | now> <окно в минутах> [сегменты]
+    """
+    user_id = event.message.sender.user_id
     
-    # Защита от повторной обработки
-    callback_id = getattr(event.callback, 'callback_id', None)
-    if callback_id and callback_id in processed_callbacks:
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
         return
     
-    if callback_id:
-        processed_callbacks.add(callback_id)
-        # Очищаем старые callback_id (оставляем последние 1000)
-        if len(processed_callbacks) > 1000:
-            processed_callbacks.clear()
+    usage = (
+        "Использование:\n"
+        "/schedule_feedback 15.11.2025 12:00 120 [сегменты]\n"
+        "/schedule_feedback now 60 [сегменты]\n\n"
+        "Окно указывается в минутах - рассылка равномерно распределяется на это время."
+    )
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    try:
+        if args and args[0] == "now":
+            start_at = datetime.now().timestamp()
+            args = args[1:]
+        else:
+            start_at = datetime.strptime(" ".join(args[:2]), "%d.%m.%Y %H:%M").timestamp()
+            args = args[2:]
+        window_minutes = float(args[0])
+        args = args[1:]
+    except (ValueError, IndexError):
+        await event.message.answer(usage)
+        return
     
-    print(f"[DEBUG] handle_all_callbacks: payload='{payload}'")
+    include, exclude = await parse_segments(event, args)
+    if include is None:
+        return
     
-    # Маршрутизация по payload
-    if payload == "registered":
-        await handle_registered(event)
-    elif payload.startswith("track_"):
-        await handle_track_info(event, payload)
-    elif payload == "show_menu":
-        await handle_show_menu(event)
-    elif payload == "send_question":
-        await handle_send_question(event)
-    elif payload == "cancel_question":
-        await handle_cancel_question(event)
-    elif payload == "cancel_feedback":
-        await handle_cancel_feedback(event)
+    sync_audience()
+    campaign = campaigns.schedule(start_at, window_minutes * 60, include, exclude, get_chat_id_from_event(event),
+                                  source_mid=event.message.body.mid if event.message.body else None)
+    recipients = audience.count_recipients(include, exclude)
+    await event.message.answer(
+        f"🗓 Кампания {campaign['id']} запланирована\n\n"
+        f"Старт: {datetime.fromtimestamp(start_at).strftime('%d.%m.%Y %H:%M')}\n"
+        f"Окно: {window_minutes:g} мин\n"
+        f"Получателей сейчас: {recipients}"
+        + (f"\nСегменты: {' '.join(include + ([SEGMENT_NO_ANSWER] if exclude else []))}" if include or exclude else "")
+    )
 
 
-async def handle_registered(event: MessageCallback):
-    """После нажатия на кнопку - показываем информацию о форуме"""
-    print(f"[DEBUG] handle_registered: обработка")
+@dp.message_created(Command('campaigns'))
+async def cmd_campaigns(event: MessageCreated):
+    """Команда для просмотра запланированных рассылок (только для администратора)"""
+    user_id = event.message.sender.user_id
     
-    # Удаляем старое сообщение
-    message_id = get_message_id_from_event(event)
-    if message_id:
-        await delete_message(message_id)
-    forum_info_text = (
-        "Форум «Цифровая республика. ИТ-герои».\n\n"
-        "Это будет точка сборки IT-сообщества, где можно пообщаться с будущими работодателями, "
-        "вдохновиться историями успеха и определиться со своей траекторией в IT.\n\n"
-        "4 главных IT-трека форума:\n"
-        "GameDev: Раскроем тайны геймдизайна от создателей легендарных «Танков Онлайн» и хитового проекта «Ciliz». "
-        "Узнаем, как строят карьеру в игрострое прямо в нашем регионе.\n\n"
-        "Искусственный интеллект: Почувствуем мощь AI и узнаем, как нейросети меняют бизнес и нашу жизнь уже сегодня.\n\n"
-        "Беспилотники: Не просто дроны, а высокие технологии. Испытаем себя на симуляторе полета и узнаем, "
-        "как БПЛА применяют в реальных отраслях.\n\n"
-        "Медиа будущего: Разберемся, какие ценности и смыслы правят миром новых медиа и как в этом преуспеть.\n\n"
-        "Кроме крутых спикеров участников ждут\n"
-        "HR-зона: Прямые разговоры с топовыми работодателями.\n"
-        "Лайфхак-сессии: Мастер-классы и тренинги, где научат не теории, а тому, что реально пригодится в работе.\n"
-        "Нетворкинг без границ: Находить команду и единомышленников в неформальной обстановке.\n"
-        "Техно-арт зона: Технологии на ощупь: фотозоны, демо-стенды, симуляторы.\n"
-        "Кружка кофе."
-    )
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
     
-    # Отправляем сообщение с кнопками
-    buttons = [
-        [
-            {"type": "callback", "text": "🎮 GameDev", "payload": "track_gamedev"},
-            {"type": "callback", "text": "🤖 ИИ", "payload": "track_ai"}
-        ],
-        [
-            {"type": "callback", "text": "🚁 Беспилотники", "payload": "track_drones"},
-            {"type": "callback", "text": "📡 Медиа Будущего", "payload": "track_media"}
-        ],
-        [
-            {"type": "callback", "text": "❓ Отправить вопрос", "payload": "send_question"}
-        ]
-    ]
+    if not campaigns.campaigns:
+        await event.message.answer("Запланированных рассылок нет.")
+        return
     
-    chat_id = get_chat_id_from_event(event)
-    await send_message_with_buttons(chat_id, forum_info_text, buttons)
+    lines = []
+    for campaign in list(campaigns.campaigns.values())[-10:]:
+        start = datetime.fromtimestamp(campaign["start_at"]).strftime('%d.%m.%Y %H:%M')
+        lines.append(
+            f"{campaign['id']}: {campaign['status']}, старт {start}, окно {campaign['window'] / 60:g} мин, "
+            f"отправлено {campaign['sent']}, ошибок {campaign['errors']}"
+        )
+        if campaign.get("recall"):
+            recall = campaign["recall"]
+            lines[-1] += (
+                f", отзыв {recall['status']}: удалено {recall['deleted'] + recall['missing']} из {recall['total']}"
+            )
+    await event.message.answer(
+        "🗓 Рассылки:\n\n" + "\n".join(lines)
+        + "\n\nОтмена: /cancel_campaign <id>\nОтзыв отправленных сообщений: /recall <id>"
+    )
 
 
-async def handle_program_show(event: MessageCallback):
+@dp.message_created(Command('cancel_campaign'))
+async def cmd_cancel_campaign(event: MessageCreated):
+    """Команда для отмены запланированной рассылки (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    if not args:
+        await event.message.answer("Использование: /cancel_campaign <id>")
+        return
+    if campaigns.cancel(args[0]):
+        await event.message.answer(f"Кампания {args[0]} отменена.")
+    else:
+        await event.message.answer(f"Кампания {args[0]} не найдена или уже завершена.")
+
+
+@dp.message_created(Command('recall'))
+async def cmd_recall(event: MessageCreated):
+    """
+    Команда для отзыва рассылки (только для администратора): кампания отменяется,
+    все отправленные по ней сообщения опроса удаляются, незаконченные опросы сбрасываются
+    """
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    if not args:
+        await event.message.answer("Использование: /recall <id кампании>")
+        return
+    campaign = campaigns.recall(args[0], get_chat_id_from_event(event), settings.RECALL_RATE,
+                                settings.RECALL_CONCURRENCY)
+    if campaign is None:
+        await event.message.answer(f"Кампания {args[0]} не найдена.")
+        return
+    
+    # Пользователи, не закончившие опрос этой кампании, больше не считаются отвечающими
+    reset = 0
+    for key in list(user_states):
+        feedback_data = user_states.get(key) if isinstance(key, str) and key.startswith("feedback_") else None
+        if not isinstance(feedback_data, dict) or feedback_data.get("campaign") != campaign["id"]:
+            continue
+        survey_user_id = int(key[len("feedback_"):])
+        for state_key in (survey_user_id, key, f"question_msg_id_{survey_user_id}"):
+            if state_key in user_states:
+                del user_states[state_key]
+        reminders.cancel(survey_user_id)
+        reset += 1
+    if reset:
+        await save_user_states()
+    
+    # Неотправленные сообщения кампании из очереди этого процесса снимаются сразу,
+    # у остальных воркеров - при следующем проходе drain_outbox
+    purged = outbox.discard(campaign["id"])
+    campaigns.record_purged(campaign["id"], purged)
+    
+    recall = campaign["recall"]
+    await event.message.answer(
+        f"🗑 Отзыв кампании {campaign['id']}: сообщений в индексе {recall['total']}, "
+        f"снято с очереди исходящих {purged}, "
+        f"удаление до {settings.RECALL_RATE:g} в секунду. Незаконченных опросов сброшено: {reset}.\n"
+        f"Прогресс будет приходить в этот чат."
+    )
+
+
+@dp.message_created(Command('metrics'))
+async def cmd_metrics(event: MessageCreated):
+    """Команда для просмотра метрик бота (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    await event.message.answer(f"📊 Метрики:\n\n{metrics.format()}")
+
+
+@dp.message_created(Command('stats'))
+async def cmd_stats(event: MessageCreated):
+    """Команда для просмотра статистики опроса (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    # В многопроцессном режиме агрегаты читаются из общего хранилища (их обновляет каждый процесс)
+    await event.message.answer(f"📈 Статистика опроса:\n\n{feedback_stats.format(track_titles=track_titles())}")
+
+
+def track_titles() -> dict:
+    """Названия треков для отчетов: ключ трека (значение столбца "Трек") -> текст кнопки трека"""
+    titles = {key: track.get("button") or key for key, track in content.current.tracks.items()}
+    titles[OTHER_TRACK] = "Другое"
+    return titles
+
+
+@dp.message_created(Command('reload_content'))
+async def cmd_reload_content(event: MessageCreated):
+    """Команда для перезагрузки контента форума из файла (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    ok, message = content.reload()
+    if ok:
+        await event.message.answer(f"✅ Контент обновлен ({message}).")
+    else:
+        await event.message.answer(f"❌ Контент не обновлен, используется прежняя версия.\nОшибка: {message}")
+
+
+@dp.message_created(Command('migrate_schema'))
+async def cmd_migrate_schema(event: MessageCreated):
+    """Команда для миграции схемы листа 'Отзывы' (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    try:
+        async with excel_manager._excel_lock:
+            old_version, new_version = excel_manager.migrate_feedback_schema()
+    except Exception as e:
+        print(f"Ошибка миграции схемы Excel: {e}")
+        await event.message.answer(f"❌ Ошибка миграции схемы: {e}")
+        return
+    
+    if old_version == new_version:
+        await event.message.answer(f"Схема листа 'Отзывы' уже актуальна (версия {new_version}).")
+    else:
+        await event.message.answer(f"✅ Схема листа 'Отзывы' обновлена: версия {old_version} → {new_version}.")
+
+
+@dp.message_created(Command('normalize_tracks'))
+async def cmd_normalize_tracks(event: MessageCreated):
+    """Команда для пересчета столбца 'Трек' по всем отзывам (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    await event.message.answer(f"Пересчитываю треки в {len(excel_manager.partitions)} секциях Excel...")
+    # В поток передаются сами объекты мероприятия (contextvar в поток не переходит)
+    tenant = tenants.current()
+    try:
+        changed = await tenant.excel_manager.normalize_feedback_tracks_async()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, lambda: tenant.feedback_stats.rebuild(tenant.excel_manager.iter_feedback_rows()))
+    except Exception as e:
+        print(f"Ошибка пересчета треков: {e}")
+        await event.message.answer(f"❌ Ошибка пересчета треков: {e}")
+        return
+    
+    titles = track_titles()
+    lines = [f"• {titles.get(track, track)} — {count}" for track, count in feedback_stats.tracks.most_common()]
+    await event.message.answer(
+        f"✅ Треки пересчитаны, изменено строк: {changed}\n\n" + ("\n".join(lines) or "Отзывов пока нет.")
+    )
+
+
+@dp.message_created(Command('merge_excel'))
+async def cmd_merge_excel(event: MessageCreated):
+    """Команда для сборки всех секций Excel в один файл (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    export_dir = tenant_file(settings.EXPORT_DIR)
+    os.makedirs(export_dir, exist_ok=True)
+    target_path = os.path.join(export_dir, f"forum_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+    await event.message.answer(f"Собираю {len(excel_manager.partitions)} секций Excel в один файл...")
+    try:
+        # Чтение секций и запись выполняются в отдельном потоке, чтобы не блокировать бота
+        loop = asyncio.get_running_loop()
+        counts = await loop.run_in_executor(None, excel_manager.export_merged, target_path)
+    except Exception as e:
+        print(f"Ошибка сборки секций Excel: {e}")
+        await event.message.answer(f"❌ Ошибка сборки файла: {e}")
+        return
+    
+    await event.message.answer(
+        f"✅ Файл собран: {target_path}\n\n"
+        + "\n".join(f"{title}: {count}" for title, count in counts.items())
+    )
+
+
+@dp.message_created(Command('profile_start'))
+async def cmd_profile_start(event: MessageCreated):
+    """Команда для запуска профилирования на N секунд (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    try:
+        seconds = float(args[0]) if args else 30
+    except ValueError:
+        await event.message.answer("Использование: /profile_start [секунды]")
+        return
+    
+    try:
+        seconds = profiler.start(seconds, get_chat_id_from_event(event))
+    except RuntimeError as e:
+        await event.message.answer(f"❌ Не удалось запустить: {e}. Остановить: /profile_stop")
+        return
+    await event.message.answer(
+        f"⏱ Профилирование запущено на {seconds:.0f} с. Отчет придет автоматически, остановить раньше: /profile_stop"
+    )
+
+
+@dp.message_created(Command('profile_stop'))
+async def cmd_profile_stop(event: MessageCreated):
+    """Команда для досрочной остановки профилирования (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    try:
+        report = profiler.stop()
+    except RuntimeError as e:
+        await event.message.answer(f"❌ {e}.")
+        return
+    await event.message.answer(report)
+
+
+@dp.message_created(Command('mem_snapshot'))
+async def cmd_mem_snapshot(event: MessageCreated):
+    """Команда для снимка памяти и сравнения с предыдущим (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    if args and args[0] == "stop":
+        await event.message.answer(profiler.memory_stop())
+        return
+    await event.message.answer(profiler.memory_snapshot())
+
+
+@dp.message_created(Command('questions'))
+async def cmd_questions(event: MessageCreated):
+    """Команда для просмотра последних вопросов к докладу (для администратора и модераторов)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора или модератора
+    ADMIN_ID = settings.ADMIN_ID
+    if (ADMIN_ID or settings.MODERATOR_IDS) and user_id != ADMIN_ID and user_id not in settings.MODERATOR_IDS:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    talks = content.current.talks
+    # В многопроцессном режиме индекс вопросов общий для всех процессов
+    counts = questions.talk_counts()
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    if not args:
+        lines = ["Вопросы к докладам (/questions <id или фамилия> [количество]):", ""]
+        for talk in talks.values():
+            lines.append(f"{talk.id} — {talk.time} {talk.speaker}: {counts[talk.id]}")
+        await event.message.answer("\n".join(lines))
+        return
+    
+    query = args[0].lower()
+    limit = int(args[1]) if len(args) > 1 and args[1].isdigit() else 10
+    found = [talk for talk in talks.values() if talk.id == query] or [
+        talk for talk in talks.values() if query in talk.speaker.lower()
+    ]
+    if not found:
+        await event.message.answer(f"Доклад '{args[0]}' не найден. Список докладов: /questions")
+        return
+    if len(found) > 1:
+        await event.message.answer(
+            "Найдено несколько докладов, уточните id:\n"
+            + "\n".join(f"{talk.id} — {talk.time} {talk.speaker}" for talk in found)
+        )
+        return
+    
+    talk = found[0]
+    latest = questions.latest(talk.id, limit)
+    lines = [f"❓ {talk.speaker} ({talk.time}), всего вопросов: {counts[talk.id]}", ""]
+    if not latest:
+        lines.append("Вопросов пока нет.")
+    for question in latest:
+        lines.append(f"{question.date[11:16]} {question.user_name}: {question.text}")
+        lines.append("")
+    # Ограничение длины сообщения MAX
+    await event.message.answer("\n".join(lines)[:3900])
+
+
+@dp.message_created(Command('export'))
+async def cmd_export(event: MessageCreated):
+    """Команда для выгрузки данных в CSV или XLSX с отправкой файла в чат (только для администратора)"""
+    user_id = event.message.sender.user_id
+    
+    # Проверка на администратора
+    ADMIN_ID = settings.ADMIN_ID
+    if ADMIN_ID and user_id != ADMIN_ID:
+        await event.message.answer("У вас нет прав для выполнения этой команды.")
+        return
+    
+    args = (event.message.body.text or "").split()[1:] if event.message.body else []
+    export_format = args[0].lower() if args else "xlsx"
+    sheets = [EXPORT_SHEETS[arg.lower()] for arg in args[1:] if arg.lower() in EXPORT_SHEETS]
+    if export_format not in ("xlsx", "csv") or len(sheets) != len(args[1:]):
+        await event.message.answer(f"Использование: /export [xlsx|csv] [{'|'.join(EXPORT_SHEETS)}]")
+        return
+    sheets = sheets or list(EXPORT_SHEETS.values())
+    
+    # Вопросы из буфера попадают в выгрузку
+    await questions.flush()
+    
+    export_dir = tenant_file(settings.EXPORT_DIR)
+    os.makedirs(export_dir, exist_ok=True)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    sheet_names = {title: name for name, title in EXPORT_SHEETS.items()}
+    await event.message.answer("Готовлю выгрузку...")
+    try:
+        # Чтение секций и запись выполняются в отдельном потоке, чтобы не блокировать бота
+        loop = asyncio.get_running_loop()
+        files = []
+        if export_format == "xlsx":
+            target_path = os.path.join(export_dir, f"forum_data_{timestamp}.xlsx")
+            counts = await loop.run_in_executor(None, excel_manager.export_merged, target_path, sheets)
+            files.append((target_path, ", ".join(f"{title}: {count}" for title, count in counts.items())))
+        else:
+            for title in sheets:
+                target_path = os.path.join(export_dir, f"forum_{sheet_names[title]}_{timestamp}.csv")
+                # В поток передается сам объект мероприятия (contextvar в поток не переходит)
+                count = await loop.run_in_executor(
+                    None, export_csv, tenants.current().excel_manager, title, target_path
+                )
+                files.append((target_path, f"{title}: {count}"))
+    except Exception as e:
+        print(f"Ошибка выгрузки данных: {e}")
+        await event.message.answer(f"❌ Ошибка выгрузки: {e}")
+        return
+    
+    chat_id = get_chat_id_from_event(event)
+    for file_path, summary in files:
+        if not await send_file(chat_id, file_path, f"📦 {summary}"):
+            await event.message.answer(f"⚠️ Не удалось отправить файл в чат, он сохранен на сервере: {file_path}")
+
+
+@dp.message_created(Command('start'))
+@catchup.filtered(drop_stale=False)
+@message_flood_control.limited(get_user_key, notify_throttled)
+@update_scheduler.scheduled(get_user_key, lambda event: "start")
+@tenants.bound
+async def cmd_start(event: MessageCreated):
+    """Приветственное сообщение"""
+    try:
+        user_id = event.message.sender.user_id
+        chat_id = get_chat_id_from_event(event)
+        print(f"Команда /start получена от пользователя {user_id}, chat_id: {chat_id}")
+        
+        # Сохраняем ID пользователя и chat_id для рассылки
+        try:
+            await save_user_id(user_id, chat_id)
+        except Exception as e:
+            print(f"Ошибка сохранения пользователя {user_id}: {e}")
+            import traceback
+            traceback.print_exc()
+            # Продолжаем работу даже если сохранение не удалось
+        
+        # Отправляем сообщение с кнопками (экран собран заранее из файла контента)
+        welcome_text, buttons = content.current.screen("welcome")
+        
+        # Проверяем наличие http_session перед отправкой
+        if not http_session:
+            print("⚠️ Ошибка: http_session не инициализирован! Бот еще не полностью запущен.")
+            await event.message.answer(welcome_text)
+            return
+        
+        result = await send_message_with_buttons(chat_id, welcome_text, buttons)
+        if not result:
+            # Fallback: используем стандартный метод отправки
+            await event.message.answer(welcome_text)
+            
+    except Exception as e:
+        print(f"Критическая ошибка в cmd_start: {e}")
+        import traceback
+        traceback.print_exc()
+        # Пытаемся отправить хотя бы простое сообщение
+        try:
+            await event.message.answer("Произошла ошибка при обработке команды. Попробуйте позже.")
+        except:
+            pass
+
+
+
+
+@dp.message_callback()
+@catchup.filtered(drop_stale=True)
+@callback_flood_control.limited(get_user_key, notify_throttled)
+@update_scheduler.scheduled(get_user_key, get_screen_collapse_key)
+@tenants.bound
+async def handle_all_callbacks(event: MessageCallback):
+    """Универсальный обработчик всех callback - маршрутизация по payload"""
+    payload = getattr(event.callback, 'payload', None)
+    if not payload:
+        return
+    
+    # Защита от повторной обработки
+    callback_id = getattr(event.callback, 'callback_id', None)
+    if callback_id and callback_id in processed_callbacks:
+        return
+    
+    if callback_id:
+        # Хранятся последние 1000 callback_id, более старые вытесняются
+        processed_callbacks.add(callback_id)
+    
+    print(f"[DEBUG] handle_all_callbacks: payload='{payload}'")
+    
+    # Маршрутизация по payload
+    if payload == "registered":
+        await handle_registered(event)
+    elif payload.startswith("track_"):
+        await handle_track_info(event, payload)
+    elif payload == "show_menu":
+        await handle_show_menu(event)
+    elif payload == "send_question":
+        await handle_send_question(event)
+    elif payload.startswith("ask_track:"):
+        await handle_ask_track(event, payload.split(":", 1)[1])
+    elif payload.startswith("ask_talk:"):
+        await handle_ask_talk(event, payload.split(":", 1)[1])
+    elif payload == "cancel_question":
+        await handle_cancel_question(event)
+    elif payload == "cancel_feedback":
+        await handle_cancel_feedback(event)
+
+
+async def show_screen(event: MessageCallback, text: str, buttons: list, image_url: str = None,
+                      image_token: str = None):
+    """
+    Смена экрана по нажатию кнопки навигации: сообщение с нажатой кнопкой удаляется,
+    новый экран отправляется, только если пользователь не успел нажать следующую
+    кнопку навигации - иначе экран сразу заменил бы следующий
+    """
+    message_id = get_message_id_from_event(event)
+    if message_id:
+        await delete_message(message_id)
+    if update_scheduler.superseded():
+        metrics.inc("screens_superseded")
+        return None
+    chat_id = get_chat_id_from_event(event)
+    return await send_message_with_buttons(chat_id, text, buttons, image_url=image_url, image_token=image_token)
+
+
+async def handle_registered(event: MessageCallback):
+    """После нажатия на кнопку - показываем информацию о форуме"""
+    print(f"[DEBUG] handle_registered: обработка")
+    
+    forum_info_text, buttons = content.current.screen("forum_info")
+    await show_screen(event, forum_info_text, buttons)
+
+
+async def handle_program_show(event: MessageCallback):
     return
     block1 = (
         "БЛОК 1: «Творцы Цифровых Вселенных»\n\n"
@@ -669,49 +1325,34 @@ async def handle_track_info(event: MessageCallback, track_key: str):
     """Показ информации о треке"""
     print(f"[DEBUG] handle_track_info: обработка трека '{track_key}'")
     
-    # Удаляем старое сообщение
-    message_id = get_message_id_from_event(event)
-    if message_id:
-        await delete_message(message_id)
-    
-    track_data = TRACKS_DATA.get(track_key)
+    snapshot = content.current
+    screen = snapshot.screen(f"track:{track_key}")
     
-    if not track_data:
-        print(f"  ⚠️ Информация о треке '{track_key}' не найдена в TRACKS_DATA")
-        print(f"  Доступные ключи: {list(TRACKS_DATA.keys())}")
+    if not screen:
+        # Удаляем старое сообщение
+        message_id = get_message_id_from_event(event)
+        if message_id:
+            await delete_message(message_id)
+        print(f"  ⚠️ Информация о треке '{track_key}' не найдена в контенте")
+        print(f"  Доступные ключи: {list(snapshot.tracks.keys())}")
         return
     
-    # Формируем текст с информацией о треке
-    text = f"{track_data['name']}\n\n{track_data['description']}\n\n"
-    
-    # Добавляем спикеров
-    if track_data['speakers']:
-        text += "Спикеры:\n"
-        for speaker in track_data['speakers']:
-            text += f"• {speaker['name']} ({speaker['time']})\n"
-            if speaker.get('bio'):
-                text += f"  {speaker['bio']}\n"
-        text += "\n"
-    
-    # Добавляем расписание
-    if track_data['schedule']:
-        text += "Расписание:\n"
-        for item in track_data['schedule']:
-            text += f"• {item['time']} - {item['event']}\n"
-    
-    # Отправляем сообщение с кнопками и изображением (если есть)
-    buttons = [
-        [
-            {"type": "callback", "text": "◀️ Назад к меню", "payload": "show_menu"},
-            {"type": "callback", "text": "❓ Задать вопрос спикеру", "payload": "send_question"}
-        ]
-    ]
+    # Текст и кнопки трека собраны заранее из файла контента
+    text, buttons = screen
     
-    # Получаем URL изображения для трека
-    image_url = TRACK_IMAGES.get(track_key, None)
+    # Запоминаем, что пользователь открыл трек (сегмент для рассылок)
+    audience.mark(event.callback.user.user_id, track_key)
     
-    chat_id = get_chat_id_from_event(event)
-    await send_message_with_buttons(chat_id, text, buttons, image_url=image_url)
+    # Получаем URL изображения для трека и токен загруженной копии (если уже есть)
+    image_url = settings.TRACK_IMAGES.get(track_key, None)
+    image_token = None
+    if image_url:
+        image_token = image_cache.get(image_url)
+        if not image_token:
+            # Загружаем в фоне, пока отправляем по URL
+            image_cache.schedule_upload(http_session, image_url)
+    
+    await show_screen(event, text, buttons, image_url=image_url, image_token=image_token)
     # В MAX API нет отдельного эндпоинта для ответа на callback,
     # поэтому не вызываем event.answer() чтобы избежать ошибок
 
@@ -720,46 +1361,18 @@ async def handle_show_menu(event: MessageCallback):
     """Возврат к главному меню"""
     print(f"[DEBUG] handle_show_menu: обработка")
     
-    # Удаляем старое сообщение
-    message_id = get_message_id_from_event(event)
-    if message_id:
-        await delete_message(message_id)
-    forum_info_text = (
-        "Форум «Цифровая республика. ИТ-герои».\n\n"
-        "Выберите интересующий трек:"
-    )
-    
-    # Отправляем сообщение с кнопками
-    buttons = [
-        [
-            {"type": "callback", "text": "🎮 GameDev", "payload": "track_gamedev"},
-            {"type": "callback", "text": "🤖 ИИ", "payload": "track_ai"}
-        ],
-        [
-            {"type": "callback", "text": "🚁 Беспилотники", "payload": "track_drones"},
-            {"type": "callback", "text": "📡 Медиа Будущего", "payload": "track_media"}
-        ],
-        [
-            {"type": "callback", "text": "❓ Отправить вопрос", "payload": "send_question"}
-        ]
-    ]
-    
-    chat_id = get_chat_id_from_event(event)
-    await send_message_with_buttons(chat_id, forum_info_text, buttons)
+    forum_info_text, buttons = content.current.screen("menu")
+    await show_screen(event, forum_info_text, buttons)
 
 
 async def handle_send_question(event: MessageCallback):
-    """Обработчик отправки вопроса - отправляем ссылку на яндекс форму"""
+    """Обработчик отправки вопроса - выбор трека и спикера (без спикеров в контенте - ссылка на форму)"""
     print(f"[DEBUG] handle_send_question: обработка")
     
-    # Удаляем старое сообщение
-    message_id = get_message_id_from_event(event)
-    if message_id:
-        await delete_message(message_id)
-    
-    chat_id = get_chat_id_from_event(event)
-    
-    if not QUESTION_FORM_URL:
+    snapshot = content.current
+    if snapshot.talks:
+        text, buttons = snapshot.screen("ask")
+    elif not settings.QUESTION_FORM_URL:
         text = (
             "Для отправки вопроса заполните форму по ссылке.\n"
             "⚠️ Ссылка на форму не настроена. Обратитесь к администратору."
@@ -781,7 +1394,7 @@ async def handle_send_question(event: MessageCallback):
                 {
                     "type": "link",
                     "text": "Открыть форму для вопроса",
-                    "url": QUESTION_FORM_URL
+                    "url": settings.QUESTION_FORM_URL
                 }
             ],
             [
@@ -789,6 +1402,48 @@ async def handle_send_question(event: MessageCallback):
             ]
         ]
     
+    await show_screen(event, text, buttons)
+
+
+async def handle_ask_track(event: MessageCallback, track_key: str):
+    """Выбор спикера трека для вопроса"""
+    print(f"[DEBUG] handle_ask_track: обработка трека '{track_key}'")
+    
+    screen = content.current.screen(f"ask:{track_key}") or content.current.screen("ask")
+    await show_screen(event, screen.text, screen.buttons)
+
+
+async def handle_ask_talk(event: MessageCallback, talk_id: str):
+    """Спикер выбран - ждем текст вопроса"""
+    print(f"[DEBUG] handle_ask_talk: обработка доклада '{talk_id}'")
+    
+    # Удаляем старое сообщение
+    message_id = get_message_id_from_event(event)
+    if message_id:
+        await delete_message(message_id)
+    
+    chat_id = get_chat_id_from_event(event)
+    talk = content.current.talks.get(talk_id)
+    if not talk:
+        # Доклад удален из контента, пока пользователь выбирал
+        text, buttons = content.current.screen("ask")
+        await send_message_with_buttons(chat_id, text, buttons)
+        return
+    
+    user_id = event.callback.user.user_id
+    user_states[user_id] = "waiting_question"
+    user_states[f"question_talk_{user_id}"] = talk_id
+    await save_user_states()
+    
+    text = f"Вопрос спикеру: {talk.speaker} ({talk.time})\n"
+    if talk.title:
+        text += f"«{talk.title}»\n"
+    text += "\nНапишите ваш вопрос одним сообщением:"
+    buttons = [
+        [
+            {"type": "callback", "text": "❌ Отменить", "payload": "cancel_question"}
+        ]
+    ]
     await send_message_with_buttons(chat_id, text, buttons)
 
 
@@ -804,25 +1459,14 @@ async def handle_cancel_question(event: MessageCallback):
     user_id = event.callback.user.user_id
     if user_id in user_states:
         del user_states[user_id]
+    if f"question_talk_{user_id}" in user_states:
+        del user_states[f"question_talk_{user_id}"]
+    await save_user_states()
     
     # Не вызываем event.answer() для избежания ошибок с chat_id = 0
     
     # Возвращаем к меню
-    forum_info_text = "Форум «Цифровая республика. ИТ-герои».\n\nВыберите интересующий трек:"
-    # Отправляем сообщение с кнопками
-    buttons = [
-        [
-            {"type": "callback", "text": "🎮 GameDev", "payload": "track_gamedev"},
-            {"type": "callback", "text": "🤖 ИИ", "payload": "track_ai"}
-        ],
-        [
-            {"type": "callback", "text": "🚁 Беспилотники", "payload": "track_drones"},
-            {"type": "callback", "text": "📡 Медиа Будущего", "payload": "track_media"}
-        ],
-        [
-            {"type": "callback", "text": "❓ Отправить вопрос", "payload": "send_question"}
-        ]
-    ]
+    forum_info_text, buttons = content.current.screen("menu")
     
     chat_id = get_chat_id_from_event(event)
     await send_message_with_buttons(chat_id, forum_info_text, buttons)
@@ -831,6 +1475,10 @@ async def handle_cancel_question(event: MessageCallback):
 
 
 @dp.message_created()
+@catchup.filtered(drop_stale=False)
+@message_flood_control.limited(get_user_key, notify_throttled)
+@update_scheduler.scheduled(get_user_key)
+@tenants.bound
 async def handle_message(event: MessageCreated):
     """Обработка обычных сообщений (для вопросов и отзывов)"""
     # Игнорируем команды (они обрабатываются отдельно)
@@ -844,49 +1492,140 @@ async def handle_message(event: MessageCreated):
     # В maxapi User имеет first_name и last_name, но не name
     user_name = f"{event.message.sender.first_name} {event.message.sender.last_name or ''}".strip() or "Неизвестный"
     
-    # Загружаем состояния из файла перед проверкой (на случай если они были сохранены из другого процесса)
-    # Но не перезаписываем текущие состояния, а объединяем их
-    saved_states = {}
-    try:
-        if os.path.exists(STATES_DB_FILE):
-            with open(STATES_DB_FILE, 'r', encoding='utf-8') as f:
-                loaded_states = json.load(f)
-                for key, value in loaded_states.items():
-                    try:
-                        if key.isdigit():
-                            saved_states[int(key)] = value
-                        else:
-                            saved_states[key] = value
-                    except:
-                        saved_states[key] = value
-    except Exception as e:
-        print(f"Ошибка загрузки состояний: {e}")
-    
-    # Объединяем сохраненные состояния с текущими (приоритет у текущих)
-    for key, value in saved_states.items():
-        if key not in user_states:
-            user_states[key] = value
+    # Состояния в памяти - единственный источник истины процесса (файл только копия для перезапуска,
+    # в многопроцессном режиме - общее хранилище). Повторное чтение файла здесь возвращало бы
+    # устаревшие состояния других пользователей, чьи изменения еще не сохранены.
     
     # Проверяем состояние пользователя
     user_state = user_states.get(user_id, "")
     
-    # Обработка вопроса больше не нужна - используем яндекс форму
+    # Обработка вопроса спикеру (состояние waiting_question)
+    if user_state == "waiting_question":
+        await handle_question(event, user_id, user_name)
+        return
+    
+    # Обработка отзыва (состояние waiting_feedback_*)
+    if user_state and user_state.startswith("waiting_feedback"):
+        print(f"[DEBUG] Обработка feedback для пользователя {user_id}, состояние: {user_state}")
+        await handle_feedback(event, user_id, user_name)
+        return
+    
+    # Если пользователь не в состоянии ожидания feedback, игнорируем сообщение
+    # (это нормальное поведение - бот обрабатывает только команды и ответы на вопросы)
+
+
+async def handle_question(event: MessageCreated, user_id: int, user_name: str):
+    """Прием текста вопроса спикеру"""
+    text = event.message.body.text
+    chat_id = get_chat_id_from_event(event)
+    talk_id = user_states.get(f"question_talk_{user_id}")
+    talk = content.current.talks.get(talk_id)
+    print(f"[DEBUG] handle_question: user_id={user_id}, talk={talk_id}, text={text[:50]}...")
+    
+    if user_id in user_states:
+        del user_states[user_id]
+    if f"question_talk_{user_id}" in user_states:
+        del user_states[f"question_talk_{user_id}"]
+    await save_user_states()
+    
+    if not talk:
+        # Доклад удален из контента - предлагаем выбрать заново
+        text, buttons = content.current.screen("ask")
+        await send_message_with_buttons(chat_id, f"Спикер не найден, выберите заново.\n\n{text}", buttons)
+        return
+    
+    try:
+        await questions.add(talk, user_id, user_name, text)
+    except Exception as e:
+        print(f"Ошибка сохранения вопроса от пользователя {user_id}: {e}")
+        await send_message_with_buttons(chat_id, "❌ Не удалось сохранить вопрос. Попробуйте позже.", [])
+        return
+    
+    menu_text, buttons = content.current.screen("menu")
+    await send_message_with_buttons(chat_id, f"✅ Вопрос передан спикеру {talk.speaker}. Спасибо!\n\n{menu_text}", buttons)
+
+
+# Вопросы обратной связи (задаются по очереди)
+FEEDBACK_QUESTIONS = {
+    1: (
+        "Уважаемые участники форума,\n\n"
+        "Мы рады, что вы посетили наше мероприятие, и хотим услышать ваше мнение. "
+        "Ваши отзывы помогают нам улучшать организацию и содержание мероприятий.\n\n"
+        "Вопрос 1 из 3:\n"
+        "📌 Польза форума\n"
+        "Напишите ваше мнение о форуме. Что было полезно? Что вам понравилось?"
+    ),
+    2: (
+        "Спасибо за ответ!\n\n"
+        "Вопрос 2 из 3:\n"
+        "📌 Интересные направления\n"
+        "Назовите самую понравившуюся секцию или направление форума:\n\n"
+        "• 🚁 «Герои Воздушного Фронтира» (Беспилотные летательные аппараты)\n"
+        "• 🎮 «Творцы Цифровых Вселенных» (GameDev/разработка игр)\n"
+        "• 🤖 «Первопроходцы цифровой трансформации» (Искусственный интеллект)\n"
+        "• 📡 «Медиа будущего: ценности и смыслы» (Медиа)\n\n"
+        "Или напишите свой вариант."
+    ),
+    3: (
+        "Спасибо за ответ!\n\n"
+        "Вопрос 3 из 3:\n"
+        "📌 Предложения по улучшению\n"
+        "Что стоило бы добавить или убрать в программе будущего форума? "
+        "Что улучшить в организации и пр."
+    ),
+}
+
+
+# Текст перед вопросом, повторно отправленным напоминанием о незаконченном опросе
+FEEDBACK_REMINDER_TEXT = "⏰ Напоминаем: вы не закончили опрос о форуме. Ответ займет пару минут!\n\n"
+
+
+async def send_feedback_question(chat_id: int, user_id: int, number: int, prefix: str = ""):
+    """Отправка вопроса обратной связи; сообщение с предыдущим вопросом удаляется"""
+    question_message_id = user_states.get(f"question_msg_id_{user_id}", None)
+    if question_message_id:
+        await delete_message(question_message_id)
+        if f"question_msg_id_{user_id}" in user_states:
+            del user_states[f"question_msg_id_{user_id}"]
     
-    # Обработка отзыва (состояние waiting_feedback_*)
-    if user_state and user_state.startswith("waiting_feedback"):
-        print(f"[DEBUG] Обработка feedback для пользователя {user_id}, состояние: {user_state}")
-        await handle_feedback(event, user_id, user_name)
-        return
+    buttons = [
+        [
+            {"type": "callback", "text": "❌ Отмена", "payload": "cancel_feedback"}
+        ]
+    ]
     
-    # Если пользователь не в состоянии ожидания feedback, игнорируем сообщение
-    # (это нормальное поведение - бот обрабатывает только команды и ответы на вопросы)
+    # Отправляем вопрос и сохраняем его message_id для удаления
+    campaign_id = user_states.get(f"feedback_{user_id}", {}).get("campaign")
+    result = await send_message_with_buttons(chat_id, prefix + FEEDBACK_QUESTIONS[number], buttons,
+                                             campaign_id=campaign_id)
+    feedback_data = user_states.get(f"feedback_{user_id}") if result else None
+    if feedback_data is not None:
+        # Номер доставленного вопроса: после перезапуска вопрос повторяется, только если не дошел.
+        # Словарь записывается обратно целиком: в многопроцессном режиме get возвращает копию
+        feedback_data["asked"] = number
+        user_states[f"feedback_{user_id}"] = feedback_data
+        await save_user_states()
+        # На вопросы 1 и 2 пользователи чаще всего перестают отвечать - ставим напоминание
+        # (одно на вопрос), после вопроса 3 напоминать уже не о чем
+        if number < 3 and feedback_data.get("reminded") != number:
+            if settings.FEEDBACK_REMINDER_DELAY > 0:
+                reminders.schedule(user_id, chat_id, settings.FEEDBACK_REMINDER_DELAY * 60, number)
+        else:
+            reminders.cancel(user_id)
+    if result and isinstance(result, dict):
+        # Извлекаем message_id из ответа API
+        msg_id = None
+        if "message" in result and "body" in result["message"]:
+            msg_id = result["message"]["body"].get("mid")
+        if msg_id:
+            user_states[f"question_msg_id_{user_id}"] = msg_id
+            await save_user_states()
+            # Вопрос опроса, отправленного кампанией, попадает в индекс для отзыва рассылки
+            campaigns.record_message(campaign_id, msg_id)
 
 
 async def handle_feedback(event: MessageCreated, user_id: int, user_name: str):
     """Обработка ответов на вопросы обратной связи - вопросы задаются по очереди"""
-    # Загружаем состояния из файла перед обработкой
-    load_user_states()
-    
     state = user_states.get(user_id, "")
     # Загружаем сохраненные ответы из состояния
     feedback_data = user_states.get(f"feedback_{user_id}", {})
@@ -900,6 +1639,22 @@ async def handle_feedback(event: MessageCreated, user_id: int, user_name: str):
     
     text = event.message.body.text if event.message.body else ""
     chat_id = get_chat_id_from_event(event)
+    mid = event.message.body.mid if event.message.body else None
+    
+    # После перезапуска MAX повторно присылает события с сохраненного маркера.
+    # Идентификаторы принятых ответов хранятся вместе с состоянием, поэтому повтор
+    # не засчитывается как ответ на следующий вопрос
+    replayed_q3 = False
+    if mid and mid == feedback_data.get("q3_mid"):
+        # Повтор ответа на вопрос 3: отзыв мог быть уже записан в Excel до перезапуска
+        replayed_q3 = True
+    elif mid and mid in feedback_data.get("mids", []):
+        print(f"[DEBUG] Повтор уже принятого ответа {mid} от пользователя {user_id}, состояние: {state}")
+        metrics.inc("feedback_replayed")
+        # Вопрос, на который пользователь еще не ответил, мог не дойти до перезапуска
+        if state in ("waiting_feedback_q2", "waiting_feedback_q3") and feedback_data.get("asked") != int(state[-1]):
+            await send_feedback_question(chat_id, user_id, int(state[-1]))
+        return
     
     print(f"[DEBUG] handle_feedback: user_id={user_id}, state={state}, text={text[:50]}...")
     print(f"[DEBUG] Текущие сохраненные ответы: q1={feedback_data.get('q1_benefit', '')[:30]}..., q2={feedback_data.get('q2_directions', '')[:30]}..., q3={feedback_data.get('q3_suggestions', '')[:30]}...")
@@ -907,92 +1662,34 @@ async def handle_feedback(event: MessageCreated, user_id: int, user_name: str):
     if state == "waiting_feedback_q1":
         # Сохраняем ответ на первый вопрос
         feedback_data["q1_benefit"] = text
+        feedback_data["mids"] = feedback_data.get("mids", []) + [mid]
         user_states[f"feedback_{user_id}"] = feedback_data
         
         # Переходим ко второму вопросу
         user_states[user_id] = "waiting_feedback_q2"
         await save_user_states()
+        feedback_stats.funnel_step("q1")
         print(f"[DEBUG] Сохранен ответ на вопрос 1: '{text[:50]}...'")
         print(f"[DEBUG] Переход к вопросу 2, состояние: waiting_feedback_q2")
         print(f"[DEBUG] Текущие ответы: q1={feedback_data.get('q1_benefit', 'НЕТ')[:30]}...")
         
-        # Сохраняем message_id вопроса в состоянии для удаления
-        question_message_id = user_states.get(f"question_msg_id_{user_id}", None)
-        if question_message_id:
-            await delete_message(question_message_id)
-            del user_states[f"question_msg_id_{user_id}"]
-        
-        question2_text = (
-            "Спасибо за ответ!\n\n"
-            "Вопрос 2 из 3:\n"
-            "📌 Интересные направления\n"
-            "Назовите самую понравившуюся секцию или направление форума:\n\n"
-            "• 🚁 «Герои Воздушного Фронтира» (Беспилотные летательные аппараты)\n"
-            "• 🎮 «Творцы Цифровых Вселенных» (GameDev/разработка игр)\n"
-            "• 🤖 «Первопроходцы цифровой трансформации» (Искусственный интеллект)\n"
-            "• 📡 «Медиа будущего: ценности и смыслы» (Медиа)\n\n"
-            "Или напишите свой вариант."
-        )
-        
-        buttons = [
-            [
-                {"type": "callback", "text": "❌ Отмена", "payload": "cancel_feedback"}
-            ]
-        ]
-        
-        # Отправляем второй вопрос и сохраняем его message_id
-        result = await send_message_with_buttons(chat_id, question2_text, buttons)
-        if result and isinstance(result, dict):
-            # Извлекаем message_id из ответа API
-            msg_id = None
-            if "message" in result and "body" in result["message"]:
-                msg_id = result["message"]["body"].get("mid")
-            if msg_id:
-                user_states[f"question_msg_id_{user_id}"] = msg_id
-                await save_user_states()
+        await send_feedback_question(chat_id, user_id, 2)
         
     elif state == "waiting_feedback_q2":
         # Сохраняем ответ на второй вопрос (feedback_data уже загружен выше)
         feedback_data["q2_directions"] = text
+        feedback_data["mids"] = feedback_data.get("mids", []) + [mid]
         user_states[f"feedback_{user_id}"] = feedback_data
         
         # Переходим к третьему вопросу
         user_states[user_id] = "waiting_feedback_q3"
         await save_user_states()
+        feedback_stats.funnel_step("q2")
         print(f"[DEBUG] Сохранен ответ на вопрос 2: '{text[:50]}...'")
         print(f"[DEBUG] Переход к вопросу 3, состояние: waiting_feedback_q3")
         print(f"[DEBUG] Текущие ответы: q1={feedback_data.get('q1_benefit', 'НЕТ')[:30]}..., q2={feedback_data.get('q2_directions', 'НЕТ')[:30]}...")
         
-        # Удаляем сообщение со вторым вопросом
-        question_message_id = user_states.get(f"question_msg_id_{user_id}", None)
-        if question_message_id:
-            await delete_message(question_message_id)
-            del user_states[f"question_msg_id_{user_id}"]
-        
-        question3_text = (
-            "Спасибо за ответ!\n\n"
-            "Вопрос 3 из 3:\n"
-            "📌 Предложения по улучшению\n"
-            "Что стоило бы добавить или убрать в программе будущего форума? "
-            "Что улучшить в организации и пр."
-        )
-        
-        buttons = [
-            [
-                {"type": "callback", "text": "❌ Отмена", "payload": "cancel_feedback"}
-            ]
-        ]
-        
-        # Отправляем третий вопрос и сохраняем его message_id
-        result = await send_message_with_buttons(chat_id, question3_text, buttons)
-        if result and isinstance(result, dict):
-            # Извлекаем message_id из ответа API
-            msg_id = None
-            if "message" in result and "body" in result["message"]:
-                msg_id = result["message"]["body"].get("mid")
-            if msg_id:
-                user_states[f"question_msg_id_{user_id}"] = msg_id
-                await save_user_states()
+        await send_feedback_question(chat_id, user_id, 3)
         
     elif state == "waiting_feedback_q3":
         # Загружаем сохраненные ответы (на случай если они были потеряны)
@@ -1002,8 +1699,12 @@ async def handle_feedback(event: MessageCreated, user_id: int, user_name: str):
         
         # Сохраняем ответ на третий вопрос
         feedback_data["q3_suggestions"] = text
+        feedback_data["mids"] = feedback_data.get("mids", []) + [mid]
+        feedback_data["q3_mid"] = mid
         user_states[f"feedback_{user_id}"] = feedback_data
         await save_user_states()  # Сохраняем промежуточное состояние
+        if not replayed_q3:
+            feedback_stats.funnel_step("q3")
         
         print(f"[DEBUG] Сохранен ответ на вопрос 3, все ответы собраны")
         print(f"[DEBUG] Собранные ответы:")
@@ -1029,23 +1730,37 @@ async def handle_feedback(event: MessageCreated, user_id: int, user_name: str):
         print(f"  Q2 (directions): {feedback_data.get('q2_directions', 'НЕТ')[:50]}...")
         print(f"  Q3 (suggestions): {feedback_data.get('q3_suggestions', 'НЕТ')[:50]}...")
         
-        result = await excel_manager.save_feedback(
-            user_id=str(user_id),
-            user_name=user_name,
-            feedback_data={
-                "q1_benefit": feedback_data.get("q1_benefit", ""),
-                "q2_directions": feedback_data.get("q2_directions", ""),
-                "q3_suggestions": feedback_data.get("q3_suggestions", "")
-            }
-        )
+        saved_before_restart = False
+        if replayed_q3:
+            # Перезапуск мог произойти между записью в Excel и очисткой состояния
+            loop = asyncio.get_running_loop()
+            saved_before_restart = await loop.run_in_executor(
+                None, excel_manager.has_feedback, str(user_id), feedback_data
+            )
+            print(f"[DEBUG] Повтор ответа на вопрос 3, отзыв уже в Excel: {saved_before_restart}")
+        
+        if saved_before_restart:
+            result = True
+        else:
+            result = await excel_manager.save_feedback(
+                user_id=str(user_id),
+                user_name=user_name,
+                feedback_data={
+                    "q1_benefit": feedback_data.get("q1_benefit", ""),
+                    "q2_directions": feedback_data.get("q2_directions", ""),
+                    "q3_suggestions": feedback_data.get("q3_suggestions", "")
+                }
+            )
         print(f"[DEBUG] Результат сохранения в Excel: {result}")
         
         if result:
             print(f"[DEBUG] ✅ Отзыв успешно сохранен в Excel для пользователя {user_id}")
+            audience.mark(user_id, SEGMENT_ANSWERED)
         else:
             print(f"[DEBUG] ❌ Ошибка сохранения отзыва в Excel для пользователя {user_id}")
         
         # Очищаем состояния
+        campaign_id = feedback_data.get("campaign")
         if user_id in user_states:
             del user_states[user_id]
         if f"feedback_{user_id}" in user_states:
@@ -1053,55 +1768,47 @@ async def handle_feedback(event: MessageCreated, user_id: int, user_name: str):
         await save_user_states()
         print(f"[DEBUG] Состояния очищены после сохранения отзыва")
         
-        await event.message.answer(
+        thanks = await event.message.answer(
             "✅ Спасибо за обратную связь! Ваше мнение сделает наши будущие события еще лучше."
         )
+        if campaign_id and thanks and thanks.message and thanks.message.body:
+            campaigns.record_message(campaign_id, thanks.message.body.mid)
     else:
         print(f"[DEBUG] Неизвестное состояние feedback: '{state}' для пользователя {user_id}")
 
 
-async def send_feedback_request(user_id: int, chat_id: int):
-    """Отправка запроса на обратную связь пользователю - задаем вопросы по очереди"""
-    # Загружаем текущие состояния (если есть)
-    load_user_states()
-    
+async def send_feedback_request(user_id: int, chat_id: int, campaign_id: str = None):
+    """
+    Отправка запроса на обратную связь пользователю - задаем вопросы по очереди.
+    campaign_id - кампания рассылки: id отправленных сообщений опроса попадут в ее индекс
+    """
+    state = user_states.get(user_id, "")
+    if state.startswith("waiting_feedback"):
+        # Пользователь уже отвечает (например, кампания продолжена после перезапуска
+        # до отметки о доставке) - ответы не сбрасываются, вопрос повторяется только если не дошел
+        number = int(state[-1])
+        if user_states.get(f"feedback_{user_id}", {}).get("asked") != number:
+            await send_feedback_question(chat_id, user_id, number)
+        return
+
     # Инициализируем состояние для сбора отзыва
     user_states[user_id] = "waiting_feedback_q1"
-    user_states[f"feedback_{user_id}"] = {
+    feedback_data = {
         "q1_benefit": "",
         "q2_directions": "",
         "q3_suggestions": ""
     }
-    save_user_states()  # Сохраняем состояния в файл
+    if campaign_id:
+        # Словарь собирается до записи: в многопроцессном режиме изменение по ключу не сохраняется
+        feedback_data["campaign"] = campaign_id
+    user_states[f"feedback_{user_id}"] = feedback_data
+    await save_user_states()  # Сохраняем состояния в файл
+    feedback_stats.funnel_step("sent")
     
     print(f"[DEBUG] send_feedback_request: Сохранено состояние для пользователя {user_id}: waiting_feedback_q1")
     
     # Отправляем первый вопрос
-    question1_text = (
-        "Уважаемые участники форума,\n\n"
-        "Мы рады, что вы посетили наше мероприятие, и хотим услышать ваше мнение. "
-        "Ваши отзывы помогают нам улучшать организацию и содержание мероприятий.\n\n"
-        "Вопрос 1 из 3:\n"
-        "📌 Польза форума\n"
-        "Напишите ваше мнение о форуме. Что было полезно? Что вам понравилось?"
-    )
-    
-    buttons = [
-        [
-            {"type": "callback", "text": "❌ Отмена", "payload": "cancel_feedback"}
-        ]
-    ]
-    
-    # Отправляем первый вопрос и сохраняем его message_id для удаления
-    result = await send_message_with_buttons(chat_id, question1_text, buttons)
-    if result and isinstance(result, dict):
-        # Извлекаем message_id из ответа API
-        msg_id = None
-        if "message" in result and "body" in result["message"]:
-            msg_id = result["message"]["body"].get("mid")
-        if msg_id:
-            user_states[f"question_msg_id_{user_id}"] = msg_id
-            await save_user_states()
+    await send_feedback_question(chat_id, user_id, 1)
 
 
 async def handle_cancel_feedback(event: MessageCallback):
@@ -1127,12 +1834,147 @@ async def handle_cancel_feedback(event: MessageCallback):
         del user_states[f"feedback_{user_id}"]
     if f"question_msg_id_{user_id}" in user_states:
         del user_states[f"question_msg_id_{user_id}"]
-    save_user_states()  # Сохраняем изменения в файл
+    await save_user_states()  # Сохраняем изменения в файл
+    reminders.cancel(user_id)
+    feedback_stats.funnel_step("cancelled")
     
     chat_id = get_chat_id_from_event(event)
     await send_message_with_buttons(chat_id, "Заполнение обратной связи отменено", [])
 
 
+async def send_feedback_reminder(user_id: int, chat_id: int, number: int = 0):
+    """
+    Срабатывание таймера напоминания. Напоминание выполняется в очереди событий пользователя,
+    чтобы не пересечься с обработкой его ответа; таймер считается отработанным после отправки
+    """
+    tenant = tenants.current()
+    if not update_scheduler.running:
+        await remind_feedback(user_id, chat_id, number)
+        return
+    done = asyncio.get_running_loop().create_future()
+    
+    async def remind(_):
+        try:
+            with tenants.use(tenant):
+                await remind_feedback(user_id, chat_id, number)
+        finally:
+            if not done.done():
+                done.set_result(None)
+    remind.__name__ = "remind_feedback"
+    
+    if not await update_scheduler.submit((tenant.id, user_id), remind, None):
+        print(f"⚠️ Напоминание пользователю {user_id} отброшено: очередь переполнена")
+        return
+    await done
+
+
+async def remind_feedback(user_id: int, chat_id: int, asked: int = 0):
+    """
+    Повтор текущего вопроса опроса с напоминанием, если пользователь так и не ответил.
+    asked - вопрос, для которого ставился таймер: если пользователь уже ответил на него,
+    пока таймер ждал отправки, напоминание не отправляется (0 - таймер старой версии)
+    """
+    state = user_states.get(user_id, "")
+    if state not in ("waiting_feedback_q1", "waiting_feedback_q2"):
+        return
+    number = int(state[-1])
+    if asked and asked != number:
+        return
+    feedback_data = user_states.get(f"feedback_{user_id}", {})
+    if feedback_data.get("reminded") == number:
+        return
+    # Отметка до отправки: повтор таймера после сбоя не пришлет второе напоминание
+    feedback_data["reminded"] = number
+    user_states[f"feedback_{user_id}"] = feedback_data
+    await save_user_states()
+    metrics.inc("feedback_reminders")
+    print(f"[DEBUG] Напоминание об опросе пользователю {user_id}, вопрос {number}")
+    await send_feedback_question(chat_id, user_id, number, prefix=FEEDBACK_REMINDER_TEXT)
+
+
+async def send_report(chat_id: int, text: str):
+    """Отправка отчета администратору"""
+    await send_message_with_buttons(chat_id, text, [])
+
+
+def setup_tenant(tenant: Tenant) -> Tenant:
+    """Создание объектов бота мероприятия: токен, контент, состояния и Excel в каталоге мероприятия"""
+    tenant_settings = tenant.settings
+    tenant.bot = Bot(tenant_settings.BOT_TOKEN)
+    # Маркер обновлений и обработанные callback_id сохраняются между перезапусками
+    tenant.updates_state = UpdatesState(tenant.path(tenant_settings.UPDATES_STATE_FILE))
+    # Последние обработанные callback_id для защиты от повторной обработки
+    tenant.processed_callbacks = (
+        shared_store.processed_callbacks if shared_store else tenant.updates_state.processed_callbacks
+    )
+    # Очередь сообщений на время недоступности API и кэш токенов изображений треков
+    tenant.outbox = Outbox(tenant.path(worker_file(tenant_settings.OUTBOX_FILE)))
+    tenant.image_cache = ImageTokenCache(
+        API_BASE_URL, tenant_settings.BOT_TOKEN,
+        tenant.path(worker_file(tenant_settings.IMAGE_CACHE_FILE)), tenant_settings.IMAGE_TOKEN_TTL
+    )
+    # Состояния для FSM (конечный автомат состояний)
+    tenant.user_states = shared_store.states if shared_store else {}
+    # Индекс получателей рассылок (строится из USERS_DB_FILE при старте)
+    tenant.audience = AudienceIndex(tenant.path(AUDIENCE_SEGMENTS_FILE))
+    # Статистика опроса в памяти (обновляется при каждом сохранении отзыва)
+    tenant.feedback_stats = FeedbackStats(tenant.path(tenant_settings.FEEDBACK_FUNNEL_FILE))
+    tenant.feedback_stats.store = shared_store
+    tenant.excel_manager = ExcelManager(
+        tenant.path(tenant_settings.EXCEL_FILE_PATH), tenant.path(tenant_settings.EXCEL_PARTITIONS_DIR),
+        tenant_settings.EXCEL_PARTITION_BY, tenant_settings.EXCEL_PARTITION_MAX_ROWS, tenant_settings.FORUM_EVENT_ID
+    )
+    tenant.excel_manager.feedback_listeners.append(tenant.feedback_stats.add_response)
+    # Вопросы спикерам: журнал, индекс последних вопросов по докладам и запись в Excel пачками
+    tenant.questions = QuestionBook(
+        tenant.path(worker_file(tenant_settings.QUESTIONS_JOURNAL_FILE)), save_questions_batch,
+        tenant_settings.QUESTIONS_BATCH_SIZE, tenant_settings.QUESTIONS_INDEX_LIMIT
+    )
+    tenant.questions.store = shared_store
+    # Контент форума (треки, тексты экранов) - перечитывается при изменении файла без перезапуска.
+    # Без своего файла в каталоге мероприятия используется общий CONTENT_FILE
+    content_file = tenant.path(tenant_settings.CONTENT_FILE)
+    if not os.path.exists(content_file):
+        content_file = tenant_settings.CONTENT_FILE
+    tenant.content = ContentStore(content_file, {
+        "registration_url": tenant_settings.REGISTRATION_URL,
+        "forum_site_url": tenant_settings.FORUM_SITE_URL,
+        "question_form_url": tenant_settings.QUESTION_FORM_URL,
+    })
+    tenant.content.load()
+    # Ответ о направлениях сводится к треку контента при записи отзыва (столбец "Трек")
+    tenant.track_normalizer = TrackNormalizer(tenant.content)
+    tenant.excel_manager.normalize_track = tenant.track_normalizer.normalize
+    # Запланированные рассылки опроса, равномерно распределенные по окну времени
+    tenant.campaigns = CampaignScheduler(
+        tenant.path(tenant_settings.CAMPAIGNS_DIR), tenant.audience, send_feedback_request, send_report,
+        delete=delete_message_status,
+        # В многопроцессном режиме каждый воркер отправляет кампанию своим пользователям,
+        # а управляет кампаниями воркер, в который попадают команды администратора
+        shard=(WORKER_INDEX, WORKER_PROCESSES) if WORKER_INDEX is not None else None,
+        owner=WORKER_INDEX is None or WORKER_INDEX == shard_index(tenant_settings.ADMIN_ID or 0, WORKER_PROCESSES)
+    )
+    # Напоминания о незаконченном опросе (в многопроцессном режиме - свой журнал у каждого воркера)
+    tenant.reminders = ReminderScheduler(
+        tenant.path(worker_file(tenant_settings.FEEDBACK_REMINDERS_FILE)), send_feedback_reminder,
+        tenant_settings.FEEDBACK_REMINDER_RATE
+    )
+    return tenant
+
+
+# Мероприятия из TENANTS_FILE (каталог данных у каждого свой) или одно мероприятие с настройками config.py
+with startup_timings.phase("настройка мероприятий (контент, Excel)"):
+    if TENANTS_FILE:
+        for tenant_id, tenant_dir, tenant_settings in load_tenants(TENANTS_FILE, config):
+            tenants.add(setup_tenant(Tenant(tenant_id, tenant_settings, tenant_dir)))
+        print(f"Мероприятий в процессе: {len(tenants)} ({', '.join(tenant.id for tenant in tenants)})")
+    else:
+        tenants.add(setup_tenant(Tenant("default", base_settings(config))))
+
+# Профилирование по команде администратора (в многопроцессном режиме - свой каталог у каждого воркера)
+profiler = Profiler(worker_file(PROFILES_DIR), send_report)
+
+
 # Функция для рассылки отзывов (вызывается вручную или по расписанию)
 async def send_feedback_to_all_users(user_ids: list):
     """Рассылка запросов на обратную связь всем пользователям"""
@@ -1146,36 +1988,513 @@ async def send_feedback_to_all_users(user_ids: list):
             print(f"Ошибка отправки пользователю {user_id}: {e}")
 
 
+async def persist_updates_state(interval: float = 1.0):
+    """
+    Сохранение маркера обновлений. Маркер записывается, только когда очереди обработчиков
+    пусты: после сбоя события, полученные, но не обработанные, будут получены повторно
+    """
+    while True:
+        await asyncio.sleep(interval)
+        catchup.check_idle(update_scheduler.pending)
+        if update_scheduler.pending == 0 and bot.marker_updates != updates_state.saved_marker:
+            updates_state.save(bot.marker_updates)
+
+
+def rebuild_questions_index():
+    """Построение индекса вопросов по листу "Вопросы" всех секций"""
+    try:
+        questions.rebuild(excel_manager.iter_rows("Вопросы"))
+        counts = questions.talk_counts()
+        print(f"Индекс вопросов: {sum(counts.values())} вопросов к {len(counts)} докладам")
+    except Exception as e:
+        print(f"Ошибка построения индекса вопросов: {e}")
+        questions.rebuild([])
+
+
+async def flush_state():
+    """Сохранение всех данных текущего мероприятия на диск (при остановке бота)"""
+    await save_user_states()
+    print("Состояния пользователей сохранены")
+    await outbox.flush()
+    try:
+        saved = await questions.flush()
+        if saved:
+            print(f"Вопросов записано в Excel: {saved}")
+    except Exception as e:
+        print(f"Ошибка записи вопросов в Excel: {e}")
+    # Маркер обновлений в многопроцессном режиме сохраняет главный процесс
+    if WORKER_INDEX is None and update_scheduler.pending == 0:
+        updates_state.save(bot.marker_updates)
+        print(f"Маркер обновлений сохранен: {bot.marker_updates}")
+
+
+async def stop_polling(polling_task: asyncio.Task, timeout: float):
+    """Прекращение получения обновлений"""
+    if not polling_task.done():
+        if hasattr(dp, 'stop_polling'):
+            try:
+                await asyncio.wait_for(dp.stop_polling(), timeout=timeout)
+            except Exception as e:
+                print(f"Ошибка остановки polling: {e}")
+        else:
+            dp.polling = False
+    if not polling_task.done():
+        polling_task.cancel()
+    await asyncio.gather(polling_task, return_exceptions=True)
+
+
+async def graceful_shutdown(polling_task: asyncio.Task, service_tasks: list):
+    """
+    Корректная остановка: прекращаем прием обновлений, дообрабатываем очереди и рассылки
+    в пределах SHUTDOWN_TIMEOUT, сохраняем данные и закрываем HTTP сессию
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SHUTDOWN_TIMEOUT
+    
+    def remaining():
+        return max(deadline - loop.time(), 0.1)
+    
+    print("Остановка бота: прекращаю прием обновлений...")
+    sd_notify("STOPPING=1")
+    await stop_polling(polling_task, remaining())
+    
+    # Дообрабатываем события, уже поставленные в очереди
+    if update_scheduler.pending:
+        print(f"Ожидаю обработки событий в очередях: {update_scheduler.pending}")
+    try:
+        await asyncio.wait_for(update_scheduler.join(), timeout=remaining())
+    except asyncio.TimeoutError:
+        print(f"⚠️ Не обработано событий: {update_scheduler.pending}")
+    await update_scheduler.stop()
+    
+    for tenant in tenants:
+        with tenants.use(tenant):
+            await flush_state()
+    
+    for task in service_tasks:
+        task.cancel()
+    await asyncio.gather(*service_tasks, return_exceptions=True)
+    for tenant in tenants:
+        tenant.reminders.close()
+    
+    # Закрываем сессии при завершении
+    for tenant in tenants:
+        if hasattr(tenant.bot, 'close_session'):
+            try:
+                await tenant.bot.close_session()
+            except Exception as e:
+                print(f"Ошибка закрытия сессии бота {tenant.id}: {e}")
+    if http_session:
+        await http_session.close()
+        print("HTTP сессия закрыта")
+
+
+def prepare_tenant():
+    """Загрузка данных текущего мероприятия при запуске"""
+    # Загружаем состояния пользователей из файла
+    load_user_states()
+    
+    # Продолжаем получение обновлений с сохраненного маркера
+    marker = updates_state.load()
+    if marker is not None:
+        bot.marker_updates = marker
+        print(f"Продолжение с маркера обновлений {marker}, обработанных callback: {len(processed_callbacks)}")
+    
+    # Строим индекс получателей рассылок
+    audience.load(load_users_db())
+    print(f"Индекс аудитории: {len(audience)} пользователей")
+    
+    # Приводим схему Excel к актуальной версии (один раз при старте)
+    try:
+        excel_manager.migrate_feedback_schema()
+    except Exception as e:
+        print(f"Ошибка миграции схемы Excel: {e}")
+    
+    # Статистика опроса строится по листу "Отзывы" один раз, дальше обновляется в памяти
+    try:
+        feedback_stats.rebuild(excel_manager.iter_feedback_rows())
+        print(f"Статистика опроса: {feedback_stats.responses} ответов")
+    except Exception as e:
+        print(f"Ошибка построения статистики опроса: {e}")
+    
+    # Индекс вопросов по докладам строится по листу "Вопросы" один раз, дальше обновляется в памяти
+    rebuild_questions_index()
+
+
+def start_tenant_services() -> list:
+    """Фоновые задачи текущего мероприятия (наследуют его как текущее)"""
+    return [
+        # Отправка сообщений, накопившихся за время недоступности API
+        asyncio.create_task(drain_outbox()),
+        # Запуск запланированных рассылок (и продолжение прерванных перезапуском)
+        asyncio.create_task(campaigns.run()),
+        # Перезагрузка контента при изменении файла
+        asyncio.create_task(content.watch(settings.CONTENT_RELOAD_INTERVAL)),
+        # Сохранение маркера обновлений для быстрого перезапуска
+        asyncio.create_task(persist_updates_state()),
+        # Запись вопросов спикерам в Excel пачками
+        asyncio.create_task(questions.run(settings.QUESTIONS_FLUSH_INTERVAL)),
+        # Напоминания о незаконченном опросе
+        asyncio.create_task(reminders.run()),
+    ]
+
+
+def warm_up_images() -> asyncio.Task:
+    """Загрузка графики треков текущего мероприятия в MAX (токены переиспользуются при показе треков)"""
+    return asyncio.create_task(image_cache.warm_up(http_session, [url for url in settings.TRACK_IMAGES.values() if url]))
+
+
+def create_http_session(keeper: ConnectionKeeper) -> aiohttp.ClientSession:
+    """Общая сессия aiohttp: соединения живут в пуле KEEPALIVE_TIMEOUT, запросы отмечаются для прогрева"""
+    return aiohttp.ClientSession(connector=keeper.connector(), trace_configs=[keeper.trace_config()])
+
+
+async def warm_up_api(session: aiohttp.ClientSession, keeper: ConnectionKeeper = None):
+    """
+    Проверка токенов всех мероприятий запросом GET /me и прогрев соединений с MAX API
+    до начала обработки. Отклоненный токен останавливает запуск, недоступность API - нет
+    (сообщения подождут в outbox)
+    """
+    for tenant in tenants:
+        with startup_timings.phase(f"проверка токена {tenant.id}"):
+            try:
+                me = await check_token(session, API_BASE_URL, tenant.settings.BOT_TOKEN, WARMUP_TIMEOUT)
+                print(f"✅ Токен бота {tenant.id} действителен: {me.get('username') or me.get('first_name')}")
+            except TokenError as e:
+                raise SystemExit(f"❌ MAX API отклонил токен бота {tenant.id}: {e}. Проверьте BOT_TOKEN")
+            except Exception as e:
+                print(f"⚠️ Не удалось проверить токен бота {tenant.id}: {e!r}")
+    
+    if keeper is not None:
+        await warm_up_pool(session, keeper)
+
+
+async def warm_up_pool(session: aiohttp.ClientSession, keeper: ConnectionKeeper):
+    """Открытие WARMUP_CONNECTIONS соединений с MAX API заранее"""
+    if keeper.connections <= 0:
+        return
+    with startup_timings.phase(f"прогрев соединений ({keeper.connections})"):
+        opened = await keeper.warm(session)
+    print(f"Прогрев соединений с MAX API: открыто {opened} из {keeper.connections}")
+
+
+async def poll_updates():
+    """
+    Получение обновлений бота текущего мероприятия (режим нескольких мероприятий).
+    Маркер сдвигается после передачи пачки диспетчеру, сохраняет его persist_updates_state
+    """
+    tenant_bot = tenants.current().bot
+    while True:
+        try:
+            events = await tenant_bot.get_updates(marker=tenant_bot.marker_updates)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Ошибка получения обновлений ({tenants.current().id}): {e}, повтор через 3 с")
+            await asyncio.sleep(3)
+            continue
+        for update in events.get("updates", []):
+            try:
+                event = await process_update_webhook(event_json=update, bot=tenant_bot)
+                if event is not None:
+                    await dp.handle(event)
+            except Exception as e:
+                print(f"Ошибка обработки обновления ({tenants.current().id}): {e}")
+        if events.get("marker") is not None:
+            tenant_bot.marker_updates = events["marker"]
+
+
+async def poll_tenants():
+    """Получение обновлений ботов всех мероприятий: диспетчер, планировщик и HTTP сессия общие"""
+    while True:
+        try:
+            await dp.startup(tenants.default.bot)
+            break
+        except Exception as e:
+            print(f"Ошибка подготовки диспетчера: {e}, повтор через 3 с")
+            await asyncio.sleep(3)
+    
+    tasks = []
+    for tenant in tenants:
+        with tenants.use(tenant):
+            tasks.append(asyncio.create_task(poll_updates()))
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
 async def main():
     """Основная функция запуска бота"""
     global http_session
     
-    # Загружаем состояния пользователей из файла
-    load_user_states()
+    # Создаем глобальную сессию aiohttp (общая для всех мероприятий)
+    keeper = ConnectionKeeper(API_BASE_URL, tenants.default.settings.BOT_TOKEN, WARMUP_CONNECTIONS,
+                              KEEPALIVE_TIMEOUT, WARMUP_TIMEOUT)
+    http_session = create_http_session(keeper)
+    
+    # Запускаем воркеры обработчиков
+    update_scheduler.start()
     
-    # Создаем глобальную сессию aiohttp
-    http_session = aiohttp.ClientSession()
+    for tenant in tenants:
+        with tenants.use(tenant):
+            if len(tenants) > 1:
+                print(f"Мероприятие {tenant.id} (каталог {tenant.directory}):")
+            with startup_timings.phase(f"данные {tenant.id}"):
+                prepare_tenant()
     
+    # Неверный токен обнаруживается до начала работы, а не при первой отправке
     try:
-        print("Бот запущен!")
-        print(f"Токен бота: {BOT_TOKEN[:20]}...")
-        print("Начинаю polling...")
-        await dp.start_polling(bot)
-    except KeyboardInterrupt:
+        await warm_up_api(http_session, keeper)
+    except SystemExit:
+        await http_session.close()
+        raise
+    
+    service_tasks = [
+        # Контроль задержек event loop и пинг watchdog systemd
+        asyncio.create_task(LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD).run()),
+    ]
+    if keeper.connections > 0:
+        # Повторный прогрев соединений после долгого простоя
+        service_tasks.append(asyncio.create_task(keeper.run(http_session)))
+    image_tasks = []
+    for tenant in tenants:
+        with tenants.use(tenant):
+            image_tasks.append(warm_up_images())
+            service_tasks += start_tenant_services()
+    
+    # Первые показы треков используют уже загруженную графику (дольше WARMUP_TIMEOUT - догрузится в фоне)
+    with startup_timings.phase("графика треков"):
+        await asyncio.wait(image_tasks, timeout=WARMUP_TIMEOUT)
+    service_tasks += image_tasks
+    
+    # SIGTERM (systemd stop/restart) и SIGINT (Ctrl+C) запускают корректную остановку
+    shutdown_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, shutdown_event.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: остается KeyboardInterrupt
+            pass
+    
+    print("Бот запущен!")
+    for tenant in tenants:
+        print(f"Токен бота {tenant.id}: {tenant.settings.BOT_TOKEN[:20]}...")
+    print(f"Холодный старт: {startup_timings.finish():.2f} с\n{startup_timings.format()}")
+    print("Начинаю polling...")
+    if len(tenants) == 1:
+        polling_task = asyncio.create_task(dp.start_polling(tenants.default.bot))
+    else:
+        polling_task = asyncio.create_task(poll_tenants())
+    sd_notify("READY=1")
+    shutdown_waiter = asyncio.create_task(shutdown_event.wait())
+    try:
+        await asyncio.wait({polling_task, shutdown_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        if polling_task.done() and not polling_task.cancelled() and polling_task.exception():
+            print(f"Ошибка при запуске бота: {polling_task.exception()}")
+    except (KeyboardInterrupt, asyncio.CancelledError):
         print("\nБот остановлен")
+    finally:
+        shutdown_waiter.cancel()
+        await graceful_shutdown(polling_task, service_tasks)
+
+
+async def refresh_audience(interval: float = 60):
+    """Периодическое дополнение индекса аудитории пользователями других процессов"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            sync_audience()
+        except Exception as e:
+            print(f"Ошибка обновления индекса аудитории: {e}")
+
+
+async def receive_updates(queue, worker_acks: WorkerAcks):
+    """Прием сырых обновлений от главного процесса и передача их диспетчеру"""
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await loop.run_in_executor(None, queue.get)
+        if item is None:
+            # Главный процесс останавливает бота
+            return
+        seq, update = item
+        try:
+            event = await process_update_webhook(event_json=update, bot=tenants.default.bot)
+            if event is not None:
+                await dp.handle(event)
+        except Exception as e:
+            print(f"Ошибка обработки обновления: {e}")
+        # Обработчики ставятся в очередь планировщика - подтверждаем, когда очереди опустеют
+        worker_acks.received = seq
+        worker_acks.flush(update_scheduler.pending)
+
+
+async def worker_main(queue, acks):
+    """Процесс-воркер многопроцессного режима: обрабатывает обновления своих пользователей"""
+    global http_session
+    
+    # Статистика опроса и индекс вопросов - в общем хранилище (построены главным процессом)
+    audience.load(load_users_db())
+    
+    keeper = ConnectionKeeper(API_BASE_URL, settings.BOT_TOKEN, WARMUP_CONNECTIONS, KEEPALIVE_TIMEOUT, WARMUP_TIMEOUT)
+    http_session = create_http_session(keeper)
+    update_scheduler.start()
+    # Токен проверен главным процессом, воркер только открывает свои соединения
+    await warm_up_pool(http_session, keeper)
+    
+    service_tasks = [
+        asyncio.create_task(drain_outbox()),
+        asyncio.create_task(image_cache.warm_up(http_session, [url for url in settings.TRACK_IMAGES.values() if url])),
+        asyncio.create_task(content.watch(settings.CONTENT_RELOAD_INTERVAL)),
+        asyncio.create_task(LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD).run()),
+        asyncio.create_task(refresh_audience()),
+        asyncio.create_task(questions.run(settings.QUESTIONS_FLUSH_INTERVAL)),
+        asyncio.create_task(reminders.run()),
+    ]
+    if keeper.connections > 0:
+        service_tasks.append(asyncio.create_task(keeper.run(http_session)))
+    # Каждый воркер отправляет кампании своим пользователям
+    service_tasks.append(asyncio.create_task(campaigns.run()))
+    
+    # Подготовка диспетчера без polling (обновления приходят из очереди)
+    while True:
+        try:
+            await dp.startup(tenants.default.bot)
+            break
+        except Exception as e:
+            print(f"Ошибка подготовки диспетчера: {e}, повтор через 3 с")
+            await asyncio.sleep(3)
+    
+    worker_acks = WorkerAcks(WORKER_INDEX, acks)
+    service_tasks.append(asyncio.create_task(worker_acks.run(lambda: update_scheduler.pending)))
+    
+    print(f"Воркер {WORKER_INDEX} готов")
+    receive_task = asyncio.create_task(receive_updates(queue, worker_acks))
+    try:
+        await receive_task
+    finally:
+        await graceful_shutdown(receive_task, service_tasks)
+        # Подтверждаем обновления, обработанные при остановке
+        worker_acks.flush(update_scheduler.pending)
+        shared_store.close()
+
+
+def run_worker(index: int, queue, acks):
+    """Точка входа процесса-воркера (запускается главным процессом)"""
+    # Ctrl+C получает вся группа процессов - воркер завершается по команде главного процесса
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    install_event_loop()
+    asyncio.run(worker_main(queue, acks))
+
+
+def seed_shared_aggregates(store: SharedStore):
+    """
+    Статистика опроса и индекс вопросов в общем хранилище строятся по Excel, только пока
+    их там нет (первый запуск многопроцессного режима) - дальше воркеры обновляют их сами
+    """
+    feedback_stats.store = questions.store = store
+    try:
+        if not store.counters(STATS_PREFIX):
+            feedback_stats.rebuild(excel_manager.iter_feedback_rows())
+            print(f"Статистика опроса перенесена в {SHARED_STORE_FILE}: {feedback_stats.responses} ответов")
+        if not store.counters("questions_"):
+            rebuild_questions_index()
     except Exception as e:
-        print(f"Ошибка при запуске бота: {e}")
-        import traceback
-        traceback.print_exc()
+        print(f"Ошибка построения статистики опроса: {e}")
     finally:
-        # Закрываем сессию при завершении
-        if http_session:
-            await http_session.close()
-            print("HTTP сессия закрыта")
+        feedback_stats.store = questions.store = None
+
+
+async def cluster_main():
+    """
+    Главный процесс многопроцессного режима: получает обновления и раздает их
+    WORKER_PROCESSES воркерам по user_id
+    """
+    # Приводим схему Excel к актуальной версии до запуска воркеров
+    try:
+        excel_manager.migrate_feedback_schema()
+    except Exception as e:
+        print(f"Ошибка миграции схемы Excel: {e}")
+    
+    # При первом запуске переносим пользователей и состояния из JSON файлов в общее хранилище
+    store = SharedStore(SHARED_STORE_FILE)
+    if store.is_empty():
+        load_user_states()
+        store.import_json(load_users_db(), user_states)
+        print(f"Данные перенесены в {SHARED_STORE_FILE}")
+    seed_shared_aggregates(store)
+    store.close()
+    
+    # Неверный токен обнаруживается до запуска воркеров
+    async with aiohttp.ClientSession() as session:
+        await warm_up_api(session)
+    
+    # Маркер сохраняется после подтверждения обработки обновлений воркерами
+    cluster = Cluster(WORKER_PROCESSES, run_worker, WORKER_QUEUE_SIZE, on_marker=updates_state.save)
+    cluster.start()
+    
+    marker = updates_state.load()
+    lag_monitor = asyncio.create_task(LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD).run())
+    ack_task = asyncio.create_task(cluster.track_acks())
+    
+    shutdown_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            loop.add_signal_handler(sig, shutdown_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    
+    print(f"Бот запущен в многопроцессном режиме: {WORKER_PROCESSES} воркеров")
+    poll_task = asyncio.create_task(cluster.poll(tenants.default.bot, marker))
+    sd_notify("READY=1")
+    shutdown_waiter = asyncio.create_task(shutdown_event.wait())
+    try:
+        await asyncio.wait({poll_task, shutdown_waiter}, return_when=asyncio.FIRST_COMPLETED)
+        if poll_task.done() and not poll_task.cancelled() and poll_task.exception():
+            print(f"Ошибка получения обновлений: {poll_task.exception()}")
+    finally:
+        print("Остановка бота: прекращаю прием обновлений...")
+        sd_notify("STOPPING=1")
+        shutdown_waiter.cancel()
+        poll_task.cancel()
+        await asyncio.gather(poll_task, return_exceptions=True)
+        # Воркеры дообрабатывают полученные обновления и завершаются
+        ack_task.cancel()
+        await cluster.stop(SHUTDOWN_TIMEOUT)
+        lag_monitor.cancel()
+        await asyncio.gather(lag_monitor, ack_task, return_exceptions=True)
+        if hasattr(tenants.default.bot, 'close_session'):
+            try:
+                await tenants.default.bot.close_session()
+            except Exception as e:
+                print(f"Ошибка закрытия сессии бота: {e}")
+
+
+def install_event_loop():
+    """Установка uvloop, если он включен в настройках и установлен (иначе стандартный asyncio)"""
+    if not USE_UVLOOP:
+        return "asyncio"
+    if importlib.util.find_spec("uvloop") is None:
+        print("uvloop не установлен, используется стандартный event loop")
+        return "asyncio"
+    import uvloop
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return "uvloop"
 
 
 if __name__ == '__main__':
+    if WORKER_PROCESSES > 1 and len(tenants) > 1:
+        # Процессы-воркеры делят пользователей одного бота, несколько мероприятий - отдельный режим
+        raise SystemExit("Несколько мероприятий (TENANTS_FILE) не совмещаются с WORKER_PROCESSES > 1")
+    print(f"Event loop: {install_event_loop()}")
     try:
-        asyncio.run(main())
+        if WORKER_PROCESSES > 1:
+            asyncio.run(cluster_main())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("\nБот остановлен пользователем")
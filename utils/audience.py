@@ -0,0 +1,132 @@
+"""
+Индекс аудитории для рассылок
+
+Получатели хранятся в компактных массивах (user_id, chat_id, битовые флаги сегментов),
+сегменты (открытые треки, ответ на опрос) дописываются в журнал и восстанавливаются при старте.
+Рассылка получает получателей потоком через генератор, без построения списков в памяти.
+"""
+import os
+from array import array
+
+# Сегмент пользователей, ответивших на опрос обратной связи
+SEGMENT_ANSWERED = "answered"
+# Максимальное количество сегментов (по числу бит во флагах)
+MAX_SEGMENTS = 32
+
+
+class AudienceIndex:
+    def __init__(self, segments_log: str):
+        self.segments_log = segments_log
+        self._user_ids = array('q')
+        self._chat_ids = array('q')  # 0 - chat_id неизвестен
+        self._flags = array('L')  # битовая маска сегментов пользователя
+        self._positions = {}  # user_id -> позиция в массивах
+        self._segment_bits = {}  # имя сегмента -> бит во флагах
+
+    def __len__(self):
+        return len(self._user_ids)
+
+    def _position(self, user_id: int) -> int:
+        """Позиция пользователя в индексе (добавляет пользователя при необходимости)"""
+        pos = self._positions.get(user_id)
+        if pos is None:
+            pos = len(self._user_ids)
+            self._user_ids.append(user_id)
+            self._chat_ids.append(0)
+            self._flags.append(0)
+            self._positions[user_id] = pos
+        return pos
+
+    def _bit(self, segment: str) -> int:
+        """Бит сегмента (новые сегменты получают следующий свободный бит)"""
+        bit = self._segment_bits.get(segment)
+        if bit is None:
+            if len(self._segment_bits) >= MAX_SEGMENTS:
+                raise ValueError(f"Превышено количество сегментов аудитории ({MAX_SEGMENTS})")
+            bit = 1 << len(self._segment_bits)
+            self._segment_bits[segment] = bit
+        return bit
+
+    def load(self, users_db: dict):
+        """Построение индекса из базы пользователей и журнала сегментов"""
+        for user_id_str, user_data in users_db.get("users", {}).items():
+            user_id = user_data.get("user_id") or int(user_id_str)
+            self.add(user_id, user_data.get("chat_id"))
+        # Пользователи из старой структуры (без chat_id)
+        for user_id in users_db.get("user_ids", []):
+            self._position(user_id)
+
+        try:
+            if os.path.exists(self.segments_log):
+                with open(self.segments_log, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        user_id, _, segment = line.strip().partition('\t')
+                        if user_id.lstrip('-').isdigit() and segment:
+                            pos = self._position(int(user_id))
+                            self._flags[pos] |= self._bit(segment)
+        except Exception as e:
+            print(f"Ошибка загрузки журнала сегментов аудитории: {e}")
+
+    def add(self, user_id: int, chat_id: int = None):
+        """Добавление пользователя или обновление его chat_id"""
+        pos = self._position(user_id)
+        if chat_id:
+            self._chat_ids[pos] = chat_id
+
+    def mark(self, user_id: int, segment: str):
+        """Добавление пользователя в сегмент (запись в журнал только при изменении)"""
+        pos = self._position(user_id)
+        bit = self._bit(segment)
+        if self._flags[pos] & bit:
+            return
+        self._flags[pos] |= bit
+        try:
+            with open(self.segments_log, 'a', encoding='utf-8') as f:
+                f.write(f"{user_id}\t{segment}\n")
+        except Exception as e:
+            print(f"Ошибка записи журнала сегментов аудитории: {e}")
+
+    def _masks(self, include, exclude):
+        """Битовые маски сегментов (None, если в каком-то из include никого нет)"""
+        include_mask = 0
+        for segment in include:
+            if segment not in self._segment_bits:
+                return None
+            include_mask |= self._segment_bits[segment]
+        exclude_mask = 0
+        for segment in exclude:
+            exclude_mask |= self._segment_bits.get(segment, 0)
+        return include_mask, exclude_mask
+
+    def iter_positions(self, include=(), exclude=()):
+        """
+        Генератор получателей (позиция, user_id, chat_id) с известным chat_id.
+        include - сегменты, во всех из которых должен быть пользователь,
+        exclude - сегменты, ни в одном из которых пользователя быть не должно.
+        """
+        masks = self._masks(include, exclude)
+        if masks is None:
+            return
+        include_mask, exclude_mask = masks
+
+        # Проход по индексу: пользователи, добавленные во время рассылки, тоже попадут в нее
+        pos = 0
+        while pos < len(self._user_ids):
+            flags = self._flags[pos]
+            chat_id = self._chat_ids[pos]
+            if chat_id and (flags & include_mask) == include_mask and not (flags & exclude_mask):
+                yield pos, self._user_ids[pos], chat_id
+            pos += 1
+
+    def iter_recipients(self, include=(), exclude=()):
+        """Генератор получателей (user_id, chat_id) с известным chat_id (см. iter_positions)"""
+        for _, user_id, chat_id in self.iter_positions(include, exclude):
+            yield user_id, chat_id
+
+    def count_recipients(self, include=(), exclude=()) -> int:
+        """Количество получателей (без построения списков)"""
+        return sum(1 for _ in self.iter_positions(include, exclude))
+
+    def count_without_chat_id(self) -> int:
+        """Количество пользователей без chat_id (им нельзя отправить рассылку)"""
+        return sum(1 for chat_id in self._chat_ids if not chat_id)
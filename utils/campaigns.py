@@ -0,0 +1,450 @@
+"""
+Запланированные рассылки опроса с равномерным распределением по времени
+
+Кампания запускается в заданное время и растягивается на окно в несколько минут/часов,
+поэтому и отправка, и ответы пользователей идут с ограниченной скоростью.
+Кампании и список уже получивших рассылку хранятся на диске, после перезапуска
+бота кампания продолжается с того же места.
+
+Id всех сообщений опроса, отправленных по кампании, дописываются в индекс <id>.mids,
+поэтому ошибочную рассылку можно отозвать (recall): сообщения удаляются параллельно
+с ограничением темпа, обработанные отмечаются в <id>.recalled (id и статус ответа),
+и после перезапуска отзыв продолжается с того же места. Сообщения отмененной кампании,
+еще ждущие в очереди исходящих, снимаются с очереди и учитываются в <id>.purged.
+
+В многопроцессном режиме каждый воркер отправляет кампанию только своим пользователям
+(тем, чьи события он обрабатывает), поэтому опрос, его состояние и напоминания остаются
+у одного процесса. Кампаниями управляет воркер администратора: только он пишет
+campaigns.json, остальные перечитывают его, а свой прогресс пишут в <id>.shard<N>.json.
+"""
+import os
+import json
+import time
+import asyncio
+from collections import deque
+from utils.cluster import shard_index
+
+# Минимальный интервал между отправками (секунды)
+MIN_SEND_INTERVAL = 0.05
+
+# Отзыв рассылки: период отчета о прогрессе (секунды) и попыток удаления одного сообщения
+RECALL_PROGRESS_INTERVAL = 15
+RECALL_MAX_ATTEMPTS = 5
+# Пауза перед повторной проверкой индекса (секунды): сообщения из очередей исходящих, отправленные
+# до того, как воркеры увидели отмену, попадают в индекс уже после основного прохода отзыва
+RECALL_SETTLE = 3
+# Ответы API на удаление: удалено, сообщения уже нет; None - сеть или API недоступно
+STATUS_DELETED = 200
+STATUS_MISSING = 404
+
+
+class CampaignScheduler:
+    def __init__(self, directory: str, audience, send, report, delete=None, shard=None, owner: bool = True):
+        self.directory = directory
+        self.audience = audience  # AudienceIndex
+        self.send = send  # корутина send(user_id, chat_id, campaign_id)
+        self.report = report  # корутина report(chat_id, text) - отчет администратору
+        self.delete = delete  # корутина delete(message_id) -> HTTP статус или None (отзыв рассылки)
+        self.shard = shard  # (номер воркера, количество воркеров) в многопроцессном режиме
+        self.owner = owner  # Процесс управляет кампаниями (пишет campaigns.json, отчеты, отзыв)
+        self.file_path = os.path.join(directory, "campaigns.json")
+        self.campaigns = {}  # id -> описание кампании
+        self._tasks = {}  # id -> задача выполнения
+        self._recalls = {}  # id -> задача отзыва
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Загрузка кампаний из файла"""
+        try:
+            if os.path.exists(self.file_path):
+                with open(self.file_path, 'r', encoding='utf-8') as f:
+                    self.campaigns = {campaign["id"]: campaign for campaign in json.load(f)}
+        except Exception as e:
+            print(f"Ошибка загрузки кампаний рассылки: {e}")
+            self.campaigns = {}
+
+    def save(self):
+        """Сохранение кампаний в файл (атомарно через временный файл)"""
+        if not self.owner:
+            return
+        temp_file = self.file_path + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(list(self.campaigns.values()), f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.file_path)
+        except Exception as e:
+            print(f"Ошибка сохранения кампаний рассылки: {e}")
+
+    def _sent_file(self, campaign_id: str) -> str:
+        return os.path.join(self.directory, f"{campaign_id}.sent")
+
+    def _mids_file(self, campaign_id: str) -> str:
+        return os.path.join(self.directory, f"{campaign_id}.mids")
+
+    def _purged_file(self, campaign_id: str) -> str:
+        return os.path.join(self.directory, f"{campaign_id}.purged")
+
+    def _recalled_file(self, campaign_id: str) -> str:
+        return os.path.join(self.directory, f"{campaign_id}.recalled")
+
+    def _shard_file(self, campaign_id: str, index: int) -> str:
+        return os.path.join(self.directory, f"{campaign_id}.shard{index}.json")
+
+    def _in_shard(self, user_id: int) -> bool:
+        return self.shard is None or shard_index(user_id, self.shard[1]) == self.shard[0]
+
+    def _load_shard(self, campaign_id: str, index: int) -> dict:
+        """Прогресс кампании у воркера index"""
+        try:
+            with open(self._shard_file(campaign_id, index), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"sent": 0, "errors": 0, "done": False}
+
+    def _save_progress(self, campaign: dict, progress: dict):
+        """Сохранение прогресса: без воркеров - в campaigns.json, иначе - в файл воркера"""
+        if self.shard is None:
+            self.save()
+            return
+        path = self._shard_file(campaign["id"], self.shard[0])
+        try:
+            with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(progress, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            print(f"Ошибка сохранения прогресса кампании {campaign['id']}: {e}")
+
+    @staticmethod
+    def _read_lines(path: str) -> list:
+        if not os.path.exists(path):
+            return []
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f if line.strip()]
+
+    def record_message(self, campaign_id: str, message_id: str):
+        """
+        Запись id отправленного по кампании сообщения в индекс кампании. Строка дописывается
+        одной записью в режиме append, поэтому индекс могут пополнять несколько процессов
+        """
+        if not campaign_id or not message_id:
+            return
+        try:
+            with open(self._mids_file(campaign_id), 'a', encoding='utf-8') as f:
+                f.write(f"{message_id}\n")
+        except OSError as e:
+            print(f"Ошибка записи индекса сообщений кампании {campaign_id}: {e}")
+
+    def record_purged(self, campaign_id: str, count: int):
+        """Учет сообщений кампании, снятых с очереди исходящих без отправки (дописывается, как индекс)"""
+        if not campaign_id or not count:
+            return
+        try:
+            with open(self._purged_file(campaign_id), 'a', encoding='utf-8') as f:
+                f.write(f"{count}\n")
+        except OSError as e:
+            print(f"Ошибка записи учета снятых сообщений кампании {campaign_id}: {e}")
+
+    def purged_count(self, campaign_id: str) -> int:
+        """Сколько сообщений кампании снято с очереди исходящих без отправки"""
+        return sum(int(line) for line in self._read_lines(self._purged_file(campaign_id)) if line.isdigit())
+
+    def stopped(self, campaign_id: str) -> bool:
+        """Кампания отменена или отозвана - ее сообщения больше не отправляются"""
+        return self.campaigns.get(campaign_id, {}).get("status") == "cancelled"
+
+    def message_ids(self, campaign_id: str) -> list:
+        """Id сообщений кампании без повторов, в порядке отправки"""
+        return list(dict.fromkeys(self._read_lines(self._mids_file(campaign_id))))
+
+    def _load_sent(self, campaign_id: str) -> set:
+        """user_id этого процесса, которым рассылка уже отправлена"""
+        sent = set()
+        path = self._sent_file(campaign_id)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line.lstrip('-').isdigit() and self._in_shard(int(line)):
+                        sent.add(int(line))
+        return sent
+
+    def schedule(self, start_at: float, window: float, include: list, exclude: list, report_chat_id,
+                 source_mid: str = None) -> dict:
+        """
+        Создание кампании: старт в start_at (unix time), распределение на window секунд.
+        source_mid - id сообщения с командой: повтор того же сообщения после перезапуска
+        возвращает уже созданную кампанию
+        """
+        if source_mid:
+            for campaign in self.campaigns.values():
+                if campaign.get("source_mid") == source_mid:
+                    return campaign
+        campaign_id = time.strftime("%Y%m%d%H%M%S", time.localtime()) + f"_{len(self.campaigns) + 1}"
+        campaign = {
+            "id": campaign_id,
+            "start_at": start_at,
+            "window": window,
+            "include": list(include),
+            "exclude": list(exclude),
+            "status": "scheduled",
+            "sent": 0,
+            "errors": 0,
+            "report_chat_id": report_chat_id,
+            "source_mid": source_mid,
+        }
+        self.campaigns[campaign_id] = campaign
+        self.save()
+        return campaign
+
+    def cancel(self, campaign_id: str) -> bool:
+        """Отмена запланированной или идущей кампании"""
+        campaign = self.campaigns.get(campaign_id)
+        if not campaign or campaign["status"] not in ("scheduled", "running"):
+            return False
+        campaign["status"] = "cancelled"
+        task = self._tasks.pop(campaign_id, None)
+        if task:
+            task.cancel()
+        self.save()
+        return True
+
+    def recall(self, campaign_id: str, report_chat_id, rate: float, concurrency: int):
+        """
+        Отзыв рассылки: кампания отменяется, все ее сообщения удаляются в фоне (rate удалений
+        в секунду, concurrency одновременных запросов). Повторный вызов после завершения
+        удаляет то, что не удалось удалить в прошлый раз. Возвращает кампанию или None
+        """
+        campaign = self.campaigns.get(campaign_id)
+        if not campaign or self.delete is None:
+            return None
+        self.cancel(campaign_id)
+        if campaign_id not in self._recalls:
+            campaign["recall"] = {
+                "status": "running",
+                "rate": rate,
+                "concurrency": concurrency,
+                "report_chat_id": report_chat_id,
+                "total": len(self.message_ids(campaign_id)),
+                "deleted": 0,
+                "missing": 0,
+                "failed": 0,
+            }
+            self.save()
+            self._start_recall(campaign)
+        return campaign
+
+    def _start_recall(self, campaign: dict):
+        task = asyncio.create_task(self._run_recall(campaign))
+        self._recalls[campaign["id"]] = task
+        task.add_done_callback(lambda _, cid=campaign["id"]: self._recalls.pop(cid, None))
+
+    async def run(self, check_interval: float = 1.0):
+        """Фоновый цикл: запуск кампаний, время которых наступило (и продолжение прерванных)"""
+        try:
+            # Отзывы рассылок, прерванные перезапуском, продолжаются с того же места
+            for campaign in self.campaigns.values():
+                if (campaign.get("recall", {}).get("status") == "running" and self.delete is not None
+                        and self.owner):
+                    self._start_recall(campaign)
+            while True:
+                now = time.time()
+                if not self.owner:
+                    # Кампании создает и отменяет воркер администратора
+                    self._load()
+                    for campaign_id, task in list(self._tasks.items()):
+                        if self.campaigns.get(campaign_id, {}).get("status") not in ("scheduled", "running"):
+                            task.cancel()
+                elif self.shard is not None:
+                    await self._collect_shards()
+                for campaign in list(self.campaigns.values()):
+                    if (campaign["status"] in ("scheduled", "running") and campaign["start_at"] <= now
+                            and campaign["id"] not in self._tasks):
+                        task = asyncio.create_task(self._run_campaign(campaign))
+                        self._tasks[campaign["id"]] = task
+                        task.add_done_callback(lambda _, cid=campaign["id"]: self._tasks.pop(cid, None))
+                await asyncio.sleep(check_interval)
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        """Остановка идущих кампаний и отзывов с сохранением прогресса (продолжатся после перезапуска)"""
+        tasks = list(self._tasks.values()) + list(self._recalls.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self.save()
+
+    async def _collect_shards(self):
+        """Прогресс кампаний по файлам воркеров; кампания завершена, когда закончили все воркеры"""
+        for campaign in list(self.campaigns.values()):
+            if campaign["status"] != "running":
+                continue
+            shards = [self._load_shard(campaign["id"], index) for index in range(self.shard[1])]
+            campaign["sent"] = sum(progress["sent"] for progress in shards)
+            campaign["errors"] = sum(progress["errors"] for progress in shards)
+            if all(progress["done"] for progress in shards):
+                campaign["status"] = "done"
+                self.save()
+                await self._finish(campaign)
+
+    async def _run_campaign(self, campaign: dict):
+        """Отправка кампании (в многопроцессном режиме - своим пользователям) с равномерным шагом до конца окна"""
+        include, exclude = campaign["include"], campaign["exclude"]
+        progress = campaign if self.shard is None else self._load_shard(campaign["id"], self.shard[0])
+        if progress.get("done"):
+            return
+        sent = self._load_sent(campaign["id"])
+        # Счетчик сохраняется раз в 20 отправок - после аварийной остановки берем его из журнала
+        progress["sent"] = max(progress["sent"], len(sent) - progress["errors"])
+        if campaign["status"] == "scheduled":
+            print(f"Запуск кампании рассылки {campaign['id']}")
+        else:
+            print(f"Продолжение кампании рассылки {campaign['id']}: уже отправлено {len(sent)}")
+        if self.owner:
+            campaign["status"] = "running"
+            self.save()
+
+        end_at = campaign["start_at"] + campaign["window"]
+        shards = self.shard[1] if self.shard else 1
+        remaining = max(self.audience.count_recipients(include, exclude) // shards - len(sent), 1)
+        interval = max((end_at - time.time()) / remaining, MIN_SEND_INTERVAL)
+        next_send = time.monotonic()
+
+        with open(self._sent_file(campaign["id"]), 'a', encoding='utf-8') as sent_log:
+            for user_id, chat_id in self.audience.iter_recipients(include, exclude):
+                if user_id in sent or not self._in_shard(user_id):
+                    continue
+                delay = next_send - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                next_send = max(next_send + interval, time.monotonic())
+
+                try:
+                    await self.send(user_id, chat_id, campaign["id"])
+                    progress["sent"] += 1
+                except Exception as e:
+                    progress["errors"] += 1
+                    print(f"Ошибка отправки пользователю {user_id} (кампания {campaign['id']}): {e}")
+                # Отмечаем получателя сразу, чтобы после перезапуска не отправить повторно
+                sent_log.write(f"{user_id}\n")
+                sent_log.flush()
+                sent.add(user_id)
+                if (progress["sent"] + progress["errors"]) % 20 == 0:
+                    self._save_progress(campaign, progress)
+
+        if self.shard is not None:
+            # Итог по всем воркерам подводит воркер администратора (_collect_shards)
+            progress["done"] = True
+            self._save_progress(campaign, progress)
+            print(f"Кампания рассылки {campaign['id']}: воркер {self.shard[0]} отправил {progress['sent']}")
+            return
+        campaign["status"] = "done"
+        self.save()
+        await self._finish(campaign)
+
+    async def _finish(self, campaign: dict):
+        """Отчет о завершенной кампании"""
+        print(f"Кампания рассылки {campaign['id']} завершена: отправлено {campaign['sent']}")
+        if campaign.get("report_chat_id"):
+            await self.report(
+                campaign["report_chat_id"],
+                f"✅ Кампания {campaign['id']} завершена!\n\n"
+                f"Успешно: {campaign['sent']}\n"
+                f"Ошибок: {campaign['errors']}"
+            )
+
+    def _recall_progress(self, campaign: dict) -> str:
+        recall = campaign["recall"]
+        processed = recall["deleted"] + recall["missing"]
+        purged = self.purged_count(campaign["id"])
+        return (
+            f"обработано {processed} из {recall['total']}: удалено {recall['deleted']}, "
+            f"уже удалены {recall['missing']}, ошибок {recall['failed']}"
+            + (f"; снято с очереди без отправки {purged}" if purged else "")
+        )
+
+    async def _run_recall(self, campaign: dict):
+        """
+        Удаление сообщений кампании: concurrency воркеров с общим темпом rate запросов в секунду.
+        Удаленные (и уже отсутствующие) сообщения отмечаются в <id>.recalled; сообщения,
+        которые не удалось удалить за RECALL_MAX_ATTEMPTS попыток, остаются для повторного отзыва
+        """
+        recall = campaign["recall"]
+        # Счетчики восстанавливаются по журналу: после аварийной остановки они могли не сохраниться
+        done = dict(line.split(" ", 1) for line in self._read_lines(self._recalled_file(campaign["id"])))
+        recall["deleted"] = sum(1 for status in done.values() if status == str(STATUS_DELETED))
+        recall["missing"] = len(done) - recall["deleted"]
+        recall["failed"] = 0
+        message_ids = self.message_ids(campaign["id"])
+        pending = deque(mid for mid in message_ids if mid not in done)
+        recall["total"] = len(message_ids)
+        print(f"Отзыв кампании {campaign['id']}: осталось удалить {len(pending)} из {len(message_ids)}")
+
+        interval = 1 / max(recall["rate"], 0.1)
+        next_slot = time.monotonic()
+        last_report = time.monotonic()
+
+        async def delete_with_retry(message_id: str):
+            nonlocal next_slot
+            status = None
+            for attempt in range(RECALL_MAX_ATTEMPTS):
+                # Общий темп всех воркеров: запросы идут не чаще одного за interval
+                slot = max(next_slot, time.monotonic())
+                next_slot = slot + interval
+                delay = slot - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                status = await self.delete(message_id)
+                # 429, ошибки сервера и сети - повтор с растущей паузой, остальные ответы окончательные
+                if status is not None and status != 429 and status < 500:
+                    return status
+                await asyncio.sleep(min(2 ** attempt, 30))
+            return status
+
+        async def worker(recalled_log):
+            nonlocal last_report
+            while pending:
+                message_id = pending.popleft()
+                status = await delete_with_retry(message_id)
+                if status == STATUS_DELETED:
+                    recall["deleted"] += 1
+                elif status == STATUS_MISSING:
+                    recall["missing"] += 1
+                else:
+                    recall["failed"] += 1
+                    continue
+                recalled_log.write(f"{message_id} {status}\n")
+                recalled_log.flush()
+                if time.monotonic() - last_report >= RECALL_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    self.save()
+                    if recall.get("report_chat_id"):
+                        await self.report(recall["report_chat_id"],
+                                          f"🗑 Отзыв кампании {campaign['id']}: {self._recall_progress(campaign)}")
+
+        try:
+            with open(self._recalled_file(campaign["id"]), 'a', encoding='utf-8') as recalled_log:
+                known = set(message_ids)
+                while True:
+                    await asyncio.gather(*(worker(recalled_log) for _ in range(max(recall["concurrency"], 1))))
+                    # Дочищаем сообщения, попавшие в индекс во время отзыва (доставка из очереди исходящих)
+                    await asyncio.sleep(RECALL_SETTLE)
+                    message_ids = self.message_ids(campaign["id"])
+                    pending.extend(mid for mid in message_ids if mid not in known)
+                    known.update(message_ids)
+                    recall["total"] = len(message_ids)
+                    if not pending:
+                        break
+        finally:
+            self.save()
+
+        recall["status"] = "done"
+        self.save()
+        print(f"Отзыв кампании {campaign['id']} завершен: {self._recall_progress(campaign)}")
+        if recall.get("report_chat_id"):
+            retry = f"\nПовторить для неудаленных: /recall {campaign['id']}" if recall["failed"] else ""
+            await self.report(recall["report_chat_id"],
+                              f"✅ Отзыв кампании {campaign['id']} завершен: {self._recall_progress(campaign)}{retry}")
@@ -0,0 +1,129 @@
+"""
+Быстрое восстановление после перезапуска
+
+Маркер последних полученных обновлений и последние обработанные callback_id
+сохраняются на диск, поэтому после перезапуска бот продолжает с того же места,
+а повторно доставленные нажатия кнопок не обрабатываются второй раз.
+События, созданные до запуска бота (накопившиеся за время простоя), считаются
+догоняющими: устаревшие нажатия кнопок отбрасываются, сообщения обрабатываются.
+"""
+import os
+import json
+import time
+import functools
+from collections import OrderedDict
+from utils.metrics import metrics
+
+
+class RecentIds:
+    """Множество последних идентификаторов ограниченного размера (старые вытесняются)"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._ids = OrderedDict()
+
+    def __contains__(self, item) -> bool:
+        return item in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __iter__(self):
+        return iter(self._ids)
+
+    def add(self, item):
+        self._ids[item] = None
+        self._ids.move_to_end(item)
+        while len(self._ids) > self.limit:
+            self._ids.popitem(last=False)
+
+
+class UpdatesState:
+    def __init__(self, file_path: str, callbacks_limit: int = 1000):
+        self.file_path = file_path
+        self.processed_callbacks = RecentIds(callbacks_limit)
+        self.saved_marker = None
+
+    def load(self):
+        """Загрузка сохраненного маркера и обработанных callback_id. Возвращает маркер"""
+        try:
+            if os.path.exists(self.file_path):
+                with open(self.file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self.saved_marker = data.get("marker")
+                for callback_id in data.get("callbacks", []):
+                    self.processed_callbacks.add(callback_id)
+        except Exception as e:
+            print(f"Ошибка загрузки состояния обновлений: {e}")
+        return self.saved_marker
+
+    def save(self, marker):
+        """Сохранение маркера и callback_id (атомарно через временный файл)"""
+        temp_file = self.file_path + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({"marker": marker, "callbacks": list(self.processed_callbacks)}, f)
+            os.replace(temp_file, self.file_path)
+            self.saved_marker = marker
+        except Exception as e:
+            print(f"Ошибка сохранения состояния обновлений: {e}")
+
+
+class CatchUp:
+    def __init__(self, stale_after: float):
+        self.stale_after = stale_after  # Возраст нажатия кнопки, после которого оно устарело (секунды)
+        self.started_at = time.time()
+        self._started_monotonic = time.monotonic()
+        self.active = True
+        self.backlog = 0  # Догоняющих событий получено
+        self.dropped = 0  # Из них отброшено как устаревшие
+        self._idle_checks = 0
+
+        metrics.set_gauge("catchup_active", lambda: int(self.active))
+
+    def finish(self, reason: str):
+        """Завершение догоняющего режима"""
+        if not self.active:
+            return
+        self.active = False
+        elapsed = time.monotonic() - self._started_monotonic
+        metrics.set_gauge("catchup_seconds", elapsed)
+        print(
+            f"Догоняющий режим завершен ({reason}) за {elapsed:.1f} с: "
+            f"событий из очереди {self.backlog}, отброшено устаревших {self.dropped}"
+        )
+
+    def check_idle(self, pending: int):
+        """
+        Периодическая проверка: если догоняющие события были и все обработаны,
+        а новых нет два раза подряд - очередь обновлений разобрана
+        """
+        if not self.active or not self.backlog:
+            return
+        self._idle_checks = self._idle_checks + 1 if pending == 0 else 0
+        if self._idle_checks >= 2:
+            self.finish("очередь разобрана")
+
+    def filtered(self, drop_stale: bool):
+        """
+        Декоратор обработчика: учитывает догоняющие события и при drop_stale
+        отбрасывает те, что старше stale_after секунд
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(event):
+                timestamp = getattr(event, 'timestamp', None)
+                if self.active and timestamp is not None:
+                    created_at = timestamp / 1000
+                    if created_at >= self.started_at:
+                        self.finish("получено новое событие")
+                    else:
+                        self.backlog += 1
+                        metrics.inc("catchup_backlog")
+                        if drop_stale and time.time() - created_at > self.stale_after:
+                            self.dropped += 1
+                            metrics.inc("catchup_dropped_stale")
+                            return
+                await handler(event)
+            return wrapper
+        return decorator
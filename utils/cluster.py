@@ -0,0 +1,215 @@
+"""
+Многопроцессный режим: один процесс получает обновления, N процессов их обрабатывают
+
+Главный процесс забирает обновления из MAX API и раздает их воркерам по user_id
+(все события пользователя всегда попадают в один и тот же процесс, поэтому порядок
+и состояние диалога сохраняются). Воркеры запускаются через spawn и принимают
+сырые обновления через очереди multiprocessing. Упавший воркер перезапускается.
+
+Маркер обновлений сохраняется только после того, как воркеры подтвердили обработку:
+каждое обновление получает номер, воркер подтверждает номер последнего полученного
+обновления, когда все полученные обработаны, а сохраняется маркер последней пачки,
+все обновления которой подтверждены. Неподтвержденные обновления упавшего воркера
+передаются перезапущенному воркеру заново (повтор, как после перезапуска бота).
+"""
+import os
+import zlib
+import asyncio
+import multiprocessing
+from collections import deque
+from queue import Empty, Full
+from utils.metrics import metrics
+
+# Пауза перед повтором запроса обновлений после ошибки (секунды)
+POLL_RETRY_DELAY = 3
+# Как часто главный процесс разбирает подтверждения, а воркер их отправляет (секунды)
+ACK_INTERVAL = 0.5
+# Как часто проверять место в заполненной очереди воркера (секунды)
+QUEUE_FULL_RETRY = 0.05
+
+
+def update_user_id(update: dict):
+    """user_id из сырого обновления (callback, сообщение или событие пользователя)"""
+    callback = update.get("callback") or {}
+    if callback.get("user"):
+        return callback["user"].get("user_id")
+    message = update.get("message") or {}
+    if message.get("sender"):
+        return message["sender"].get("user_id")
+    if update.get("user"):
+        return update["user"].get("user_id")
+    return None
+
+
+def shard_index(key, workers: int) -> int:
+    """Номер воркера для пользователя (стабильный между перезапусками)"""
+    return zlib.crc32(str(key).encode()) % workers
+
+
+class Cluster:
+    def __init__(self, workers: int, worker_target, queue_size: int, on_marker=None):
+        self.workers_count = workers
+        self.worker_target = worker_target  # функция target(index, queue, acks), импортируемая из модуля
+        self.queue_size = queue_size
+        self.on_marker = on_marker  # on_marker(marker) - сохранение маркера, обработанного воркерами
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.acks = self._context.Queue()  # (номер воркера, номер последнего обработанного обновления)
+        self.processes = [None] * workers
+        self._stopping = False
+        self._seq = 0  # Номер последнего переданного обновления
+        self._unacked = [deque() for _ in range(workers)]  # (номер, обновление), не подтвержденные воркером
+        self._batches = deque()  # (номер последнего обновления пачки, маркер после пачки)
+        self._saved_marker = None
+
+        metrics.set_gauge("cluster_workers_alive", lambda: sum(1 for p in self.processes if p and p.is_alive()))
+
+    def _start_worker(self, index: int):
+        process = self._context.Process(
+            target=self.worker_target, args=(index, self.queues[index], self.acks), name=f"bot-worker-{index}"
+        )
+        # Номер воркера нужен уже при импорте модуля бота (имена файлов процесса)
+        os.environ["BOT_WORKER_INDEX"] = str(index)
+        try:
+            process.start()
+        finally:
+            del os.environ["BOT_WORKER_INDEX"]
+        self.processes[index] = process
+        print(f"Воркер {index} запущен (pid {process.pid})")
+
+    def start(self):
+        """Запуск процессов-воркеров"""
+        for index in range(self.workers_count):
+            self._start_worker(index)
+
+    def check_workers(self):
+        """
+        Перезапуск упавших воркеров. Очередь упавшего воркера заменяется новой, в которую
+        заново передаются все его неподтвержденные обновления (и взятые им, и еще не взятые)
+        """
+        if self._stopping:
+            return
+        self.collect_acks()
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                metrics.inc("cluster_worker_restarts")
+                unacked = self._unacked[index]
+                print(f"⚠️ Воркер {index} завершился (код {process.exitcode}), перезапускаю; "
+                      f"повторно передается обновлений: {len(unacked)}")
+                self.queues[index].cancel_join_thread()
+                queue = self._context.Queue(maxsize=max(self.queue_size, len(unacked)))
+                for item in unacked:
+                    queue.put_nowait(item)
+                self.queues[index] = queue
+                self._start_worker(index)
+
+    async def dispatch(self, update: dict):
+        """Передача обновления воркеру пользователя (ждет, если очередь воркера заполнена)"""
+        user_id = update_user_id(update)
+        index = shard_index(user_id if user_id is not None else 0, self.workers_count)
+        self._seq += 1
+        item = (self._seq, update)
+        self._unacked[index].append(item)
+        queue = self.queues[index]
+        while True:
+            if queue is not self.queues[index]:
+                # Воркер перезапущен, пока ждали места, - обновление уже в новой очереди
+                break
+            try:
+                queue.put_nowait(item)
+                break
+            except Full:
+                # Очередь полна - ждем места, не блокируя event loop и следя за воркером
+                metrics.inc("cluster_queue_full")
+                await asyncio.sleep(QUEUE_FULL_RETRY)
+                self.check_workers()
+        metrics.inc("cluster_dispatched")
+
+    def collect_acks(self):
+        """Разбор подтверждений воркеров и сохранение маркера полностью обработанных пачек"""
+        while True:
+            try:
+                index, seq = self.acks.get_nowait()
+            except Empty:
+                break
+            unacked = self._unacked[index]
+            while unacked and unacked[0][0] <= seq:
+                unacked.popleft()
+        lowest = min((unacked[0][0] for unacked in self._unacked if unacked), default=self._seq + 1)
+        marker = self._saved_marker
+        while self._batches and self._batches[0][0] < lowest:
+            marker = self._batches.popleft()[1]
+        if marker != self._saved_marker:
+            self._saved_marker = marker
+            if self.on_marker:
+                self.on_marker(marker)
+
+    async def track_acks(self):
+        """Фоновый разбор подтверждений (маркер сохраняется и пока новых обновлений нет)"""
+        while True:
+            await asyncio.sleep(ACK_INTERVAL)
+            self.collect_acks()
+
+    async def poll(self, bot, marker):
+        """
+        Получение обновлений и раздача воркерам. Маркер пачки сохраняется через
+        on_marker, когда воркеры подтвердят обработку всех ее обновлений
+        """
+        self._saved_marker = marker
+        while True:
+            self.check_workers()
+            try:
+                events = await bot.get_updates(marker=marker)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Ошибка получения обновлений: {e}, повтор через {POLL_RETRY_DELAY} с")
+                await asyncio.sleep(POLL_RETRY_DELAY)
+                continue
+            for update in events.get("updates", []):
+                await self.dispatch(update)
+            if events.get("marker") is not None:
+                marker = events["marker"]
+                self._batches.append((self._seq, marker))
+                self.collect_acks()
+
+    async def stop(self, timeout: float):
+        """Остановка: воркеры дообрабатывают свои очереди и завершаются"""
+        self._stopping = True
+        loop = asyncio.get_running_loop()
+        for queue in self.queues:
+            # None - сигнал воркеру завершиться после уже полученных обновлений
+            await loop.run_in_executor(None, queue.put, None)
+        deadline = loop.time() + timeout
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            await loop.run_in_executor(None, process.join, max(deadline - loop.time(), 0.1))
+            if process.is_alive():
+                print(f"⚠️ Воркер {index} не завершился вовремя, останавливаю принудительно")
+                process.terminate()
+                await loop.run_in_executor(None, process.join, 5)
+        # Последние подтверждения: маркер сохраняется по фактически обработанным обновлениям
+        self.collect_acks()
+
+
+class WorkerAcks:
+    """Подтверждения обработки обновлений воркером для главного процесса"""
+
+    def __init__(self, index: int, acks):
+        self.index = index
+        self.acks = acks
+        self.received = 0  # Номер последнего полученного обновления
+        self.acked = 0
+
+    def flush(self, pending: int):
+        """Подтверждение всех полученных обновлений, если очереди обработки воркера пусты"""
+        if pending == 0 and self.received > self.acked:
+            self.acks.put((self.index, self.received))
+            self.acked = self.received
+
+    async def run(self, pending):
+        """Подтверждение обновлений, обработка которых закончилась позже их получения"""
+        while True:
+            await asyncio.sleep(ACK_INTERVAL)
+            self.flush(pending())
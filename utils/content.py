@@ -0,0 +1,245 @@
+"""
+Контент форума (тексты экранов, треки и расписание) из файла данных
+
+Файл разбирается и проверяется один раз, экраны (текст + кнопки) собираются заранее.
+Готовый снимок контента подменяется целиком одним присваиванием, поэтому обработчики
+всегда видят согласованную версию, а обновление не требует перезапуска бота.
+"""
+import os
+import re
+import json
+import zlib
+import asyncio
+from typing import NamedTuple
+
+# Кнопки под карточкой трека
+TRACK_SCREEN_BUTTONS = [
+    [
+        {"type": "callback", "text": "◀️ Назад к меню", "payload": "show_menu"},
+        {"type": "callback", "text": "❓ Задать вопрос спикеру", "payload": "send_question"}
+    ]
+]
+
+
+# Спикер и тема в строке расписания: "(Зал) Спикер: Имя — Формат — «Тема»"
+SPEAKER_RE = re.compile(r"Спикер:\s*([^—–]+?)\s*(?:[—–]|$)")
+TITLE_RE = re.compile(r"«(.+)»")
+
+
+class ContentError(Exception):
+    """Ошибка в файле контента"""
+
+
+class Screen(NamedTuple):
+    text: str
+    buttons: list
+
+
+class Talk(NamedTuple):
+    id: str  # Стабильный идентификатор (не меняется при правке других докладов)
+    track: str
+    speaker: str
+    time: str
+    title: str
+
+
+class ContentSnapshot:
+    def __init__(self, tracks: dict, screens: dict, version: float, talks: dict = None):
+        self.tracks = tracks  # ключ трека -> данные трека из файла
+        self.screens = screens  # имя экрана -> Screen
+        self.version = version  # mtime файла, из которого собран снимок
+        self.talks = talks or {}  # id доклада -> Talk (кому можно задать вопрос)
+
+    def screen(self, name: str):
+        """Готовый экран по имени (welcome, forum_info, menu, track:<ключ>, ask, ask:<ключ>) или None"""
+        return self.screens.get(name)
+
+
+def _require(data: dict, key: str, kind, where: str):
+    """Проверка наличия и типа поля"""
+    if not isinstance(data, dict):
+        raise ContentError(f"{where}: ожидается объект")
+    if key not in data:
+        raise ContentError(f"{where}: нет поля '{key}'")
+    if not isinstance(data[key], kind):
+        raise ContentError(f"{where}: поле '{key}' должно быть {kind.__name__}")
+    return data[key]
+
+
+def _compile_buttons(rows: list, links: dict, where: str) -> list:
+    """Проверка кнопок и подстановка ссылок из настроек ({registration_url} и т.п.)"""
+    compiled = []
+    for row in rows:
+        if not isinstance(row, list):
+            raise ContentError(f"{where}: строка кнопок должна быть списком")
+        compiled_row = []
+        for button in row:
+            if not isinstance(button, dict):
+                raise ContentError(f"{where}: кнопка должна быть объектом")
+            button_type = _require(button, "type", str, where)
+            _require(button, "text", str, where)
+            button = dict(button)
+            if button_type == "link":
+                try:
+                    button["url"] = _require(button, "url", str, where).format_map(links)
+                except KeyError as e:
+                    raise ContentError(f"{where}: неизвестная подстановка {e} в ссылке")
+            elif button_type == "callback":
+                _require(button, "payload", str, where)
+            compiled_row.append(button)
+        compiled.append(compiled_row)
+    return compiled
+
+
+def _track_text(track: dict) -> str:
+    """Текст карточки трека"""
+    text = f"{track['name']}\n\n{track['description']}\n\n"
+
+    # Добавляем спикеров
+    if track['speakers']:
+        text += "Спикеры:\n"
+        for speaker in track['speakers']:
+            text += f"• {speaker['name']} ({speaker['time']})\n"
+            if speaker.get('bio'):
+                text += f"  {speaker['bio']}\n"
+        text += "\n"
+
+    # Добавляем расписание
+    if track['schedule']:
+        text += "Расписание:\n"
+        for item in track['schedule']:
+            text += f"• {item['time']} - {item['event']}\n"
+    return text
+
+
+def _track_talks(key: str, track: dict) -> list:
+    """Доклады трека: спикеры из списка speakers и строки расписания со спикером"""
+    talks = []
+    items = [(speaker['name'], speaker['time'], speaker.get('bio', '')) for speaker in track['speakers']]
+    for item in track['schedule']:
+        match = SPEAKER_RE.search(item['event'])
+        if match:
+            title = TITLE_RE.search(item['event'])
+            items.append((match.group(1), item['time'], title.group(1) if title else ""))
+    for speaker, time, title in items:
+        talk_id = format(zlib.crc32(f"{key}|{time}|{speaker}".encode()), "08x")
+        talks.append(Talk(talk_id, key, speaker, time, title))
+    return talks
+
+
+def _question_screens(tracks: dict, talks: list, links: dict) -> dict:
+    """Экраны выбора трека и доклада для вопроса спикеру"""
+    screens = {}
+    track_buttons = []
+    for key, track in tracks.items():
+        track_talks = [talk for talk in talks if talk.track == key]
+        if not track_talks:
+            continue
+        track_buttons.append({"type": "callback", "text": track["button"], "payload": f"ask_track:{key}"})
+        buttons = [
+            [{"type": "callback", "text": f"{talk.time} {talk.speaker}", "payload": f"ask_talk:{talk.id}"}]
+            for talk in track_talks
+        ]
+        buttons.append([{"type": "callback", "text": "◀️ К трекам", "payload": "send_question"}])
+        screens[f"ask:{key}"] = Screen(f"{track['name']}\n\nВыберите спикера, которому хотите задать вопрос:", buttons)
+
+    buttons = [track_buttons[i:i + 2] for i in range(0, len(track_buttons), 2)]
+    if links.get("question_form_url"):
+        buttons.append([{"type": "link", "text": "Открыть форму для вопроса", "url": links["question_form_url"]}])
+    buttons.append([{"type": "callback", "text": "◀️ Назад к меню", "payload": "show_menu"}])
+    screens["ask"] = Screen("Выберите трек, спикеру которого хотите задать вопрос:", buttons)
+    return screens
+
+
+def compile_content(data: dict, links: dict, version: float = 0.0) -> ContentSnapshot:
+    """Проверка данных контента и сборка всех экранов"""
+    if not isinstance(data, dict):
+        raise ContentError("корень файла должен быть объектом")
+
+    tracks = _require(data, "tracks", dict, "контент")
+    if not tracks:
+        raise ContentError("нет ни одного трека")
+    for key, track in tracks.items():
+        where = f"трек {key}"
+        if not key.startswith("track_"):
+            raise ContentError(f"{where}: ключ трека должен начинаться с 'track_'")
+        if not isinstance(track, dict):
+            raise ContentError(f"{where}: описание трека должно быть объектом")
+        for field in ("button", "name", "description"):
+            _require(track, field, str, where)
+        track.setdefault("speakers", [])
+        track.setdefault("schedule", [])
+        for speaker in _require(track, "speakers", list, where):
+            _require(speaker, "name", str, where)
+            _require(speaker, "time", str, where)
+        for item in _require(track, "schedule", list, where):
+            _require(item, "time", str, where)
+            _require(item, "event", str, where)
+
+    # Меню треков: по две кнопки в строке и кнопка вопроса
+    track_buttons = [{"type": "callback", "text": track["button"], "payload": key} for key, track in tracks.items()]
+    menu_buttons = [track_buttons[i:i + 2] for i in range(0, len(track_buttons), 2)]
+    menu_buttons.append([{"type": "callback", "text": "❓ Отправить вопрос", "payload": "send_question"}])
+
+    welcome = _require(data, "welcome", dict, "контент")
+    forum_info = _require(data, "forum_info", dict, "контент")
+    menu = _require(data, "menu", dict, "контент")
+
+    screens = {
+        "welcome": Screen(
+            _require(welcome, "text", str, "welcome"),
+            _compile_buttons(welcome.get("buttons", []), links, "welcome")
+        ),
+        "forum_info": Screen(_require(forum_info, "text", str, "forum_info"), menu_buttons),
+        "menu": Screen(_require(menu, "text", str, "menu"), menu_buttons),
+    }
+    for key, track in tracks.items():
+        screens[f"track:{key}"] = Screen(_track_text(track), TRACK_SCREEN_BUTTONS)
+
+    talks = [talk for key, track in tracks.items() for talk in _track_talks(key, track)]
+    screens.update(_question_screens(tracks, talks, links))
+
+    return ContentSnapshot(tracks, screens, version, {talk.id: talk for talk in talks})
+
+
+class ContentStore:
+    def __init__(self, file_path: str, links: dict):
+        self.file_path = file_path
+        self.links = links  # Подстановки для ссылок в кнопках
+        self.current = None
+        self._seen_version = None  # mtime последней прочитанной версии файла (в т.ч. ошибочной)
+
+    def load(self) -> ContentSnapshot:
+        """Чтение, проверка и атомарная подмена контента (при ошибке остается прежний)"""
+        version = os.path.getmtime(self.file_path)
+        self._seen_version = version
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except ValueError as e:
+            raise ContentError(f"некорректный JSON: {e}")
+        snapshot = compile_content(data, self.links, version)
+        self.current = snapshot
+        return snapshot
+
+    def reload(self):
+        """Перезагрузка контента. Возвращает (успех, сообщение)"""
+        try:
+            snapshot = self.load()
+        except (ContentError, OSError) as e:
+            print(f"⚠️ Контент не обновлен, ошибка в {self.file_path}: {e}")
+            return False, str(e)
+        print(f"Контент обновлен из {self.file_path}: треков {len(snapshot.tracks)}")
+        return True, f"треков: {len(snapshot.tracks)}"
+
+    async def watch(self, interval: float):
+        """Перезагрузка контента при изменении файла"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = os.path.getmtime(self.file_path)
+            except OSError:
+                continue
+            # Ошибочная версия файла перечитывается только после следующего изменения
+            if version != self._seen_version:
+                self.reload()
@@ -0,0 +1,73 @@
+"""
+Выгрузка данных бота в CSV или XLSX и загрузка файла в MAX
+
+Строки читаются из секций Excel в режиме read_only и пишутся в файл порциями
+(CSV или XLSX в режиме write_only), поэтому расход памяти не зависит от количества
+строк. Готовый файл загружается в MAX (POST /uploads?type=file) потоком с диска.
+"""
+import os
+import csv
+import aiohttp
+from utils.sheets import SHEETS
+
+# Листы для выгрузки: аргумент команды -> название листа
+EXPORT_SHEETS = {"questions": "Вопросы", "feedback": "Отзывы"}
+# Строк, записываемых в CSV за один раз
+CHUNK_ROWS = 1000
+# Таймаут загрузки файла в MAX (секунды)
+UPLOAD_TIMEOUT = 300
+
+
+def export_csv(excel_manager, title: str, target_path: str) -> int:
+    """Выгрузка листа всех секций в CSV порциями. Возвращает количество строк"""
+    temp_file = target_path + '.tmp'
+    count = 0
+    # utf-8-sig и ";" - чтобы Excel с русской локалью открывал файл без настройки импорта
+    with open(temp_file, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(SHEETS[title])
+        chunk = []
+        for row in excel_manager.iter_rows(title):
+            chunk.append(["" if value is None else value for value in row])
+            if len(chunk) >= CHUNK_ROWS:
+                writer.writerows(chunk)
+                count += len(chunk)
+                chunk.clear()
+        writer.writerows(chunk)
+        count += len(chunk)
+    os.replace(temp_file, target_path)
+    print(f"Лист '{title}' выгружен в {target_path}: {count} строк")
+    return count
+
+
+async def upload_file(session: aiohttp.ClientSession, api_base_url: str, bot_token: str, file_path: str):
+    """
+    Загрузка файла в MAX: POST /uploads?type=file -> URL для загрузки -> multipart с полем data.
+    Возвращает токен для вложения типа file или None
+    """
+    headers = {"Authorization": bot_token}
+    async with session.post(f"{api_base_url}/uploads", headers=headers, params={"type": "file"}) as response:
+        if response.status != 200:
+            error_text = await response.text()
+            print(f"⚠️ Ошибка получения URL для загрузки файла: {response.status} - {error_text[:200]}")
+            return None
+        upload_url = (await response.json()).get("url")
+    if not upload_url:
+        return None
+
+    timeout = aiohttp.ClientTimeout(total=UPLOAD_TIMEOUT)
+    with open(file_path, 'rb') as f:
+        # Файл передается объектом - aiohttp читает и отправляет его частями
+        form = aiohttp.FormData()
+        form.add_field("data", f, filename=os.path.basename(file_path))
+        async with session.post(upload_url, headers=headers, data=form, timeout=timeout) as response:
+            if response.status != 200:
+                error_text = await response.text()
+                print(f"⚠️ Ошибка загрузки файла: {response.status} - {error_text[:200]}")
+                return None
+            result = await response.json(content_type=None)
+
+    token = result.get("token") if isinstance(result, dict) else None
+    if not token:
+        print(f"⚠️ В ответе на загрузку нет токена файла: {str(result)[:200]}")
+    return token
@@ -0,0 +1,136 @@
+"""
+Кэш токенов загруженных изображений (графика треков)
+
+Изображение по URL один раз скачивается и загружается в MAX через /uploads,
+полученный токен хранится с TTL в памяти и в JSON файле и переиспользуется
+при отправке сообщений вместо повторной передачи URL.
+"""
+import os
+import json
+import time
+import asyncio
+import aiohttp
+
+
+class ImageTokenCache:
+    def __init__(self, api_base_url: str, bot_token: str, cache_file: str, ttl: int):
+        self.api_base_url = api_base_url
+        self.bot_token = bot_token
+        self.cache_file = cache_file
+        self.ttl = ttl  # Время жизни токена в секундах
+        self._tokens = {}  # image_url -> {"token": ..., "uploaded_at": ...}
+        self._pending = {}  # image_url -> задача загрузки (одна на URL)
+        self._load()
+
+    def _load(self):
+        """Загрузка сохраненных токенов из файла"""
+        try:
+            if os.path.exists(self.cache_file):
+                with open(self.cache_file, 'r', encoding='utf-8') as f:
+                    self._tokens = json.load(f)
+        except Exception as e:
+            print(f"Ошибка загрузки кэша изображений: {e}")
+            self._tokens = {}
+
+    def _save(self):
+        """Сохранение токенов в файл (атомарно через временный файл)"""
+        temp_file = self.cache_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self._tokens, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            print(f"Ошибка сохранения кэша изображений: {e}")
+            if os.path.exists(temp_file):
+                try:
+                    os.remove(temp_file)
+                except:
+                    pass
+
+    def get(self, image_url: str):
+        """Токен изображения, если он есть и не устарел (без сетевых запросов)"""
+        entry = self._tokens.get(image_url)
+        if not entry:
+            return None
+        if time.time() - entry.get("uploaded_at", 0) > self.ttl:
+            return None
+        return entry.get("token")
+
+    def invalidate(self, image_url: str):
+        """Сброс токена (например, если API его больше не принимает)"""
+        if self._tokens.pop(image_url, None):
+            self._save()
+
+    def schedule_upload(self, session: aiohttp.ClientSession, image_url: str):
+        """Фоновая загрузка изображения, если токена нет (не ждет результата)"""
+        if not image_url or self.get(image_url) or image_url in self._pending:
+            return
+        task = asyncio.create_task(self._upload(session, image_url))
+        self._pending[image_url] = task
+        task.add_done_callback(lambda _: self._pending.pop(image_url, None))
+
+    async def warm_up(self, session: aiohttp.ClientSession, image_urls):
+        """Загрузка всех изображений без актуального токена (при старте бота)"""
+        for image_url in set(image_urls):
+            self.schedule_upload(session, image_url)
+        if self._pending:
+            await asyncio.gather(*self._pending.values(), return_exceptions=True)
+
+    async def _upload(self, session: aiohttp.ClientSession, image_url: str):
+        """
+        Скачивание изображения по URL и загрузка в MAX:
+        POST /uploads?type=image -> URL для загрузки -> multipart с полем data -> токен
+        """
+        headers = {"Authorization": self.bot_token}
+        try:
+            async with session.get(image_url) as response:
+                if response.status != 200:
+                    print(f"⚠️ Не удалось скачать изображение {image_url}: {response.status}")
+                    return None
+                image_data = await response.read()
+                content_type = response.headers.get("Content-Type", "image/jpeg")
+
+            async with session.post(f"{self.api_base_url}/uploads", headers=headers,
+                                    params={"type": "image"}) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    print(f"⚠️ Ошибка получения URL для загрузки: {response.status} - {error_text[:200]}")
+                    return None
+                upload_url = (await response.json()).get("url")
+            if not upload_url:
+                return None
+
+            form = aiohttp.FormData()
+            filename = os.path.basename(image_url.split('?')[0]) or "image.jpg"
+            form.add_field("data", image_data, filename=filename, content_type=content_type)
+            async with session.post(upload_url, headers=headers, data=form) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    print(f"⚠️ Ошибка загрузки изображения: {response.status} - {error_text[:200]}")
+                    return None
+                result = await response.json(content_type=None)
+
+            token = self._extract_token(result)
+            if not token:
+                print(f"⚠️ В ответе на загрузку нет токена изображения: {str(result)[:200]}")
+                return None
+
+            self._tokens[image_url] = {"token": token, "uploaded_at": time.time()}
+            self._save()
+            print(f"Изображение загружено в MAX: {image_url}")
+            return token
+        except Exception as e:
+            print(f"⚠️ Исключение при загрузке изображения {image_url}: {e}")
+            return None
+
+    @staticmethod
+    def _extract_token(result):
+        """Токен из ответа на загрузку: {"token": ...} или {"photos": {"<id>": {"token": ...}}}"""
+        if not isinstance(result, dict):
+            return None
+        if result.get("token"):
+            return result["token"]
+        for photo in (result.get("photos") or {}).values():
+            if isinstance(photo, dict) and photo.get("token"):
+                return photo["token"]
+        return None
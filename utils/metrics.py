@@ -0,0 +1,46 @@
+"""
+Простые метрики бота: счетчики и показатели (gauges)
+
+Показатели могут задаваться функцией - значение считается в момент снятия снимка.
+Снимок метрик доступен администратору командой /metrics.
+"""
+
+
+class Metrics:
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+
+    def inc(self, name: str, value: int = 1):
+        """Увеличение счетчика"""
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name: str, value):
+        """Установка значения показателя (число или функция без аргументов)"""
+        self._gauges[name] = value
+
+    def snapshot(self) -> dict:
+        """Текущие значения всех метрик"""
+        result = dict(self._counters)
+        for name, value in self._gauges.items():
+            try:
+                result[name] = value() if callable(value) else value
+            except Exception as e:
+                result[name] = f"ошибка: {e}"
+        return result
+
+    def format(self) -> str:
+        """Снимок метрик в виде текста для сообщения"""
+        snapshot = self.snapshot()
+        if not snapshot:
+            return "Метрик пока нет"
+        lines = []
+        for name in sorted(snapshot):
+            value = snapshot[name]
+            if isinstance(value, float):
+                value = f"{value:.3f}"
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+
+metrics = Metrics()
@@ -0,0 +1,274 @@
+"""
+Защита от недоступности MAX API: предохранитель (circuit breaker) и очередь исходящих сообщений
+
+После серии ошибок предохранитель размыкается и запросы к API сразу отклоняются,
+а исходящие сообщения складываются в журнал на диске. Фоновая задача отправляет их
+после восстановления API с сохранением порядка внутри каждого чата.
+"""
+import os
+import json
+import time
+import asyncio
+from collections import Counter, OrderedDict, deque
+
+# Пауза перед записью журнала (секунды): записи, накопленные за это время, сбрасываются
+# на диск одной записью с одним fsync в пуле потоков, а не на каждое сообщение в цикле событий
+FLUSH_DELAY = 0.05
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, recovery_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout  # Секунды до пробного запроса
+        self.failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+    @property
+    def state(self) -> str:
+        """closed - запросы идут, open - отклоняются, half_open - ждем пробный запрос"""
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.recovery_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос (в полуоткрытом состоянии пропускается один пробный)"""
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open":
+            # Пробный запрос один; зависший пробный запрос не блокирует следующий
+            now = time.monotonic()
+            if self._probe_started_at is None or now - self._probe_started_at >= self.recovery_timeout:
+                self._probe_started_at = now
+                return True
+        return False
+
+    def record_success(self):
+        """Успешный запрос - предохранитель замыкается"""
+        if self._opened_at is not None:
+            print("✅ MAX API снова доступен, предохранитель замкнут")
+        self.failures = 0
+        self._opened_at = None
+        self._probe_started_at = None
+
+    def record_failure(self):
+        """Ошибка запроса - после failure_threshold ошибок подряд предохранитель размыкается"""
+        self.failures += 1
+        self._probe_started_at = None
+        if self._opened_at is not None or self.failures >= self.failure_threshold:
+            if self._opened_at is None:
+                print(f"⚠️ MAX API недоступен ({self.failures} ошибок подряд), сообщения уходят в очередь")
+            self._opened_at = time.monotonic()
+
+
+class Outbox:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self._queues = OrderedDict()  # chat_id -> deque[(id, body, campaign_id)]
+        self._next_id = 1
+        self._campaigns = Counter()  # campaign_id -> сообщений кампании в очереди
+        self._buffer = []  # Записи журнала, еще не сброшенные на диск
+        self._compact_needed = False  # Журнал нужно перезаписать целиком (очередь опустела)
+        self._flush_task = None
+        self._load()
+
+    def __len__(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _load(self):
+        """Восстановление неотправленных сообщений из журнала"""
+        if not os.path.exists(self.file_path):
+            return
+        pending = OrderedDict()  # id -> (chat_id, body, campaign_id)
+        try:
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка (сбой во время записи)
+                        continue
+                    if record.get("op") == "add":
+                        pending[record["id"]] = (record["chat_id"], record["body"], record.get("campaign"))
+                    elif record.get("op") == "done":
+                        pending.pop(record["id"], None)
+        except Exception as e:
+            print(f"Ошибка загрузки очереди исходящих сообщений: {e}")
+            return
+
+        for message_id, (chat_id, body, campaign_id) in pending.items():
+            self._queues.setdefault(chat_id, deque()).append((message_id, body, campaign_id))
+            self._next_id = max(self._next_id, message_id + 1)
+            if campaign_id:
+                self._campaigns[campaign_id] += 1
+        self._compact()
+        if pending:
+            print(f"В очереди исходящих сообщений: {len(pending)}")
+
+    @staticmethod
+    def _add_record(message_id: int, chat_id, body: dict, campaign_id: str = None) -> dict:
+        record = {"op": "add", "id": message_id, "chat_id": chat_id, "body": body}
+        if campaign_id:
+            record["campaign"] = campaign_id
+        return record
+
+    def _snapshot(self) -> list:
+        """Записи журнала для всех неотправленных сообщений"""
+        return [self._add_record(message_id, chat_id, body, campaign_id)
+                for chat_id, queue in self._queues.items()
+                for message_id, body, campaign_id in queue]
+
+    def _write(self, records: list):
+        """Дозапись пачки записей в журнал с принудительным сбросом на диск"""
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, records: list):
+        """Перезапись журнала только с неотправленными сообщениями"""
+        temp_file = self.file_path + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.file_path)
+
+    def _compact(self):
+        self._rewrite(self._snapshot())
+
+    def _append(self, record: dict):
+        """Запись в журнал: накапливается и сбрасывается на диск группой через FLUSH_DELAY"""
+        self._buffer.append(record)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flush_task is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Вне цикла событий (скрипты) - пишем сразу
+            self._flush_sync()
+            return
+        self._flush_task = loop.create_task(self._flush_later())
+
+    def _flush_sync(self):
+        if self._compact_needed:
+            self._compact_needed = False
+            self._buffer = []
+            self._compact()
+        elif self._buffer:
+            records, self._buffer = self._buffer, []
+            self._write(records)
+
+    async def _flush_later(self):
+        """
+        Групповая запись журнала. Записи снимаются с буфера в цикле событий, а пишутся в пуле
+        потоков; пока идет запись, новые записи копятся для следующей пачки, порядок сохраняется
+        """
+        try:
+            await asyncio.sleep(FLUSH_DELAY)
+            loop = asyncio.get_running_loop()
+            while self._buffer or self._compact_needed:
+                if self._compact_needed:
+                    # Снимок текущей очереди уже учитывает все накопленные записи
+                    self._compact_needed = False
+                    self._buffer = []
+                    try:
+                        await loop.run_in_executor(None, self._rewrite, self._snapshot())
+                    except OSError:
+                        self._compact_needed = True
+                        raise
+                else:
+                    records, self._buffer = self._buffer, []
+                    try:
+                        await loop.run_in_executor(None, self._write, records)
+                    except OSError:
+                        # Пачка запишется со следующей записью журнала
+                        self._buffer = records + self._buffer
+                        raise
+        except OSError as e:
+            print(f"Ошибка записи очереди исходящих сообщений: {e}")
+        finally:
+            self._flush_task = None
+
+    async def flush(self):
+        """Сброс накопленных записей журнала на диск (при остановке бота)"""
+        while self._flush_task is not None:
+            await asyncio.shield(self._flush_task)
+        self._flush_sync()
+
+    def has_pending(self, chat_id) -> bool:
+        """Есть ли неотправленные сообщения для чата (новые сообщения должны идти после них)"""
+        return chat_id in self._queues
+
+    def put(self, chat_id, body: dict, campaign_id: str = None) -> int:
+        """
+        Добавление сообщения в очередь чата. campaign_id - кампания рассылки, в индекс которой
+        попадет id сообщения после отправки
+        """
+        message_id = self._next_id
+        self._next_id += 1
+        self._append(self._add_record(message_id, chat_id, body, campaign_id))
+        self._queues.setdefault(chat_id, deque()).append((message_id, body, campaign_id))
+        if campaign_id:
+            self._campaigns[campaign_id] += 1
+        return message_id
+
+    def campaigns(self) -> list:
+        """Кампании рассылки, сообщения которых ждут в очереди"""
+        return list(self._campaigns)
+
+    def discard(self, campaign_id: str) -> int:
+        """Удаление из очереди всех неотправленных сообщений кампании (отзыв рассылки). Возвращает их число"""
+        if not self._campaigns.pop(campaign_id, 0):
+            return 0
+        removed = 0
+        for chat_id in list(self._queues):
+            queue = self._queues[chat_id]
+            kept = deque(item for item in queue if item[2] != campaign_id)
+            for message_id, _, item_campaign in queue:
+                if item_campaign == campaign_id:
+                    self._buffer.append({"op": "done", "id": message_id})
+                    removed += 1
+            if kept:
+                self._queues[chat_id] = kept
+            else:
+                del self._queues[chat_id]
+        if not self._queues:
+            self._compact_needed = True
+        self._schedule_flush()
+        return removed
+
+    def chats(self) -> list:
+        """Чаты с неотправленными сообщениями (в порядке появления)"""
+        return list(self._queues.keys())
+
+    def peek(self, chat_id):
+        """Первое неотправленное сообщение чата: (id, body, campaign_id) или None"""
+        queue = self._queues.get(chat_id)
+        return queue[0] if queue else None
+
+    def ack(self, chat_id, message_id: int):
+        """Отметка об отправке первого сообщения чата"""
+        queue = self._queues.get(chat_id)
+        if not queue or queue[0][0] != message_id:
+            return
+        _, _, campaign_id = queue.popleft()
+        if campaign_id:
+            self._campaigns[campaign_id] -= 1
+            if self._campaigns[campaign_id] <= 0:
+                del self._campaigns[campaign_id]
+        if not queue:
+            del self._queues[chat_id]
+        if self._queues:
+            self._append({"op": "done", "id": message_id})
+        else:
+            # Очередь пуста - журнал можно обнулить
+            self._compact_needed = True
+            self._schedule_flush()
@@ -0,0 +1,153 @@
+"""
+Профилирование работающего бота по команде администратора
+
+cProfile включается на заданное число секунд (профилируется event loop - все
+обработчики), результат сохраняется в .prof файл (открывается snakeviz/pstats)
+и кратко отправляется в чат. Снимки tracemalloc сравниваются с предыдущим снимком,
+чтобы было видно, где растет память.
+"""
+import os
+import time
+import pstats
+import asyncio
+import cProfile
+import tracemalloc
+
+# Максимальная длительность профилирования (секунды)
+MAX_PROFILE_SECONDS = 600
+# Количество строк в кратком отчете
+SUMMARY_LINES = 15
+# Глубина стека, сохраняемая tracemalloc для каждого выделения памяти
+TRACEMALLOC_FRAMES = 5
+
+
+def _short_path(path: str) -> str:
+    """Путь файла без каталога site-packages/проекта для краткого отчета"""
+    for marker in ("site-packages" + os.sep, os.getcwd() + os.sep):
+        if marker in path:
+            return path.split(marker, 1)[1]
+    return path
+
+
+class Profiler:
+    def __init__(self, directory: str, report):
+        self.directory = directory
+        self.report = report  # корутина report(chat_id, text) - отчет администратору
+        self._profile = None
+        self._task = None
+        self._started_at = None
+        self._chat_id = None
+        self._last_snapshot = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    def _path(self, prefix: str, ext: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f"{prefix}_{time.strftime('%Y%m%d_%H%M%S')}.{ext}")
+
+    def start(self, seconds: float, chat_id):
+        """Запуск cProfile на seconds секунд (по окончании отчет отправляется в chat_id)"""
+        if self.running:
+            raise RuntimeError("профилирование уже запущено")
+        seconds = min(max(seconds, 1), MAX_PROFILE_SECONDS)
+        self._profile = cProfile.Profile()
+        self._started_at = time.monotonic()
+        self._chat_id = chat_id
+        self._profile.enable()
+        self._task = asyncio.create_task(self._stop_after(seconds))
+        return seconds
+
+    async def _stop_after(self, seconds: float):
+        await asyncio.sleep(seconds)
+        text = self.stop()
+        await self.report(self._chat_id, text)
+
+    def stop(self) -> str:
+        """Остановка профилирования, сохранение результата. Возвращает краткий отчет"""
+        if not self.running:
+            raise RuntimeError("профилирование не запущено")
+        profile, self._profile = self._profile, None
+        profile.disable()
+        task, self._task = self._task, None
+        if task and task is not asyncio.current_task():
+            task.cancel()
+
+        elapsed = time.monotonic() - self._started_at
+        path = self._path("cpu", "prof")
+        profile.dump_stats(path)
+
+        # Ожидание событий в selector - простой event loop, а не работа бота
+        rows = []
+        idle = 0.0
+        for (filename, line, name), (_, calls, tottime, cumtime, _) in pstats.Stats(profile).stats.items():
+            if filename == "~" and name.endswith("objects>") and ("poll" in name or "select" in name):
+                idle += tottime
+                continue
+            rows.append((filename, line, name, calls, tottime, cumtime))
+
+        def format_row(row):
+            filename, line, name, calls, tottime, cumtime = row
+            return f"{cumtime:.3f} с ({tottime:.3f} собств.) × {calls} — {name} {_short_path(filename)}:{line}"
+
+        project_dir = os.getcwd() + os.sep
+        own_code = [row for row in rows if row[0].startswith(project_dir)]
+        lines = [
+            f"⏱ Профиль за {elapsed:.1f} с сохранен: {path}",
+            f"Простой event loop: {idle:.1f} с ({idle * 100 / max(elapsed, 0.001):.0f}%)",
+            "",
+            "Код бота (cumulative):",
+        ]
+        lines += [format_row(row) for row in sorted(own_code, key=lambda row: row[5], reverse=True)[:SUMMARY_LINES]]
+        lines += ["", "Больше всего собственного времени:"]
+        lines += [format_row(row) for row in sorted(rows, key=lambda row: row[4], reverse=True)[:SUMMARY_LINES]]
+        return "\n".join(lines)
+
+    def memory_snapshot(self) -> str:
+        """
+        Снимок памяти tracemalloc и сравнение с предыдущим снимком.
+        Первый вызов включает tracemalloc и запоминает исходный снимок.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            self._last_snapshot = tracemalloc.take_snapshot()
+            return ("🧠 tracemalloc включен, исходный снимок сделан. "
+                    "Повторите команду позже, чтобы увидеть рост памяти.")
+
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        diff = snapshot.compare_to(self._last_snapshot, "lineno")
+        self._last_snapshot = snapshot
+
+        path = self._path("mem", "txt")
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f"Текущий объем: {current} байт, пик: {peak} байт\n\n")
+            for stat in diff:
+                f.write(f"{stat}\n")
+            f.write("\nКрупнейшие выделения (стек):\n")
+            for stat in snapshot.statistics("traceback")[:10]:
+                f.write(f"\n{stat}\n" + "\n".join(stat.traceback.format()) + "\n")
+
+        lines = [
+            f"🧠 Память: {current / 1024 / 1024:.1f} МБ (пик {peak / 1024 / 1024:.1f} МБ)",
+            f"Отчет сохранен: {path}",
+            "",
+            "Рост с прошлого снимка:",
+        ]
+        for stat in diff[:SUMMARY_LINES]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size_diff / 1024:+.1f} КБ ({stat.count_diff:+d} блоков) — "
+                         f"{_short_path(frame.filename)}:{frame.lineno}")
+        return "\n".join(lines)
+
+    def memory_stop(self) -> str:
+        """Отключение tracemalloc (снимает накладные расходы на учет выделений)"""
+        if not tracemalloc.is_tracing():
+            return "tracemalloc не включен."
+        tracemalloc.stop()
+        self._last_snapshot = None
+        return "🧠 tracemalloc отключен."
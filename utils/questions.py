@@ -0,0 +1,199 @@
+"""
+Вопросы спикерам, заданные в боте
+
+Вопрос пишется в журнал на диске (не теряется при сбое) до ответа пользователю: вопросы,
+пришедшие одновременно, сбрасываются на диск одной записью с одним fsync в пуле потоков,
+не блокируя цикл событий. Затем вопрос попадает в индекс в памяти,
+а в Excel сохраняется пачками фоновой задачей: одно открытие книги на много вопросов
+вместо открытия на каждый. Индекс хранит последние вопросы каждого доклада, поэтому
+модератор получает их командой без чтения Excel. В многопроцессном режиме индекс
+хранится в общем хранилище: вопрос, принятый любым процессом, сразу виден всем.
+"""
+import os
+import json
+import asyncio
+from datetime import datetime
+from collections import Counter, deque, namedtuple
+from utils.metrics import metrics
+
+# Индексы столбцов строки листа "Вопросы"
+NAME_COLUMN = 1
+TEXT_COLUMN = 2
+DATE_COLUMN = 3
+SPEAKER_COLUMN = 4
+TALK_COLUMN = 5
+
+# Сколько ждать соседние вопросы перед записью журнала (секунды): на это время растягивается
+# ответ пользователю, зато во время активной сессии вопросов одна запись на диск обслуживает всех
+JOURNAL_FLUSH_DELAY = 0.05
+
+Question = namedtuple("Question", "user_name text date")
+
+
+class QuestionBook:
+    def __init__(self, journal_path: str, save_batch, batch_size: int, index_limit: int):
+        self.journal_path = journal_path
+        self.save_batch = save_batch  # корутина save_batch(rows) -> bool - запись пачки в Excel
+        self.batch_size = batch_size  # Пачка, при накоплении которой запись начинается сразу
+        self.index_limit = index_limit  # Сколько последних вопросов хранить по каждому докладу
+        self.pending = []  # Строки листа "Вопросы", еще не записанные в Excel
+        self.by_talk = {}  # id доклада -> deque[Question] (новые в конце)
+        self.counts = Counter()  # id доклада -> всего вопросов
+        self.store = None  # SharedStore для индекса (многопроцессный режим)
+        self._flush_lock = asyncio.Lock()
+        self._journal_lock = asyncio.Lock()  # Дозапись и перезапись журнала идут по очереди
+        self._journal_batch = None  # (строки, future) - пачка, ожидающая записи в журнал
+        self._wakeup = asyncio.Event()
+        self._load_journal()
+
+        metrics.set_gauge("questions_pending", lambda: len(self.pending))
+
+    def _load_journal(self):
+        """Восстановление вопросов, не записанных в Excel до перезапуска"""
+        if not os.path.exists(self.journal_path):
+            return
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.pending.append(json.loads(line))
+                    except ValueError:
+                        # Недописанная строка (сбой во время записи)
+                        continue
+        except Exception as e:
+            print(f"Ошибка загрузки журнала вопросов: {e}")
+        if self.pending:
+            print(f"Вопросов, ожидающих записи в Excel: {len(self.pending)}")
+
+    def _write_journal(self, rows: list):
+        """Дозапись пачки вопросов в журнал с принудительным сбросом на диск"""
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_journal(self, rows: list):
+        """Перезапись журнала только с незаписанными вопросами"""
+        temp_file = self.journal_path + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, self.journal_path)
+
+    async def _append_journal(self, row: list):
+        """
+        Запись вопроса в журнал: вопрос присоединяется к текущей пачке, пачка пишется
+        через JOURNAL_FLUSH_DELAY. Возвращает управление, когда вопрос уже на диске
+        """
+        if self._journal_batch is None:
+            self._journal_batch = ([], asyncio.get_running_loop().create_future())
+            asyncio.create_task(self._commit_journal(self._journal_batch))
+        rows, done = self._journal_batch
+        rows.append(row)
+        # shield: отмена обработчика не должна отменять запись вопросов соседей по пачке
+        await asyncio.shield(done)
+
+    async def _commit_journal(self, batch):
+        rows, done = batch
+        await asyncio.sleep(JOURNAL_FLUSH_DELAY)
+        self._journal_batch = None  # Следующие вопросы идут уже в новую пачку
+        async with self._journal_lock:
+            try:
+                await asyncio.get_running_loop().run_in_executor(None, self._write_journal, rows)
+            except Exception as e:
+                if not done.done():
+                    done.set_exception(e)
+                return
+            # В pending вопросы попадают только после записи в журнал и под той же блокировкой,
+            # поэтому перезапись журнала в flush видит ровно те вопросы, что уже на диске
+            self.pending.extend(rows)
+        if not done.done():
+            done.set_result(None)
+
+    def _index(self, row):
+        """Добавление строки листа "Вопросы" в индекс по докладам"""
+        if len(row) <= TALK_COLUMN or not row[TALK_COLUMN]:
+            return  # Вопросы из старой схемы (без доклада) в индекс не попадают
+        talk_id = str(row[TALK_COLUMN])
+        if self.store:
+            self.store.add_question(talk_id, row[NAME_COLUMN] or "", row[TEXT_COLUMN] or "",
+                                    str(row[DATE_COLUMN] or ""), self.index_limit)
+            return
+        questions = self.by_talk.get(talk_id)
+        if questions is None:
+            questions = self.by_talk[talk_id] = deque(maxlen=self.index_limit)
+        questions.append(Question(row[NAME_COLUMN] or "", row[TEXT_COLUMN] or "", str(row[DATE_COLUMN] or "")))
+        self.counts[talk_id] += 1
+
+    def rebuild(self, rows):
+        """Построение индекса по строкам листа "Вопросы" и еще не записанным вопросам"""
+        self.by_talk.clear()
+        self.counts.clear()
+        if self.store:
+            indexed = [
+                (str(row[TALK_COLUMN]), row[NAME_COLUMN] or "", row[TEXT_COLUMN] or "", str(row[DATE_COLUMN] or ""))
+                for row in list(rows) + self.pending if row and len(row) > TALK_COLUMN and row[TALK_COLUMN]
+            ]
+            self.store.replace_questions(indexed, self.index_limit)
+            return
+        for row in rows:
+            if row:
+                self._index(row)
+        for row in self.pending:
+            self._index(row)
+
+    async def add(self, talk, user_id, user_name: str, text: str):
+        """Прием вопроса к докладу talk (Talk из контента); после возврата вопрос уже в журнале"""
+        row = [
+            str(user_id), user_name, text, datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            talk.speaker, talk.id
+        ]
+        await self._append_journal(row)
+        self._index(row)
+        metrics.inc("questions_received")
+        if len(self.pending) >= self.batch_size:
+            self._wakeup.set()
+
+    def latest(self, talk_id: str, limit: int) -> list:
+        """Последние вопросы к докладу, новые первыми"""
+        if self.store:
+            return [Question(*row) for row in self.store.latest_questions(talk_id, limit)]
+        questions = self.by_talk.get(talk_id, ())
+        return list(questions)[::-1][:limit]
+
+    def talk_counts(self) -> Counter:
+        """id доклада -> всего вопросов"""
+        if self.store:
+            return Counter(self.store.counters("questions_"))
+        return self.counts
+
+    async def flush(self) -> int:
+        """Запись накопленных вопросов в Excel одной пачкой. Возвращает количество записанных"""
+        async with self._flush_lock:
+            if not self.pending:
+                return 0
+            batch = list(self.pending)
+            if not await self.save_batch(batch):
+                metrics.inc("questions_flush_failed")
+                return 0
+            # Пока шла запись, могли прийти новые вопросы - они остаются в журнале
+            async with self._journal_lock:
+                del self.pending[:len(batch)]
+                await asyncio.get_running_loop().run_in_executor(None, self._rewrite_journal, list(self.pending))
+            metrics.inc("questions_flushed", len(batch))
+            return len(batch)
+
+    async def run(self, interval: float):
+        """Запись вопросов каждые interval секунд или сразу при накоплении пачки"""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"Ошибка записи вопросов в Excel: {e}")
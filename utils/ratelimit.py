@@ -0,0 +1,84 @@
+"""
+Ограничение частоты входящих событий от пользователя (token bucket)
+
+Проверка выполняется в памяти за O(1) до любой работы с файлами и API.
+При первом отклонении пользователь получает одно уведомление, следующее -
+только после того, как его события снова начнут приниматься.
+"""
+import time
+import functools
+from collections import OrderedDict
+from utils.metrics import metrics
+
+# Порог количества корзин, после которого удаляются давно неактивные
+MAX_BUCKETS = 10000
+
+
+class FloodControl:
+    def __init__(self, name: str, rate: float, burst: int, limits=None):
+        self.name = name  # Имя для метрик
+        self.rate = rate  # Пополнение корзины, событий в секунду
+        self.burst = burst  # Емкость корзины
+        self.limits = limits  # limits() -> (rate, burst) - лимиты текущего мероприятия вместо общих
+        # user_id -> [токены, время последнего пополнения, уведомлен]; порядок - от давно неактивных
+        # к недавним, поэтому устаревшие корзины всегда в начале
+        self._buckets = OrderedDict()
+
+    def check(self, user_id):
+        """
+        Проверка события пользователя.
+        Возвращает (разрешено, нужно ли отправить уведомление об ограничении).
+        """
+        now = time.monotonic()
+        rate, burst = self.limits() if self.limits else (self.rate, self.burst)
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_BUCKETS:
+                self._prune(now, rate, burst)
+            bucket = self._buckets[user_id] = [float(burst), now, False]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            self._buckets.move_to_end(user_id)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            bucket[2] = False
+            return True, False
+
+        metrics.inc(f"flood_rejected_{self.name}")
+        if bucket[2]:
+            return False, False
+        bucket[2] = True
+        return False, True
+
+    def _prune(self, now: float, rate: float, burst: int):
+        """
+        Удаление корзин, которые уже успели бы полностью наполниться. Корзины упорядочены
+        по времени последнего события, поэтому удаляются с начала до первой активной -
+        стоимость пропорциональна числу удаленных, а не всех корзин
+        """
+        full_after = burst / rate if rate else 0
+        buckets = self._buckets
+        while buckets and now - next(iter(buckets.values()))[1] >= full_after:
+            buckets.popitem(last=False)
+
+    def limited(self, key_func, on_throttled=None):
+        """
+        Декоратор обработчика: отклоняет событие при превышении лимита.
+        on_throttled(event) - корутина уведомления, вызывается один раз за период ограничения.
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(event):
+                key = key_func(event)
+                if key is None:
+                    await handler(event)
+                    return
+                allowed, notify = self.check(key)
+                if allowed:
+                    await handler(event)
+                elif notify and on_throttled:
+                    await on_throttled(event)
+            return wrapper
+        return decorator
@@ -0,0 +1,204 @@
+"""
+Напоминания о незаконченном опросе на иерархическом колесе таймеров
+
+Таймер на каждого пользователя через asyncio.sleep не масштабируется на сотни тысяч
+ожидающих. Колесо таймеров хранит их в слотах трех уровней (секунды, минуты, часы)
+и списке дальних таймеров: добавление и отмена - O(1), раз в секунду обрабатывается
+один слот, при смене минуты/часа/дня слот старшего уровня раскладывается по младшим.
+Таймеры сохраняются в журнал (добавление/отмена дописываются строкой, журнал
+периодически сжимается), поэтому переживают перезапуск. Сработавшие таймеры
+отправляются не чаще rate в секунду (rate может быть дробным) и до отправки
+снимаются отменой или новым таймером пользователя.
+"""
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from utils.metrics import metrics
+
+# Уровни колеса: (длительность слота в секундах, количество слотов)
+WHEEL_LEVELS = ((1, 60), (60, 60), (3600, 24))
+# Таймеры дальше этого срока лежат в общем списке и раскладываются раз в сутки
+WHEEL_SPAN = 86400
+
+
+class TimingWheel:
+    def __init__(self, now: int):
+        self.tick = now  # Последняя обработанная секунда (unix time)
+        self._levels = [[{} for _ in range(count)] for _, count in WHEEL_LEVELS]
+        self._overflow = {}
+        self._where = {}  # ключ -> слот (словарь ключ -> (срок, данные)), где лежит таймер
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key) -> bool:
+        return key in self._where
+
+    def items(self):
+        """(ключ, срок, данные) всех таймеров"""
+        for key, slot in self._where.items():
+            deadline, payload = slot[key]
+            yield key, deadline, payload
+
+    def _place(self, key, deadline: int, payload, earliest: int):
+        """Слот для срока: ближайший уровень, на котором срок не дальше оборота колеса"""
+        due = max(deadline, earliest)
+        delta = due - self.tick
+        slot = self._overflow
+        for (size, count), slots in zip(WHEEL_LEVELS, self._levels):
+            if delta < size * count:
+                slot = slots[(due // size) % count]
+                break
+        slot[key] = (deadline, payload)
+        self._where[key] = slot
+
+    def add(self, key, deadline: int, payload=None):
+        """Добавление или перенос таймера (просроченный сработает на следующей секунде)"""
+        self.remove(key)
+        self._place(key, deadline, payload, self.tick + 1)
+
+    def remove(self, key) -> bool:
+        slot = self._where.pop(key, None)
+        if slot is None:
+            return False
+        del slot[key]
+        return True
+
+    def _cascade(self, slot: dict):
+        """Раскладка слота старшего уровня по младшим (относительно текущей секунды)"""
+        entries = list(slot.items())
+        slot.clear()
+        for key, (deadline, payload) in entries:
+            self._place(key, deadline, payload, self.tick)
+
+    def advance(self, now: int) -> list:
+        """Обработка секунд до now включительно. Возвращает сработавшие [(ключ, данные)]"""
+        fired = []
+        if now - self.tick > WHEEL_SPAN:
+            # Долгий простой loop или скачок часов - раскладываем все таймеры заново
+            entries = list(self.items())
+            self.__init__(now - 1)
+            for key, deadline, payload in entries:
+                self._place(key, deadline, payload, now)
+        while self.tick < now:
+            self.tick += 1
+            # Старшие уровни раньше младших: таймеры часа попадают в слот минуты до его раскладки
+            if self.tick % WHEEL_SPAN == 0:
+                self._cascade(self._overflow)
+            for level in range(len(WHEEL_LEVELS) - 1, 0, -1):
+                size, count = WHEEL_LEVELS[level]
+                if self.tick % size == 0:
+                    self._cascade(self._levels[level][(self.tick // size) % count])
+            slot = self._levels[0][self.tick % WHEEL_LEVELS[0][1]]
+            for key, (_, payload) in slot.items():
+                del self._where[key]
+                fired.append((key, payload))
+            slot.clear()
+        return fired
+
+
+class ReminderScheduler:
+    """Таймеры напоминаний по user_id с журналом на диске и отправкой с ограничением темпа"""
+
+    def __init__(self, path: str, fire, rate: float):
+        self.path = path
+        self.fire = fire  # корутина fire(user_id, chat_id, number) - number: вопрос, о котором напоминаем
+        self.rate = rate  # напоминаний в секунду
+        self.wheel = TimingWheel(int(time.time()))
+        self._due = OrderedDict()  # сработавшие user_id -> (chat_id, number), ожидающие отправки
+        self._tokens = 0.0  # Накопленное право на отправку (дробный rate копится по секундам)
+        self._journal = None
+        self._journal_lines = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self.wheel) + len(self._due)
+
+    def _load(self):
+        """Восстановление таймеров из журнала и его сжатие"""
+        timers = {}
+        try:
+            if os.path.exists(self.path):
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        parts = line.split()
+                        if len(parts) in (4, 5) and parts[0] == "a":
+                            # Номер вопроса - пятое поле (в журнале старой версии его нет)
+                            number = int(parts[4]) if len(parts) == 5 else 0
+                            timers[int(parts[1])] = (int(parts[2]), (int(parts[3]), number))
+                        elif len(parts) == 2 and parts[0] == "c":
+                            timers.pop(int(parts[1]), None)
+        except (OSError, ValueError) as e:
+            print(f"Ошибка загрузки таймеров напоминаний: {e}")
+        for user_id, (deadline, payload) in timers.items():
+            self.wheel.add(user_id, deadline, payload)
+        self._compact()
+        if timers:
+            print(f"Таймеров напоминаний: {len(timers)}")
+
+    def _compact(self):
+        """Перезапись журнала только действующими таймерами (атомарно через временный файл)"""
+        if self._journal:
+            self._journal.close()
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            for user_id, deadline, (chat_id, number) in self.wheel.items():
+                f.write(f"a {user_id} {deadline} {chat_id} {number}\n")
+            for user_id, (chat_id, number) in self._due.items():
+                f.write(f"a {user_id} 0 {chat_id} {number}\n")
+        os.replace(temp_file, self.path)
+        # Построчная буферизация: таймер попадает на диск сразу, до сохранения состояния опроса
+        self._journal = open(self.path, 'a', encoding='utf-8', buffering=1)
+        self._journal_lines = len(self)
+
+    def _write(self, line: str):
+        self._journal.write(line)
+        self._journal_lines += 1
+
+    def schedule(self, user_id: int, chat_id: int, delay: float, number: int = 0):
+        """
+        Напоминание пользователю о вопросе number через delay секунд. Прежний таймер
+        пользователя заменяется, в том числе уже сработавший и ждущий отправки
+        """
+        deadline = int(time.time() + delay)
+        self._due.pop(user_id, None)
+        self.wheel.add(user_id, deadline, (chat_id, number))
+        self._write(f"a {user_id} {deadline} {chat_id} {number}\n")
+
+    def cancel(self, user_id: int):
+        removed = self.wheel.remove(user_id)
+        # Сработавший таймер мог ждать своей очереди на отправку - снимаем и его
+        if self._due.pop(user_id, None) is not None or removed:
+            self._write(f"c {user_id}\n")
+
+    async def run(self):
+        """Раз в секунду: сработавшие таймеры в очередь, из очереди - пачка не больше rate"""
+        while True:
+            await asyncio.sleep(1 - time.time() % 1)
+            self._due.update(self.wheel.advance(int(time.time())))
+            # Токены копятся по rate в секунду (не больше одной секунды отправки), поэтому
+            # rate ниже 1 дает напоминание раз в несколько секунд, а не одно в секунду
+            self._tokens = min(self._tokens + self.rate, max(self.rate, 1))
+            batch = [self._due.popitem(last=False) for _ in range(min(len(self._due), int(self._tokens)))]
+            self._tokens -= len(batch)
+            if batch:
+                results = await asyncio.gather(
+                    *(self.fire(user_id, chat_id, number) for user_id, (chat_id, number) in batch),
+                    return_exceptions=True
+                )
+                for (user_id, _), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        print(f"Ошибка напоминания пользователю {user_id}: {result}")
+                    # Отметка об отправке после попытки: при сбое до нее напоминание повторится.
+                    # Новый таймер, поставленный пока напоминание ждало отправки, остается
+                    if user_id not in self.wheel:
+                        self._write(f"c {user_id}\n")
+                metrics.inc("reminders_fired", len(batch))
+            if self._journal_lines > 2 * len(self) + 10000:
+                self._compact()
+
+    def close(self):
+        if self._journal:
+            self._journal.close()
+            self._journal = None
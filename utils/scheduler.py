@@ -0,0 +1,182 @@
+"""
+Планировщик обработки обновлений
+
+Обработчики выполняются ограниченным числом воркеров. События одного пользователя
+ставятся в его собственную очередь и обрабатываются строго по порядку, разные
+пользователи обслуживаются по кругу. При переполнении очередей новые события
+сначала ждут освобождения места, а затем отбрасываются. Событие с ключом схлопывания
+заменяет еще не начатое последнее событие пользователя с тем же ключом (например,
+несколько нажатий кнопок меню подряд - показывается только последний экран).
+Если такое событие приходит, пока выполняется событие пользователя с тем же ключом,
+выполняющееся событие отмечается устаревшим: обработчик проверяет superseded()
+и не отправляет экран, который сразу заменит следующий.
+"""
+import time
+import asyncio
+import contextvars
+import functools
+from collections import deque
+from utils.metrics import metrics
+
+# Ключ пользователя, событие которого выполняет текущий воркер
+current_key = contextvars.ContextVar("scheduler_current_key", default=None)
+
+
+class UpdateScheduler:
+    def __init__(self, workers: int, user_queue_limit: int, queue_limit: int, overflow_wait: float):
+        self.workers_count = workers
+        self.user_queue_limit = user_queue_limit  # Максимум событий в очереди одного пользователя
+        self.queue_limit = queue_limit  # Максимум событий во всех очередях
+        self.overflow_wait = overflow_wait  # Сколько ждать места при переполнении (секунды)
+        self._user_queues = {}  # ключ пользователя -> deque[(handler, event, enqueued_at, collapse_key)]
+        self._running = set()  # ключи пользователей, чье первое событие сейчас выполняется
+        self._superseded = set()  # ключи пользователей, чье выполняющееся событие уже устарело
+        self._ready = None  # очередь ключей пользователей, готовых к обработке
+        self._space = None  # условие "в очередях появилось место"
+        self._workers = []
+        self._pending = 0
+        self._busy = 0
+
+        metrics.set_gauge("scheduler_queue_depth", lambda: self._pending)
+        metrics.set_gauge("scheduler_users_queued", lambda: len(self._user_queues))
+        metrics.set_gauge("scheduler_workers_busy", lambda: self._busy)
+
+    @property
+    def pending(self) -> int:
+        """Количество событий в очередях (включая выполняющиеся)"""
+        return self._pending
+
+    @property
+    def running(self) -> bool:
+        """Запущены ли воркеры"""
+        return bool(self._workers)
+
+    def start(self):
+        """Запуск воркеров (вызывается внутри работающего event loop)"""
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers_count)]
+        print(f"Планировщик обновлений запущен: {self.workers_count} воркеров")
+
+    async def stop(self):
+        """Остановка воркеров (необработанные события остаются в очередях)"""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def join(self):
+        """Ожидание обработки всех событий в очередях"""
+        while self._pending:
+            async with self._space:
+                await self._space.wait_for(lambda: self._pending == 0)
+
+    async def submit(self, key, handler, event, collapse_key=None) -> bool:
+        """
+        Постановка события в очередь пользователя.
+        Возвращает False, если событие отброшено из-за переполнения.
+        """
+        queue = self._user_queues.get(key)
+        if queue and collapse_key is not None and queue[-1][3] == collapse_key:
+            # Последнее событие в очереди с тем же ключом еще не начато - заменяем его
+            # (только хвост очереди, чтобы не менять порядок относительно других событий)
+            if len(queue) > 1 or key not in self._running:
+                queue[-1] = (handler, event, queue[-1][2], collapse_key)
+                metrics.inc("scheduler_collapsed")
+                self._supersede(key, collapse_key)
+                return True
+
+        if queue is not None and len(queue) >= self.user_queue_limit:
+            metrics.inc("scheduler_shed_user_queue")
+            return False
+
+        if self._pending >= self.queue_limit:
+            # Общая очередь переполнена - придерживаем событие, затем отбрасываем
+            metrics.inc("scheduler_delayed")
+            try:
+                async with self._space:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: self._pending < self.queue_limit),
+                        timeout=self.overflow_wait
+                    )
+            except asyncio.TimeoutError:
+                metrics.inc("scheduler_shed_overflow")
+                return False
+
+        queue = self._user_queues.get(key)
+        if queue is None:
+            queue = self._user_queues[key] = deque()
+            self._ready.put_nowait(key)
+        queue.append((handler, event, time.monotonic(), collapse_key))
+        self._pending += 1
+        metrics.inc("scheduler_submitted")
+        self._supersede(key, collapse_key)
+        return True
+
+    def _supersede(self, key, collapse_key):
+        """Отметка выполняющегося события пользователя устаревшим, если пришло более новое с тем же ключом"""
+        if collapse_key is not None and key in self._running and self._user_queues[key][0][3] == collapse_key:
+            self._superseded.add(key)
+
+    def superseded(self) -> bool:
+        """
+        Устарело ли выполняемое событие (вызывается из обработчика): после него в очереди
+        пользователя уже есть событие с тем же ключом схлопывания
+        """
+        return current_key.get() in self._superseded
+
+    async def _worker(self):
+        """Воркер: берет пользователя из очереди готовых и выполняет его первое событие"""
+        while True:
+            key = await self._ready.get()
+            queue = self._user_queues.get(key)
+            if not queue:
+                self._user_queues.pop(key, None)
+                continue
+
+            handler, event, enqueued_at, _ = queue[0]
+            metrics.set_gauge("scheduler_last_wait_seconds", time.monotonic() - enqueued_at)
+            self._running.add(key)
+            self._busy += 1
+            token = current_key.set(key)
+            try:
+                await handler(event)
+            except Exception as e:
+                metrics.inc("scheduler_handler_errors")
+                print(f"Ошибка в обработчике {getattr(handler, '__name__', handler)}: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                current_key.reset(token)
+                self._busy -= 1
+                self._running.discard(key)
+                self._superseded.discard(key)
+                queue.popleft()
+                self._pending -= 1
+                metrics.inc("scheduler_processed")
+                if queue:
+                    # У пользователя есть еще события - в конец очереди готовых (по кругу)
+                    self._ready.put_nowait(key)
+                else:
+                    del self._user_queues[key]
+                async with self._space:
+                    self._space.notify_all()
+
+    def scheduled(self, key_func, collapse_func=None):
+        """
+        Декоратор обработчика: вместо немедленного выполнения событие ставится
+        в очередь пользователя, ключ которого возвращает key_func(event).
+        collapse_func(event) - ключ схлопывания события (None - не схлопывать)
+        """
+        def decorator(handler):
+            @functools.wraps(handler)
+            async def wrapper(event):
+                if not self.running:
+                    # Планировщик не запущен - выполняем сразу
+                    await handler(event)
+                    return
+                collapse_key = collapse_func(event) if collapse_func else None
+                if not await self.submit(key_func(event), handler, event, collapse_key):
+                    print(f"⚠️ Событие для {handler.__name__} отброшено: очередь переполнена")
+            return wrapper
+        return decorator
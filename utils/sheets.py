@@ -1,61 +1,390 @@
 """
 Модуль для работы с Excel файлами для сохранения вопросов и отзывов
+
+Данные пишутся в секции - небольшие книги, которые сменяются по мероприятию, дню
+или количеству строк. Список секций хранится в manifest.json, каждая запись открывает
+и сохраняет только текущую секцию, поэтому стоимость записи не растет с историей.
+Общая книга собирается по запросу (export_merged).
 """
 import os
+import json
 import asyncio
 import fcntl  # для блокировок файлов на Linux/Unix
 from datetime import datetime
 from openpyxl import Workbook, load_workbook
 from openpyxl.styles import Font, PatternFill, Alignment
-from config import EXCEL_FILE_PATH
+from openpyxl.packaging.custom import IntProperty
+from config import EXCEL_FILE_PATH, EXCEL_PARTITIONS_DIR, EXCEL_PARTITION_BY, EXCEL_PARTITION_MAX_ROWS, FORUM_EVENT_ID
+
+# Заголовки листов
+# Столбцы "Спикер" и "Доклад" (id доклада из контента) добавлены в конец - старые строки остаются валидными
+QUESTIONS_HEADERS = ["ID пользователя", "Имя", "Вопрос", "Дата", "Спикер", "Доклад"]
+FEEDBACK_HEADERS = [
+    "ID пользователя", "Имя", "Польза форума", "Интересные направления",
+    "Предложения по улучшению", "Дата", "Трек"
+]
+# Номера столбцов листа "Отзывы" (openpyxl, с 1): ответ на вопрос 2 и трек, к которому он сведен
+FEEDBACK_DIRECTIONS_COLUMN = 4
+FEEDBACK_TRACK_COLUMN = 7
+
+# Версия схемы листа "Отзывы" (хранится в свойствах книги)
+# 1 - старая структура: ID, Имя, Полный отзыв, Дата
+# 2 - ответы в отдельных столбцах: ID, Имя, Польза, Направления, Предложения, Дата
+# 3 - добавлен столбец "Трек": ответ о направлениях, сведенный к ключам треков
+FEEDBACK_SCHEMA_VERSION = 3
+SCHEMA_VERSION_PROPERTY = "feedback_schema_version"
+
+# Листы книги и их заголовки
+SHEETS = {"Вопросы": QUESTIONS_HEADERS, "Отзывы": FEEDBACK_HEADERS}
+
+# Количество строк секции в manifest.json обновляется раз в столько записанных строк
+# (и сразу, когда секция заполнилась), а не при каждой записи
+MANIFEST_SYNC_ROWS = 50
 
 
 class ExcelManager:
-    def __init__(self):
-        self.file_path = EXCEL_FILE_PATH
+    def __init__(self, legacy_file: str = EXCEL_FILE_PATH, partitions_dir: str = EXCEL_PARTITIONS_DIR,
+                 partition_by: str = EXCEL_PARTITION_BY, max_rows: int = EXCEL_PARTITION_MAX_ROWS,
+                 event_id: str = FORUM_EVENT_ID):
+        self.legacy_file = legacy_file  # Файл, созданный до появления секций
+        self.partitions_dir = partitions_dir
+        self.partition_by = partition_by  # event, day или none (только по количеству строк)
+        self.max_rows = max_rows  # Строк в секции, после которых начинается новая
+        self.event_id = event_id
+        self.manifest_path = os.path.join(self.partitions_dir, "manifest.json")
+        self.partitions = []  # [{"file", "key", "rows", "created"}], последняя - текущая
+        self._manifest_stamp = None  # (inode, mtime) прочитанного manifest.json
+        self._synced_rows = {}  # файл секции -> количество строк, записанное в manifest.json
+        self.file_path = None  # Текущая секция
         self._excel_lock = asyncio.Lock()  # Блокировка для синхронизации доступа к Excel
+        self.feedback_listeners = []  # Функции listener(row), вызываемые после сохранения отзыва
+        self.normalize_track = None  # Функция "ответ о направлениях -> трек" для столбца "Трек"
         self._init_file()
     
     def _init_file(self):
-        """Инициализация Excel файла с листами"""
-        if not os.path.exists(self.file_path):
-            # Создаем новый файл
-            wb = Workbook()
-            wb.remove(wb.active)  # Удаляем дефолтный лист
-            
-            # Создаем лист "Вопросы"
+        """Загрузка списка секций и подготовка текущей секции"""
+        os.makedirs(self.partitions_dir, exist_ok=True)
+        lock_file = self._lock_partitions()
+        try:
+            if not self.partitions and os.path.exists(self.legacy_file):
+                self._adopt_legacy_file()
+            self._current_partition()
+        finally:
+            self._unlock_partitions(lock_file)
+    
+    def _adopt_legacy_file(self):
+        """Файл, созданный до появления секций, становится первой секцией"""
+        self._ensure_sheets(self.legacy_file)
+        self.partitions = [{
+            "file": self.legacy_file,
+            "key": "legacy",
+            "rows": self._count_rows(self.legacy_file),
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }]
+        self._save_manifest()
+        print(f"Существующий файл {self.legacy_file} добавлен как первая секция")
+    
+    def _load_manifest(self):
+        """Чтение списка секций с диска (только если файл изменился с прошлого чтения)"""
+        if not os.path.exists(self.manifest_path):
+            return
+        stat = os.stat(self.manifest_path)
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp == self._manifest_stamp:
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            self.partitions = json.load(f)["partitions"]
+        self._manifest_stamp = stamp
+        self._synced_rows = {partition["file"]: partition["rows"] for partition in self.partitions}
+    
+    def _lock_partitions(self):
+        """
+        Межпроцессная блокировка секций (в многопроцессном режиме в одни файлы пишут
+        несколько процессов). Список секций перечитывается под блокировкой.
+        """
+        lock_file = open(os.path.join(self.partitions_dir, ".lock"), 'a')
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        self._load_manifest()
+        return lock_file
+    
+    @staticmethod
+    def _unlock_partitions(lock_file):
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+        lock_file.close()
+    
+    def _save_manifest(self):
+        """Сохранение списка секций (атомарно через временный файл)"""
+        temp_file = self.manifest_path + '.tmp'
+        with open(temp_file, 'w', encoding='utf-8') as f:
+            json.dump({"partitions": self.partitions}, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, self.manifest_path)
+        stat = os.stat(self.manifest_path)
+        self._manifest_stamp = (stat.st_ino, stat.st_mtime_ns)
+        self._synced_rows = {partition["file"]: partition["rows"] for partition in self.partitions}
+    
+    def _partition_key(self) -> str:
+        """Ключ секции для новой записи: мероприятие и/или дата"""
+        event = self.event_id or "forum"
+        if self.partition_by == "day":
+            return f"{event}_{datetime.now().strftime('%Y-%m-%d')}"
+        if self.partition_by == "event":
+            return event
+        return "all"
+    
+    def _current_partition(self) -> dict:
+        """Текущая секция; новая создается при смене ключа или превышении количества строк"""
+        key = self._partition_key()
+        if self.partitions:
+            current = self.partitions[-1]
+            if current["key"] == key and current["rows"] < self.max_rows and os.path.exists(current["file"]):
+                self.file_path = current["file"]
+                return current
+        
+        number = sum(1 for partition in self.partitions if partition["key"] == key) + 1
+        file_path = os.path.join(self.partitions_dir, f"{key}_{number:03d}.xlsx")
+        self._create_workbook(file_path)
+        partition = {
+            "file": file_path,
+            "key": key,
+            "rows": 0,
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.partitions.append(partition)
+        self._save_manifest()
+        self.file_path = file_path
+        print(f"Создан новый Excel файл: {file_path}")
+        return partition
+    
+    def _partition_written(self, partition: dict, wb):
+        """
+        Учет строк секции по только что записанной книге. manifest.json перезаписывается,
+        когда секция заполнилась (следующая запись начнет новую) или раз в MANIFEST_SYNC_ROWS
+        строк - между ними количество строк в нем может отставать, книга остается точной
+        """
+        partition["rows"] = sum(wb[title].max_row - 1 for title in SHEETS if title in wb.sheetnames)
+        synced = self._synced_rows.get(partition["file"], 0)
+        if partition["rows"] >= self.max_rows or partition["rows"] - synced >= MANIFEST_SYNC_ROWS:
+            self._save_manifest()
+    
+    def _create_workbook(self, file_path: str):
+        """Создание книги с листами в актуальной схеме"""
+        wb = Workbook()
+        wb.remove(wb.active)  # Удаляем дефолтный лист
+        for title, headers in SHEETS.items():
+            ws = wb.create_sheet(title)
+            ws.append(headers)
+            self._format_header(ws)
+        
+        # Новый файл сразу создается в актуальной схеме
+        self._set_schema_version(wb, FEEDBACK_SCHEMA_VERSION)
+        wb.save(file_path)
+    
+    @staticmethod
+    def _count_rows(file_path: str) -> int:
+        """Количество строк данных во всех листах книги"""
+        wb = load_workbook(file_path, read_only=True)
+        try:
+            return sum(max(wb[title].max_row - 1, 0) for title in SHEETS if title in wb.sheetnames)
+        finally:
+            wb.close()
+    
+    def _ensure_sheets(self, file_path: str):
+        """Проверка, что в книге есть оба листа"""
+        wb = load_workbook(file_path)
+        
+        if "Вопросы" not in wb.sheetnames:
             ws_questions = wb.create_sheet("Вопросы")
-            ws_questions.append(["ID пользователя", "Имя", "Вопрос", "Дата"])
+            ws_questions.append(QUESTIONS_HEADERS)
             self._format_header(ws_questions)
-            
-            # Создаем лист "Отзывы"
+        
+        if "Отзывы" not in wb.sheetnames:
             ws_feedback = wb.create_sheet("Отзывы")
-            ws_feedback.append([
-                "ID пользователя", "Имя", "Польза форума", "Интересные направления", 
-                "Предложения по улучшению", "Дата"
-            ])
+            ws_feedback.append(FEEDBACK_HEADERS)
             self._format_header(ws_feedback)
-            
-            wb.save(self.file_path)
-            print(f"Создан новый Excel файл: {self.file_path}")
+            # Пустой лист уже в актуальной схеме - миграция не нужна
+            if self._get_schema_version(wb) is None:
+                self._set_schema_version(wb, FEEDBACK_SCHEMA_VERSION)
+        
+        wb.save(file_path)
+    
+    @staticmethod
+    def _get_schema_version(wb):
+        """Версия схемы листа "Отзывы" из свойств книги (None, если не записана)"""
+        if SCHEMA_VERSION_PROPERTY in wb.custom_doc_props.names:
+            return int(wb.custom_doc_props[SCHEMA_VERSION_PROPERTY].value)
+        return None
+    
+    @staticmethod
+    def _set_schema_version(wb, version: int):
+        """Запись версии схемы листа "Отзывы" в свойства книги"""
+        if SCHEMA_VERSION_PROPERTY in wb.custom_doc_props.names:
+            wb.custom_doc_props[SCHEMA_VERSION_PROPERTY].value = version
         else:
-            # Проверяем, что листы существуют
-            wb = load_workbook(self.file_path)
-            
-            if "Вопросы" not in wb.sheetnames:
-                ws_questions = wb.create_sheet("Вопросы")
-                ws_questions.append(["ID пользователя", "Имя", "Вопрос", "Дата"])
-                self._format_header(ws_questions)
-            
-            if "Отзывы" not in wb.sheetnames:
-                ws_feedback = wb.create_sheet("Отзывы")
-                ws_feedback.append([
-                    "ID пользователя", "Имя", "Польза форума", "Интересные направления", 
-                    "Предложения по улучшению", "Дата"
-                ])
-                self._format_header(ws_feedback)
-            
-            wb.save(self.file_path)
+            wb.custom_doc_props.append(IntProperty(name=SCHEMA_VERSION_PROPERTY, value=version))
+    
+    def _migrate_feedback_v1_to_v2(self, ws):
+        """Миграция листа "Отзывы": полный отзыв -> ответы в отдельных столбцах"""
+        header_row = ws[1]
+        if len(header_row) >= 6 and header_row[2].value == "Польза форума":
+            # Заголовки уже новые, данные переносить не нужно
+            return
+        
+        # Сохраняем данные (кроме заголовка)
+        all_data = list(ws.iter_rows(values_only=True))
+        ws.delete_rows(1, ws.max_row)
+        ws.append(FEEDBACK_HEADERS)
+        self._format_header(ws)
+        # Восстанавливаем данные со старой структурой (если есть)
+        for row in all_data[1:]:
+            if row and len(row) == 4:
+                # Старая структура: ID, Имя, Полный отзыв, Дата
+                # Новая структура: ID, Имя, Польза, Направления, Предложения, Дата
+                ws.append([row[0], row[1], "", "", row[2], row[3]])
+    
+    def _migrate_feedback_v2_to_v3(self, ws):
+        """Миграция листа "Отзывы": столбец "Трек", заполненный по ответам о направлениях"""
+        ws.cell(row=1, column=FEEDBACK_TRACK_COLUMN, value=FEEDBACK_HEADERS[FEEDBACK_TRACK_COLUMN - 1])
+        self._format_header(ws)
+        if self.normalize_track:
+            self._fill_tracks(ws)
+    
+    def _fill_tracks(self, ws) -> int:
+        """Заполнение столбца "Трек" по ответам о направлениях. Возвращает количество измененных строк"""
+        changed = 0
+        for row in range(2, ws.max_row + 1):
+            track = self.normalize_track(ws.cell(row=row, column=FEEDBACK_DIRECTIONS_COLUMN).value)
+            cell = ws.cell(row=row, column=FEEDBACK_TRACK_COLUMN)
+            if (cell.value or "") != track:
+                cell.value = track
+                changed += 1
+        return changed
+    
+    def normalize_feedback_tracks(self) -> int:
+        """
+        Пересчет столбца "Трек" во всех секциях (после изменения словаря синонимов или контента).
+        Записываются только секции с изменившимися строками. Возвращает количество измененных строк
+        """
+        changed = 0
+        lock_file = self._lock_partitions()
+        try:
+            for partition in self.partitions:
+                if not os.path.exists(partition["file"]):
+                    continue
+                wb = load_workbook(partition["file"])
+                if "Отзывы" not in wb.sheetnames:
+                    continue
+                partition_changed = self._fill_tracks(wb["Отзывы"])
+                if not partition_changed:
+                    continue
+                # Атомарная запись через временный файл
+                temp_file = partition["file"] + '.tmp'
+                wb.save(temp_file)
+                os.replace(temp_file, partition["file"])
+                changed += partition_changed
+        finally:
+            self._unlock_partitions(lock_file)
+        print(f"Столбец 'Трек' пересчитан, изменено строк: {changed}")
+        return changed
+    
+    async def normalize_feedback_tracks_async(self) -> int:
+        """Пересчет столбца "Трек" в потоке, записи отзывов этого процесса ждут окончания"""
+        async with self._excel_lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.normalize_feedback_tracks)
+    
+    def migrate_feedback_schema(self):
+        """
+        Однократная миграция листа "Отзывы" во всех секциях до FEEDBACK_SCHEMA_VERSION.
+        Вызывается при старте бота или командой администратора.
+        Возвращает кортеж (старая версия, новая версия) - старая по самой старой секции.
+        """
+        lock_file = self._lock_partitions()
+        try:
+            versions = [self._migrate_partition(partition["file"]) for partition in self.partitions
+                        if os.path.exists(partition["file"])]
+        finally:
+            self._unlock_partitions(lock_file)
+        if not versions:
+            return FEEDBACK_SCHEMA_VERSION, FEEDBACK_SCHEMA_VERSION
+        return min(old for old, _ in versions), FEEDBACK_SCHEMA_VERSION
+    
+    def _migrate_partition(self, file_path: str):
+        """Миграция листа "Отзывы" одной секции. Возвращает (старая версия, новая версия)"""
+        migrations = {
+            2: self._migrate_feedback_v1_to_v2,
+            3: self._migrate_feedback_v2_to_v3,
+        }
+        
+        wb = load_workbook(file_path)
+        version = self._get_schema_version(wb)
+        # Файл без записанной версии считаем файлом старой схемы
+        current = version or 1
+        if current >= FEEDBACK_SCHEMA_VERSION:
+            return current, current
+        
+        ws = wb["Отзывы"]
+        for target in range(current + 1, FEEDBACK_SCHEMA_VERSION + 1):
+            print(f"Миграция листа 'Отзывы': версия {target - 1} -> {target}")
+            migrations[target](ws)
+        self._set_schema_version(wb, FEEDBACK_SCHEMA_VERSION)
+        
+        # Атомарная запись через временный файл
+        temp_file = file_path + '.tmp'
+        wb.save(temp_file)
+        os.replace(temp_file, file_path)
+        print(f"Схема листа 'Отзывы' в {file_path} обновлена до версии {FEEDBACK_SCHEMA_VERSION}")
+        return current, FEEDBACK_SCHEMA_VERSION
+    
+    def iter_rows(self, title: str):
+        """Строки листа без заголовка из всех секций по порядку (чтение в режиме read_only)"""
+        for partition in list(self.partitions):
+            if not os.path.exists(partition["file"]):
+                print(f"⚠️ Секция {partition['file']} не найдена, пропускаю")
+                continue
+            wb = load_workbook(partition["file"], read_only=True)
+            try:
+                if title not in wb.sheetnames:
+                    continue
+                for row in wb[title].iter_rows(min_row=2, values_only=True):
+                    yield row
+            finally:
+                wb.close()
+    
+    def iter_feedback_rows(self):
+        """Строки листа "Отзывы" без заголовка из всех секций"""
+        return self.iter_rows("Отзывы")
+    
+    def has_feedback(self, user_id: str, feedback_data: dict) -> bool:
+        """Есть ли уже строка отзыва пользователя с такими ответами (проверка перед повторной записью)"""
+        answers = [feedback_data.get(key) or "" for key in ("q1_benefit", "q2_directions", "q3_suggestions")]
+        for row in self.iter_feedback_rows():
+            if row and len(row) >= 5 and str(row[0]) == str(user_id) and [value or "" for value in row[2:5]] == answers:
+                return True
+        return False
+    
+    def export_merged(self, target_path: str, titles: list = None) -> dict:
+        """
+        Сборка всех секций в одну книгу (потоковая запись, секции читаются по одной).
+        titles - листы для выгрузки (по умолчанию все). Возвращает количество строк по листам.
+        """
+        counts = {}
+        wb = Workbook(write_only=True)
+        for title, headers in SHEETS.items():
+            if titles and title not in titles:
+                continue
+            ws = wb.create_sheet(title)
+            ws.append(headers)
+            counts[title] = 0
+            for row in self.iter_rows(title):
+                ws.append(list(row))
+                counts[title] += 1
+        
+        # Атомарная запись через временный файл
+        temp_file = target_path + '.tmp'
+        wb.save(temp_file)
+        os.replace(temp_file, target_path)
+        print(f"Секции Excel объединены в {target_path}: {counts}")
+        return counts
     
     def _format_header(self, worksheet):
         """Форматирование заголовка листа"""
@@ -80,146 +409,156 @@ class ExcelManager:
             adjusted_width = min(max_length + 2, 50)
             worksheet.column_dimensions[column_letter].width = adjusted_width
     
-    def save_question(self, user_id: str, user_name: str, question_text: str):
+    def save_question(self, user_id: str, user_name: str, question_text: str, speaker: str = "", talk_id: str = ""):
         """Сохранение вопроса в Excel"""
+        return self.save_questions([[
+            str(user_id),
+            user_name,
+            question_text,
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            speaker,
+            talk_id
+        ]])
+    
+    def save_questions(self, rows: list):
+        """Сохранение пачки вопросов в Excel (книга открывается и сохраняется один раз)"""
+        lock_file = None
         try:
+            lock_file = self._lock_partitions()
+            partition = self._current_partition()
             wb = load_workbook(self.file_path)
             
             if "Вопросы" not in wb.sheetnames:
                 ws = wb.create_sheet("Вопросы")
-                ws.append(["ID пользователя", "Имя", "Вопрос", "Дата"])
+                ws.append(QUESTIONS_HEADERS)
                 self._format_header(ws)
             else:
                 ws = wb["Вопросы"]
+                # Секции, созданные до появления новых столбцов: дописываем заголовки
+                if ws.max_column < len(QUESTIONS_HEADERS):
+                    for column, header in enumerate(QUESTIONS_HEADERS, start=1):
+                        ws.cell(row=1, column=column, value=header)
+                    self._format_header(ws)
             
-            ws.append([
-                str(user_id),
-                user_name,
-                question_text,
-                datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            ])
+            for row in rows:
+                ws.append(list(row))
             
-            wb.save(self.file_path)
-            print(f"Вопрос сохранен в Excel: {self.file_path}")
+            # Атомарная запись через временный файл
+            temp_file = self.file_path + '.tmp'
+            wb.save(temp_file)
+            os.replace(temp_file, self.file_path)
+            self._partition_written(partition, wb)
+            print(f"Вопросов сохранено в Excel: {len(rows)} ({self.file_path})")
             return True
         except Exception as e:
-            print(f"Ошибка сохранения вопроса в Excel: {e}")
+            print(f"Ошибка сохранения вопросов в Excel: {e}")
             return False
+        finally:
+            if lock_file:
+                self._unlock_partitions(lock_file)
     
     async def save_feedback(self, user_id: str, user_name: str, feedback_data: dict):
-        """Сохранение отзыва в Excel (асинхронная версия с блокировкой)"""
+        """
+        Сохранение отзыва в Excel (асинхронная версия с блокировкой). Блокировка секций,
+        чтение и запись книги идут в отдельном потоке: медленная запись другого процесса
+        не останавливает обработку событий
+        """
         async with self._excel_lock:
+            loop = asyncio.get_running_loop()
+            row = await loop.run_in_executor(None, self._save_feedback_row, user_id, user_name, feedback_data)
+        if row is None:
+            return False
+        # Строка записана - обновляем подписчиков (статистика)
+        for listener in self.feedback_listeners:
             try:
-                print(f"[DEBUG] save_feedback: Начало сохранения отзыва для user_id={user_id}")
-                
-                # Используем временный файл для атомарной записи
-                temp_file = self.file_path + '.tmp'
-                
-                # Загружаем существующий файл или создаем новый
-                if os.path.exists(self.file_path):
-                    wb = load_workbook(self.file_path)
-                else:
-                    wb = Workbook()
-                    wb.remove(wb.active)  # Удаляем дефолтный лист
+                listener(row)
+            except Exception as e:
+                print(f"Ошибка обработчика сохраненного отзыва: {e}")
+        return True
+    
+    def _save_feedback_row(self, user_id: str, user_name: str, feedback_data: dict):
+        """Запись строки отзыва в текущую секцию. Возвращает записанную строку или None при ошибке"""
+        lock_file = None
+        try:
+            print(f"[DEBUG] save_feedback: Начало сохранения отзыва для user_id={user_id}")
+            
+            # Запись только в текущую (небольшую) секцию
+            lock_file = self._lock_partitions()
+            partition = self._current_partition()
+            
+            # Используем временный файл для атомарной записи
+            temp_file = self.file_path + '.tmp'
+            
+            # Загружаем существующий файл или создаем новый
+            if os.path.exists(self.file_path):
+                wb = load_workbook(self.file_path)
+            else:
+                wb = Workbook()
+                wb.remove(wb.active)  # Удаляем дефолтный лист
+                self._set_schema_version(wb, FEEDBACK_SCHEMA_VERSION)
 
-                if "Отзывы" not in wb.sheetnames:
-                    ws = wb.create_sheet("Отзывы")
-                    ws.append([
-                        "ID пользователя", "Имя", "Польза форума", "Интересные направления", 
-                        "Предложения по улучшению", "Дата"
-                    ])
-                    self._format_header(ws)
-                    print(f"[DEBUG] Создан лист 'Отзывы' в Excel")
-                else:
-                    ws = wb["Отзывы"]
-                    # Проверяем заголовки - если старые, обновляем их
-                    header_row = ws[1]
-                    if len(header_row) < 6 or header_row[2].value != "Польза форума":
-                        # Старые заголовки - заменяем первую строку
-                        print(f"[DEBUG] Обновление заголовков в листе 'Отзывы'")
-                        # Сохраняем данные (кроме заголовка)
-                        all_data = list(ws.iter_rows(values_only=True))
-                        ws.delete_rows(1, ws.max_row)
-                        ws.append([
-                            "ID пользователя", "Имя", "Польза форума", "Интересные направления", 
-                            "Предложения по улучшению", "Дата"
-                        ])
-                        self._format_header(ws)
-                        # Восстанавливаем данные со старой структурой (если есть)
-                        if len(all_data) > 1:
-                            for row in all_data[1:]:
-                                if row and len(row) >= 3:
-                                    # Старая структура: ID, Имя, Полный отзыв, Дата
-                                    # Новая структура: ID, Имя, Польза, Направления, Предложения, Дата
-                                    if len(row) == 4:
-                                        ws.append([
-                                            row[0], row[1], "", "", row[2] if len(row) > 2 else "", row[3] if len(row) > 3 else ""
-                                        ])
+            # Схема листа приводится к актуальной версии один раз при старте
+            # (migrate_feedback_schema), здесь только добавляем строку
+            if "Отзывы" not in wb.sheetnames:
+                ws = wb.create_sheet("Отзывы")
+                ws.append(FEEDBACK_HEADERS)
+                self._format_header(ws)
+                print(f"[DEBUG] Создан лист 'Отзывы' в Excel")
+            else:
+                ws = wb["Отзывы"]
 
-                # Сохраняем ответы в отдельные столбцы
-                q1_benefit = feedback_data.get("q1_benefit", "")
-                q2_directions = feedback_data.get("q2_directions", "")
-                q3_suggestions = feedback_data.get("q3_suggestions", "")
-                
-                # Если есть полный отзыв (старая структура), пытаемся извлечь из него
-                if not q1_benefit and not q2_directions and not q3_suggestions:
-                    full_feedback = feedback_data.get("full_feedback", "")
-                    if full_feedback:
-                        # Старая структура - оставляем как есть, но разделяем если возможно
-                        q1_benefit = full_feedback
-                        q2_directions = ""
-                        q3_suggestions = ""
+            # Сохраняем ответы в отдельные столбцы
+            q1_benefit = feedback_data.get("q1_benefit", "")
+            q2_directions = feedback_data.get("q2_directions", "")
+            q3_suggestions = feedback_data.get("q3_suggestions", "")
+            
+            # Если есть полный отзыв (старая структура), пытаемся извлечь из него
+            if not q1_benefit and not q2_directions and not q3_suggestions:
+                full_feedback = feedback_data.get("full_feedback", "")
+                if full_feedback:
+                    # Старая структура - оставляем как есть, но разделяем если возможно
+                    q1_benefit = full_feedback
+                    q2_directions = ""
+                    q3_suggestions = ""
 
-                print(f"[DEBUG] Добавляю строку в Excel:")
-                print(f"  user_id={user_id}")
-                print(f"  user_name={user_name}")
-                print(f"  q1_benefit={q1_benefit[:50]}...")
-                print(f"  q2_directions={q2_directions[:50]}...")
-                print(f"  q3_suggestions={q3_suggestions[:50]}...")
-                
-                ws.append([
-                    str(user_id),
-                    user_name,
-                    q1_benefit,
-                    q2_directions,
-                    q3_suggestions,
-                    datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                ])
+            print(f"[DEBUG] Добавляю строку в Excel:")
+            print(f"  user_id={user_id}")
+            print(f"  user_name={user_name}")
+            print(f"  q1_benefit={q1_benefit[:50]}...")
+            print(f"  q2_directions={q2_directions[:50]}...")
+            print(f"  q3_suggestions={q3_suggestions[:50]}...")
+            
+            row = [
+                str(user_id),
+                user_name,
+                q1_benefit,
+                q2_directions,
+                q3_suggestions,
+                datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                self.normalize_track(q2_directions) if self.normalize_track else ""
+            ]
+            ws.append(row)
 
-                # Сохраняем во временный файл
-                wb.save(temp_file)
-                
-                # Блокировка файла для атомарной записи (Linux/Unix)
+            # Сохраняем во временный файл и атомарно заменяем секцию
+            wb.save(temp_file)
+            os.replace(temp_file, self.file_path)
+            self._partition_written(partition, wb)
+            
+            print(f"[DEBUG] ✅ Отзыв успешно сохранен в Excel: {self.file_path}")
+            print(f"[DEBUG] Строка добавлена в лист 'Отзывы'")
+            return row
+        except Exception as e:
+            print(f"[DEBUG] ❌ Ошибка сохранения отзыва в Excel: {e}")
+            import traceback
+            traceback.print_exc()
+            # Удаляем временный файл при ошибке
+            temp_file = self.file_path + '.tmp'
+            if os.path.exists(temp_file):
                 try:
-                    with open(temp_file, 'rb+') as f:
-                        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
-                        try:
-                            # Файл уже сохранен, просто держим блокировку
-                            pass
-                        finally:
-                            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
-                except (OSError, AttributeError):
-                    # Если fcntl не работает (Windows), просто продолжаем
+                    os.remove(temp_file)
+                except:
                     pass
-                
-                # Атомарное переименование
-                os.replace(temp_file, self.file_path)
-                
-                print(f"[DEBUG] ✅ Отзыв успешно сохранен в Excel: {self.file_path}")
-                print(f"[DEBUG] Строка добавлена в лист 'Отзывы'")
-                return True
-            except Exception as e:
-                print(f"[DEBUG] ❌ Ошибка сохранения отзыва в Excel: {e}")
-                import traceback
-                traceback.print_exc()
-                # Удаляем временный файл при ошибке
-                temp_file = self.file_path + '.tmp'
-                if os.path.exists(temp_file):
-                    try:
-                        os.remove(temp_file)
-                    except:
-                        pass
-                return False
-
-
-excel_manager = ExcelManager()
+            return None
+        finally:
+            if lock_file:
+                self._unlock_partitions(lock_file)
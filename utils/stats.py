@@ -0,0 +1,170 @@
+"""
+Статистика обратной связи в памяти
+
+Агрегаты (количество ответов, воронка вопросов q1→q2→q3, популярные направления и треки)
+обновляются при каждом сохранении отзыва, поэтому команде /stats не нужно читать Excel.
+При старте агрегаты ответов один раз строятся по листу "Отзывы". Воронка
+(отправленные опросы, ответы на отдельные вопросы, отмены) в Excel не попадает
+и хранится в небольшом файле рядом. В многопроцессном режиме и воронка, и агрегаты
+ответов хранятся счетчиками в общем хранилище: отзыв, сохраненный любым процессом,
+сразу виден в /stats всех процессов без чтения Excel.
+"""
+import os
+import re
+import json
+from collections import Counter
+
+# Шаги воронки опроса в порядке прохождения
+FUNNEL_STEPS = ("sent", "q1", "q2", "q3", "cancelled")
+
+# Индексы столбцов строки листа "Отзывы"
+DIRECTIONS_COLUMN = 3
+DATE_COLUMN = 5
+TRACK_COLUMN = 6
+
+# Префикс счетчиков агрегатов ответов в общем хранилище
+STATS_PREFIX = "stats_"
+
+
+def normalize_direction(text: str) -> str:
+    """Приведение ответа о направлении к виду для подсчета (регистр, кавычки, пробелы)"""
+    text = re.sub(r"[«»\"'.,!?;:()]", " ", str(text or "").lower())
+    return " ".join(text.split())[:60]
+
+
+class FeedbackStats:
+    def __init__(self, funnel_file: str):
+        self.funnel_file = funnel_file
+        self.responses = 0
+        self.responses_by_day = Counter()  # "ГГГГ-ММ-ДД" -> количество ответов
+        self.directions = Counter()  # нормализованное направление -> количество упоминаний
+        self.tracks = Counter()  # ключ трека (столбец "Трек") -> количество упоминаний
+        self.funnel = dict.fromkeys(FUNNEL_STEPS, 0)
+        self.store = None  # SharedStore для счетчиков воронки и агрегатов (многопроцессный режим)
+        self._load_funnel()
+
+    def _load_funnel(self):
+        """Загрузка счетчиков воронки из файла"""
+        try:
+            if os.path.exists(self.funnel_file):
+                with open(self.funnel_file, 'r', encoding='utf-8') as f:
+                    for step, value in json.load(f).items():
+                        if step in self.funnel:
+                            self.funnel[step] = int(value)
+        except Exception as e:
+            print(f"Ошибка загрузки воронки опроса: {e}")
+
+    def _save_funnel(self):
+        """Сохранение счетчиков воронки (атомарно через временный файл)"""
+        temp_file = self.funnel_file + '.tmp'
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.funnel, f)
+            os.replace(temp_file, self.funnel_file)
+        except Exception as e:
+            print(f"Ошибка сохранения воронки опроса: {e}")
+
+    def funnel_step(self, step: str):
+        """Переход пользователя на шаг воронки (отправлен опрос, ответ на вопрос, отмена)"""
+        if self.store:
+            self.store.incr(f"funnel_{step}")
+            return
+        self.funnel[step] += 1
+        self._save_funnel()
+
+    @staticmethod
+    def _row_counters(row) -> list:
+        """Счетчики, которые увеличивает строка листа "Отзывы" (имена как в общем хранилище)"""
+        names = ["responses"]
+        if len(row) > DATE_COLUMN and row[DATE_COLUMN]:
+            names.append(f"day_{str(row[DATE_COLUMN])[:10]}")
+        if len(row) > DIRECTIONS_COLUMN:
+            direction = normalize_direction(row[DIRECTIONS_COLUMN])
+            if direction:
+                names.append(f"direction_{direction}")
+        if len(row) > TRACK_COLUMN and row[TRACK_COLUMN]:
+            for track in str(row[TRACK_COLUMN]).split(","):
+                names.append(f"track_{track.strip()}")
+        return names
+
+    def _count(self, names, value: int = 1):
+        for name in names:
+            kind, _, key = name.partition("_")
+            if kind == "responses":
+                self.responses += value
+            elif kind == "day":
+                self.responses_by_day[key] += value
+            elif kind == "direction":
+                self.directions[key] += value
+            elif kind == "track":
+                self.tracks[key] += value
+
+    def _clear(self):
+        self.responses = 0
+        self.responses_by_day.clear()
+        self.directions.clear()
+        self.tracks.clear()
+
+    def add_response(self, row):
+        """Учет сохраненной строки листа "Отзывы" (ID, Имя, Польза, Направления, Предложения, Дата, Трек)"""
+        names = self._row_counters(row)
+        if self.store:
+            self.store.incr_many([STATS_PREFIX + name for name in names])
+            return
+        self._count(names)
+
+    def rebuild(self, rows):
+        """Построение агрегатов ответов по всем строкам листа (при старте и после пересчета треков)"""
+        self._clear()
+        for row in rows:
+            if row and any(value not in (None, "") for value in row):
+                self._count(self._row_counters(row))
+        if self.store:
+            values = {"responses": self.responses}
+            values.update({f"day_{key}": value for key, value in self.responses_by_day.items()})
+            values.update({f"direction_{key}": value for key, value in self.directions.items()})
+            values.update({f"track_{key}": value for key, value in self.tracks.items()})
+            self.store.replace_counters(STATS_PREFIX, values)
+
+    def load_shared(self):
+        """Агрегаты ответов из общего хранилища (многопроцессный режим)"""
+        self._clear()
+        for name, value in self.store.counters(STATS_PREFIX).items():
+            self._count([name], value)
+
+    def format(self, top: int = 5, track_titles: dict = None) -> str:
+        """Текст статистики для команды /stats (track_titles - ключ трека -> название)"""
+        if self.store:
+            self.load_shared()
+        lines = [f"Ответов на опрос: {self.responses}"]
+        if self.responses_by_day:
+            day = max(self.responses_by_day)
+            lines.append(f"За {day}: {self.responses_by_day[day]}")
+
+        funnel = dict(self.funnel)
+        if self.store:
+            # Счетчики из файла (до многопроцессного режима) плюс общие счетчики процессов
+            for step, value in self.store.counters("funnel_").items():
+                funnel[step] = funnel.get(step, 0) + value
+        sent = funnel["sent"]
+        lines.append("")
+        lines.append("Воронка опроса:")
+        lines.append(f"Отправлено: {sent}")
+        for step, title in (("q1", "Вопрос 1"), ("q2", "Вопрос 2"), ("q3", "Вопрос 3")):
+            share = f" ({funnel[step] * 100 / sent:.0f}%)" if sent else ""
+            lines.append(f"{title}: {funnel[step]}{share}")
+        lines.append(f"Отменено: {funnel['cancelled']}")
+
+        if self.tracks:
+            titles = track_titles or {}
+            lines.append("")
+            lines.append("Треки по ответам:")
+            for track, count in self.tracks.most_common():
+                lines.append(f"• {titles.get(track, track)} — {count}")
+
+        if self.directions:
+            lines.append("")
+            lines.append("Популярные направления:")
+            for direction, count in self.directions.most_common(top):
+                lines.append(f"• {direction} — {count}")
+        return "\n".join(lines)
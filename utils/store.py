@@ -0,0 +1,219 @@
+"""
+Общее хранилище состояния для нескольких процессов бота (SQLite в режиме WAL)
+
+Состояния пользователей (FSM), база пользователей, обработанные callback_id,
+счетчики (воронка и агрегаты статистики опроса) и последние вопросы к докладам
+хранятся в одном файле SQLite. Каждая операция - отдельная короткая
+транзакция, поэтому процессы-воркеры видят изменения друг друга сразу, а WAL
+позволяет читать параллельно с записью. Соединение создается в каждом процессе свое.
+"""
+import json
+import time
+import sqlite3
+from collections.abc import MutableMapping
+
+# Сколько хранить обработанные callback_id (секунды)
+CALLBACK_TTL = 24 * 3600
+# Удалять устаревшие callback_id через каждые N добавлений
+CALLBACK_PRUNE_EVERY = 1000
+
+
+class SharedStore:
+    def __init__(self, path: str):
+        self.path = path
+        # isolation_level=None - автокоммит, каждая операция атомарна сама по себе
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS states (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS users (user_id INTEGER PRIMARY KEY, chat_id INTEGER);
+            CREATE TABLE IF NOT EXISTS callbacks (callback_id TEXT PRIMARY KEY, seen_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS questions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, talk_id TEXT NOT NULL,
+                user_name TEXT, text TEXT, date TEXT
+            );
+            CREATE INDEX IF NOT EXISTS questions_talk ON questions (talk_id, id);
+        """)
+        self.states = StateMapping(self._db)
+        self.processed_callbacks = SeenCallbacks(self._db)
+
+    def close(self):
+        self._db.close()
+
+    def is_empty(self) -> bool:
+        """В хранилище еще нет ни пользователей, ни состояний"""
+        row = self._db.execute(
+            "SELECT (SELECT COUNT(*) FROM users) + (SELECT COUNT(*) FROM states)"
+        ).fetchone()
+        return row[0] == 0
+
+    def import_json(self, users_db: dict, states: dict):
+        """Перенос данных из users_db.json и user_states.json (при первом запуске)"""
+        with self._db:
+            self._db.execute("BEGIN")
+            for user_id_str, user_data in users_db.get("users", {}).items():
+                self.save_user(user_data.get("user_id") or int(user_id_str), user_data.get("chat_id"))
+            for user_id in users_db.get("user_ids", []):
+                self.save_user(user_id)
+            for key, value in states.items():
+                self.states[key] = value
+
+    def save_user(self, user_id: int, chat_id: int = None):
+        """Добавление пользователя или обновление его chat_id"""
+        self._db.execute(
+            "INSERT INTO users (user_id, chat_id) VALUES (?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET chat_id = COALESCE(excluded.chat_id, users.chat_id)",
+            (user_id, chat_id or None)
+        )
+
+    def users_db(self) -> dict:
+        """База пользователей в формате users_db.json"""
+        users = {}
+        user_ids = []
+        for user_id, chat_id in self._db.execute("SELECT user_id, chat_id FROM users ORDER BY rowid"):
+            users[str(user_id)] = {"user_id": user_id, "chat_id": chat_id} if chat_id else {"user_id": user_id}
+            user_ids.append(user_id)
+        return {"users": users, "user_ids": user_ids}
+
+    def incr(self, name: str, value: int = 1):
+        """Увеличение счетчика"""
+        self._db.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = counters.value + excluded.value",
+            (name, value)
+        )
+
+    def incr_many(self, names: list):
+        """Увеличение нескольких счетчиков на 1 одной транзакцией"""
+        with self._db:
+            self._db.execute("BEGIN")
+            for name in names:
+                self.incr(name)
+
+    def replace_counters(self, prefix: str, values: dict):
+        """Замена всех счетчиков с именем, начинающимся с prefix (values - имена без префикса)"""
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM counters WHERE substr(name, 1, ?) = ?", (len(prefix), prefix))
+            self._db.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?)",
+                [(prefix + name, value) for name, value in values.items()]
+            )
+
+    def add_question(self, talk_id: str, user_name: str, text: str, date: str, keep: int):
+        """Вопрос к докладу: в таблице остаются последние keep вопросов доклада, счетчик - всего вопросов"""
+        with self._db:
+            self._db.execute("BEGIN")
+            self._add_question(talk_id, user_name, text, date, keep)
+            self.incr(f"questions_{talk_id}")
+
+    def _add_question(self, talk_id: str, user_name: str, text: str, date: str, keep: int):
+        self._db.execute(
+            "INSERT INTO questions (talk_id, user_name, text, date) VALUES (?, ?, ?, ?)",
+            (talk_id, user_name, text, date)
+        )
+        self._db.execute(
+            "DELETE FROM questions WHERE talk_id = ? AND id <= "
+            "(SELECT id FROM questions WHERE talk_id = ? ORDER BY id DESC LIMIT 1 OFFSET ?)",
+            (talk_id, talk_id, keep)
+        )
+
+    def replace_questions(self, rows: list, keep: int):
+        """Замена вопросов и их счетчиков строками (id доклада, имя, текст, дата) в порядке записи"""
+        counts = {}
+        with self._db:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM questions")
+            for talk_id, user_name, text, date in rows:
+                self._add_question(talk_id, user_name, text, date, keep)
+                counts[talk_id] = counts.get(talk_id, 0) + 1
+            self._db.execute("DELETE FROM counters WHERE substr(name, 1, 10) = 'questions_'")
+            self._db.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?)",
+                [(f"questions_{talk_id}", count) for talk_id, count in counts.items()]
+            )
+
+    def latest_questions(self, talk_id: str, limit: int) -> list:
+        """Последние вопросы к докладу (имя, текст, дата), новые первыми"""
+        return self._db.execute(
+            "SELECT user_name, text, date FROM questions WHERE talk_id = ? ORDER BY id DESC LIMIT ?",
+            (talk_id, limit)
+        ).fetchall()
+
+    def counters(self, prefix: str = "") -> dict:
+        """Счетчики с именем, начинающимся с prefix (ключи без префикса)"""
+        rows = self._db.execute(
+            "SELECT name, value FROM counters WHERE substr(name, 1, ?) = ?", (len(prefix), prefix)
+        )
+        return {name[len(prefix):]: value for name, value in rows}
+
+
+class StateMapping(MutableMapping):
+    """
+    Состояния пользователей как словарь: ключи int (user_id) и str (feedback_<id> и т.п.),
+    значения - JSON. Изменение вложенного значения нужно записать обратно присваиванием.
+    """
+
+    def __init__(self, db):
+        self._db = db
+
+    @staticmethod
+    def _key(key) -> str:
+        return str(key)
+
+    @staticmethod
+    def _restore_key(key: str):
+        # Как при загрузке user_states.json: числовые ключи - это user_id
+        return int(key) if key.isdigit() else key
+
+    def __getitem__(self, key):
+        row = self._db.execute("SELECT value FROM states WHERE key = ?", (self._key(key),)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        self._db.execute(
+            "INSERT OR REPLACE INTO states (key, value) VALUES (?, ?)",
+            (self._key(key), json.dumps(value, ensure_ascii=False))
+        )
+
+    def __delitem__(self, key):
+        cursor = self._db.execute("DELETE FROM states WHERE key = ?", (self._key(key),))
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        return self._db.execute("SELECT 1 FROM states WHERE key = ?", (self._key(key),)).fetchone() is not None
+
+    def __iter__(self):
+        return iter([self._restore_key(key) for (key,) in self._db.execute("SELECT key FROM states")])
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM states").fetchone()[0]
+
+
+class SeenCallbacks:
+    """Обработанные callback_id (интерфейс как у RecentIds: in и add), устаревшие удаляются"""
+
+    def __init__(self, db):
+        self._db = db
+        self._added = 0
+
+    def __contains__(self, callback_id) -> bool:
+        return self._db.execute(
+            "SELECT 1 FROM callbacks WHERE callback_id = ?", (str(callback_id),)
+        ).fetchone() is not None
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM callbacks").fetchone()[0]
+
+    def add(self, callback_id):
+        self._db.execute(
+            "INSERT OR IGNORE INTO callbacks (callback_id, seen_at) VALUES (?, ?)", (str(callback_id), time.time())
+        )
+        self._added += 1
+        if self._added % CALLBACK_PRUNE_EVERY == 0:
+            self._db.execute("DELETE FROM callbacks WHERE seen_at < ?", (time.time() - CALLBACK_TTL,))
@@ -0,0 +1,168 @@
+"""
+Несколько мероприятий (ботов) в одном процессе
+
+У каждого мероприятия свои настройки (значения config.py с переопределениями из
+TENANTS_FILE), токен бота, контент, каталог данных (состояния, Excel, кампании) и
+лимиты частоты. Сессия aiohttp, планировщик обработчиков и event loop общие.
+Текущее мероприятие хранится в contextvar: задачи, созданные при обработке события
+мероприятия, наследуют его, поэтому код бота обращается к объектам по прежним именам
+(user_states, excel_manager, ...) через TenantLocal.
+"""
+import os
+import json
+import contextlib
+import contextvars
+from types import SimpleNamespace
+
+# Текущее мероприятие (None - мероприятие по умолчанию)
+current_tenant = contextvars.ContextVar("current_tenant", default=None)
+
+# Настройки процесса, которые нельзя переопределить для отдельного мероприятия
+PROCESS_SETTINGS = {
+    "WORKER_COUNT", "USER_QUEUE_LIMIT", "QUEUE_LIMIT", "QUEUE_OVERFLOW_WAIT", "SHUTDOWN_TIMEOUT",
+    "LOOP_LAG_INTERVAL", "LOOP_LAG_THRESHOLD", "USE_UVLOOP", "WORKER_PROCESSES", "WORKER_QUEUE_SIZE",
+    "SHARED_STORE_FILE", "WORKER_INDEX", "PROFILES_DIR", "TENANTS_FILE",
+    "WARMUP_CONNECTIONS", "KEEPALIVE_TIMEOUT", "WARMUP_TIMEOUT",
+    "API_REQUEST_TIMEOUT", "API_FAILURE_THRESHOLD", "API_RECOVERY_TIMEOUT",
+}
+
+
+class Tenant:
+    """Мероприятие: id, настройки, каталог данных и объекты бота этого мероприятия"""
+
+    def __init__(self, tenant_id: str, settings: dict, directory: str = ""):
+        self.id = tenant_id
+        self.settings = SimpleNamespace(**settings)
+        self.directory = directory
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, path: str) -> str:
+        """Путь файла мероприятия (относительные пути - внутри каталога мероприятия)"""
+        if not path or not self.directory or os.path.isabs(path):
+            return path
+        return os.path.join(self.directory, path)
+
+
+class TenantRegistry:
+    def __init__(self):
+        self.tenants = {}  # id -> Tenant
+        self.default = None  # Мероприятие вне контекста (обычный режим, запуск и остановка)
+        self._by_bot = {}  # id(bot) -> Tenant
+
+    def add(self, tenant: Tenant):
+        self.tenants[tenant.id] = tenant
+        if getattr(tenant, "bot", None) is not None:
+            self._by_bot[id(tenant.bot)] = tenant
+        if self.default is None:
+            self.default = tenant
+
+    def __iter__(self):
+        return iter(self.tenants.values())
+
+    def __len__(self) -> int:
+        return len(self.tenants)
+
+    def current(self) -> Tenant:
+        return current_tenant.get() or self.default
+
+    @staticmethod
+    @contextlib.contextmanager
+    def use(tenant: Tenant):
+        """Делает tenant текущим внутри блока (задачи, созданные в блоке, наследуют его)"""
+        token = current_tenant.set(tenant)
+        try:
+            yield tenant
+        finally:
+            current_tenant.reset(token)
+
+    def for_event(self, event):
+        """Мероприятие, бот которого получил событие"""
+        return self._by_bot.get(id(getattr(event, "bot", None)))
+
+    def bound(self, handler):
+        """
+        Декоратор обработчика, выполняемого воркером планировщика: воркеры общие
+        для всех мероприятий, поэтому мероприятие восстанавливается по боту события
+        """
+        async def wrapper(event):
+            tenant = self.for_event(event)
+            if tenant is None:
+                await handler(event)
+                return
+            with self.use(tenant):
+                await handler(event)
+        wrapper.__name__ = getattr(handler, "__name__", "handler")
+        wrapper.__doc__ = handler.__doc__
+        return wrapper
+
+
+class TenantLocal:
+    """Объект текущего мероприятия под постоянным именем (атрибуты и операции переадресуются)"""
+
+    __slots__ = ("_registry", "_name")
+
+    def __init__(self, registry: TenantRegistry, name: str):
+        object.__setattr__(self, "_registry", registry)
+        object.__setattr__(self, "_name", name)
+
+    def _target(self):
+        return getattr(self._registry.current(), self._name)
+
+    def __getattr__(self, attr):
+        return getattr(self._target(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._target(), attr, value)
+
+    def __getitem__(self, key):
+        return self._target()[key]
+
+    def __setitem__(self, key, value):
+        self._target()[key] = value
+
+    def __delitem__(self, key):
+        del self._target()[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self._target()
+
+    def __iter__(self):
+        return iter(self._target())
+
+    def __len__(self) -> int:
+        return len(self._target())
+
+    def __repr__(self) -> str:
+        return f"<{self._name} мероприятия: {self._target()!r}>"
+
+
+def base_settings(config_module) -> dict:
+    """Настройки из config.py (значения по умолчанию для всех мероприятий)"""
+    return {name: value for name, value in vars(config_module).items() if name.isupper()}
+
+
+def load_tenants(path: str, config_module) -> list:
+    """
+    Чтение файла мероприятий: [{"id": ..., "dir": ..., "settings": {"BOT_TOKEN": ..., ...}}].
+    Возвращает список (id, каталог, настройки)
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    defaults = base_settings(config_module)
+    result = []
+    seen = set()
+    for entry in entries:
+        tenant_id = str(entry.get("id") or "")
+        if not tenant_id or tenant_id in seen:
+            raise ValueError(f"мероприятие без id или с повторным id: {tenant_id!r}")
+        seen.add(tenant_id)
+        overrides = entry.get("settings") or {}
+        unknown = [name for name in overrides if name not in defaults or name in PROCESS_SETTINGS]
+        if unknown:
+            raise ValueError(f"мероприятие {tenant_id}: настройки {', '.join(unknown)} нельзя задать отдельно")
+        settings = dict(defaults, **overrides)
+        if not settings.get("BOT_TOKEN"):
+            raise ValueError(f"мероприятие {tenant_id}: не указан BOT_TOKEN")
+        result.append((tenant_id, entry.get("dir") or tenant_id, settings))
+    return result
@@ -0,0 +1,145 @@
+"""
+Нормализация ответов на вопрос 2 опроса ("самая понравившаяся секция")
+
+Свободный текст ответа сводится к ключам треков из контента (track_gamedev, track_ai, ...)
+или к OTHER_TRACK, если трек не распознан. Индекс строится заранее: основа слова -> ключ
+трека (синонимы TRACK_KEYWORDS и слова из названий треков в контенте, основы, общие
+для нескольких треков, в индекс не попадают). Слово ответа ищется в индексе по основе,
+затем по началу основы, при опечатке - нечетким сравнением с основами индекса.
+Индекс перестраивается при обновлении контента, результаты кэшируются.
+"""
+import re
+import difflib
+
+# Значение для ответов, в которых трек не распознан
+OTHER_TRACK = "other"
+
+# Синонимы треков в дополнение к названиям из контента
+TRACK_KEYWORDS = {
+    "track_gamedev": [
+        "геймдев", "гейм", "gamedev", "game", "games", "игры", "игровой", "игростроение",
+        "unity", "unreal", "киберспорт",
+    ],
+    "track_ai": [
+        "ии", "ai", "ml", "llm", "gpt", "chatgpt", "искусственный", "интеллект", "нейросеть",
+        "нейросети", "нейронка", "нейро", "машинное",
+    ],
+    "track_drones": [
+        "беспилотник", "беспилотный", "бпла", "бас", "дрон", "квадрокоптер", "коптер",
+        "uav", "drone", "drones", "авиация",
+    ],
+    "track_media": [
+        "медиа", "media", "журналистика", "журналист", "блогер", "блог", "smm", "смм", "видео",
+        "телевидение", "тв", "соцсети",
+    ],
+}
+
+# Слова названий треков, которые не указывают на конкретный трек
+STOP_STEMS = {"блок", "геро", "форум", "трек", "секц", "направлен", "цифров"}
+
+# Окончания для отсечения (длинные раньше коротких)
+_ENDINGS = sorted([
+    "иями", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ой", "ей", "ий", "ый", "ая", "яя",
+    "ое", "ее", "ые", "ие", "ых", "их", "ом", "ем", "ам", "ям", "ах", "ях", "ов", "ев", "ую", "юю",
+    "ия", "ие", "ью", "ы", "и", "а", "я", "о", "е", "у", "ю", "ь", "s",
+], key=len, reverse=True)
+_WORD_RE = re.compile(r"[a-zа-я0-9]+")
+_BLOCK_RE = re.compile(r"блок\w*\s*(?:№\s*)?(\d+)")
+_ORDINAL_BLOCK_RE = re.compile(r"(перв|втор|трет|четверт)\w*\s+блок")
+_ORDINALS = {"перв": "1", "втор": "2", "трет": "3", "четверт": "4"}
+# Минимальная длина основы для поиска по началу и нечеткого сравнения
+_MIN_FUZZY = 5
+
+
+def stem(word: str) -> str:
+    """Грубая основа слова: нижний регистр, ё -> е, отсечение одного окончания"""
+    word = word.lower().replace("ё", "е")
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+class TrackNormalizer:
+    def __init__(self, content_store, cache_limit: int = 10000):
+        self.content_store = content_store
+        self.cache_limit = cache_limit
+        self._version = None  # Версия контента, по которой построен индекс
+        self._index = {}  # основа -> ключ трека
+        self._long_stems = []  # основы для нечеткого сравнения
+        self._blocks = {}  # номер блока из названия трека -> ключ трека
+        self._cache = {}  # текст ответа -> результат
+
+    def _build(self, tracks: dict):
+        """Построение индекса основ по синонимам и названиям треков"""
+        owners = {}
+        self._blocks = {}
+        for key in tracks:
+            words = list(TRACK_KEYWORDS.get(key, []))
+            title = f"{tracks[key].get('button', '')} {tracks[key].get('name', '')}".lower()
+            words += [word for word in _WORD_RE.findall(title) if len(word) >= 4 and not word.isdigit()]
+            for word in words:
+                word_stem = stem(word)
+                if word_stem not in STOP_STEMS:
+                    owners.setdefault(word_stem, set()).add(key)
+            # "БЛОК 1: ..." - участники могут ответить номером блока
+            match = _BLOCK_RE.search(title)
+            if match:
+                self._blocks[match.group(1)] = key
+        self._index = {word_stem: keys.pop() for word_stem, keys in owners.items() if len(keys) == 1}
+        self._long_stems = [word_stem for word_stem in self._index if len(word_stem) >= _MIN_FUZZY]
+        self._cache.clear()
+
+    def _refresh(self):
+        snapshot = self.content_store.current
+        version = snapshot.version if snapshot else None
+        if version != self._version:
+            self._build(snapshot.tracks if snapshot else {})
+            self._version = version
+
+    def _match_word(self, word: str):
+        """Ключ трека для одного слова или None"""
+        word_stem = stem(word)
+        if word_stem in self._index:
+            return self._index[word_stem]
+        if len(word_stem) < _MIN_FUZZY:
+            return None
+        # Составные слова: "нейросетевой" -> "нейро"
+        for end in range(len(word_stem) - 1, _MIN_FUZZY - 1, -1):
+            if word_stem[:end] in self._index:
+                return self._index[word_stem[:end]]
+        close = difflib.get_close_matches(word_stem, self._long_stems, n=1, cutoff=0.8)
+        return self._index[close[0]] if close else None
+
+    def tracks(self, text: str) -> list:
+        """Ключи треков, упомянутых в ответе, в порядке упоминания ([] - трек не распознан)"""
+        lowered = str(text or "").lower().replace("ё", "е")
+        mentions = []  # (позиция в тексте, ключ трека)
+        for match in _BLOCK_RE.finditer(lowered):
+            mentions.append((match.start(), self._blocks.get(match.group(1))))
+        for match in _ORDINAL_BLOCK_RE.finditer(lowered):
+            mentions.append((match.start(), self._blocks.get(_ORDINALS[match.group(1)])))
+        for match in _WORD_RE.finditer(lowered):
+            mentions.append((match.start(), self._match_word(match.group())))
+        found = []
+        for _, key in sorted(mentions, key=lambda mention: mention[0]):
+            if key and key not in found:
+                found.append(key)
+        return found
+
+    def normalize(self, text) -> str:
+        """
+        Значение столбца "Трек": ключи треков через запятую, OTHER_TRACK, если трек
+        не распознан, пустая строка для пустого ответа
+        """
+        text = str(text or "").strip()
+        if not text:
+            return ""
+        self._refresh()
+        if text in self._cache:
+            return self._cache[text]
+        result = ", ".join(self.tracks(text)) or OTHER_TRACK
+        if len(self._cache) >= self.cache_limit:
+            self._cache.clear()
+        self._cache[text] = result
+        return result
@@ -0,0 +1,118 @@
+"""
+Прогрев при запуске
+
+Первый пользователь после перезапуска не должен ждать DNS, TCP+TLS рукопожатия с MAX API
+и первых обращений к данным, а неверный BOT_TOKEN должен обнаруживаться при запуске,
+а не при первой неудачной отправке:
+- StartupTimings - замеры этапов холодного старта (отчет в лог и в /metrics)
+- check_token - проверка токена дешевым запросом GET /me
+- ConnectionKeeper - заранее открывает несколько соединений пула и поддерживает их:
+  если запросов к API не было дольше времени жизни соединения, пул прогревается снова
+"""
+import time
+import asyncio
+import contextlib
+import aiohttp
+from utils.metrics import metrics
+
+
+class TokenError(Exception):
+    """MAX API отклонил токен бота"""
+
+
+class StartupTimings:
+    """Длительность этапов запуска бота"""
+
+    def __init__(self, started: float = None):
+        self.started = time.monotonic() if started is None else started
+        self.phases = []  # (название, секунды)
+
+    def add(self, name: str, seconds: float):
+        self.phases.append((name, seconds))
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def finish(self) -> float:
+        """Время от запуска процесса до готовности (секунды)"""
+        total = time.monotonic() - self.started
+        metrics.set_gauge("cold_start_seconds", round(total, 3))
+        return total
+
+    def format(self) -> str:
+        lines = [f"  {name}: {seconds * 1000:.0f} мс" for name, seconds in self.phases]
+        return "\n".join(lines)
+
+
+async def check_token(session: aiohttp.ClientSession, api_base_url: str, token: str, timeout: float) -> dict:
+    """
+    Проверка токена запросом GET /me. Возвращает данные бота.
+    TokenError - токен отклонен; сетевые ошибки пробрасываются (API может быть временно недоступно)
+    """
+    async with session.get(f"{api_base_url}/me", headers={"Authorization": token},
+                           timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+        if response.status in (401, 403):
+            raise TokenError(f"{response.status} - {(await response.text())[:200]}")
+        response.raise_for_status()
+        return await response.json()
+
+
+class ConnectionKeeper:
+    """Поддержание заранее открытых соединений с MAX API в пуле сессии"""
+
+    def __init__(self, api_base_url: str, token: str, connections: int, keepalive: float, timeout: float):
+        self.api_base_url = api_base_url
+        self.token = token
+        self.connections = connections
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self.last_activity = 0.0  # Время последнего завершенного запроса сессии (monotonic)
+        self.rewarms = 0
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """Трассировка запросов сессии: любой запрос продлевает жизнь соединения в пуле"""
+        trace = aiohttp.TraceConfig()
+
+        async def on_request_end(session, context, params):
+            self.last_activity = time.monotonic()
+
+        trace.on_request_end.append(on_request_end)
+        return trace
+
+    def connector(self) -> aiohttp.TCPConnector:
+        """Коннектор сессии: соединения простаивают в пуле keepalive секунд"""
+        return aiohttp.TCPConnector(keepalive_timeout=self.keepalive)
+
+    async def warm(self, session: aiohttp.ClientSession) -> int:
+        """
+        Открытие соединений параллельными запросами GET /me (каждый занимает свое соединение,
+        после ответа оно остается в пуле). Возвращает количество успешных запросов
+        """
+        async def ping():
+            async with session.get(f"{self.api_base_url}/me", headers={"Authorization": self.token},
+                                   timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                await response.read()
+                return response.status == 200
+
+        results = await asyncio.gather(*(ping() for _ in range(self.connections)), return_exceptions=True)
+        return sum(1 for result in results if result is True)
+
+    async def run(self, session: aiohttp.ClientSession):
+        """Повторный прогрев, если соединения простаивали почти до закрытия пулом"""
+        interval = self.keepalive * 0.8
+        while True:
+            await asyncio.sleep(max(interval - (time.monotonic() - self.last_activity), 1))
+            if time.monotonic() - self.last_activity < interval:
+                continue
+            opened = await self.warm(session)
+            # При недоступном API следующая попытка - через интервал, а не сразу
+            self.last_activity = time.monotonic()
+            self.rewarms += 1
+            metrics.set_gauge("pool_rewarms", self.rewarms)
+            if opened < self.connections:
+                print(f"⚠️ Прогрев соединений: открыто {opened} из {self.connections}")
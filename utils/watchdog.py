@@ -0,0 +1,105 @@
+"""
+Контроль задержек event loop и интеграция с watchdog systemd
+
+Корутина-монитор периодически засыпает и измеряет, насколько позже срока проснулась:
+это и есть задержка loop (блокирующий код в обработчиках). Отдельный поток следит
+за пульсом монитора и, если loop завис дольше порога, печатает стек главного потока.
+Пока loop жив, монитор отправляет systemd WATCHDOG=1 (sd_notify без зависимостей).
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import threading
+import traceback
+from utils.metrics import metrics
+
+
+def sd_notify(message: str) -> bool:
+    """Отправка уведомления systemd через NOTIFY_SOCKET (READY=1, WATCHDOG=1, STOPPING=1)"""
+    address = os.getenv("NOTIFY_SOCKET")
+    if not address:
+        return False
+    if address.startswith("@"):
+        # Абстрактный сокет Linux
+        address = "\0" + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(message.encode())
+        return True
+    except OSError as e:
+        print(f"Ошибка отправки уведомления systemd: {e}")
+        return False
+
+
+def watchdog_interval():
+    """Интервал WatchdogSec из unit-файла в секундах (None, если watchdog не включен)"""
+    usec = os.getenv("WATCHDOG_USEC")
+    pid = os.getenv("WATCHDOG_PID")
+    if not usec or (pid and pid != str(os.getpid())):
+        return None
+    try:
+        return int(usec) / 1_000_000
+    except ValueError:
+        return None
+
+
+class LoopLagMonitor:
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval  # Период измерения (секунды)
+        self.threshold = threshold  # Задержка, после которой печатается стек (секунды)
+        self.max_lag = 0.0
+        self._heartbeat = time.monotonic()
+        self._loop_thread_id = None
+        self._stop = threading.Event()
+
+        # При включенном watchdog systemd пингуем минимум дважды за его интервал
+        self.watchdog = watchdog_interval()
+        if self.watchdog:
+            self.interval = min(self.interval, self.watchdog / 2)
+
+        metrics.set_gauge("loop_lag_max_seconds", lambda: self.max_lag)
+
+    async def run(self):
+        """Измерение задержки loop и пинг watchdog systemd"""
+        loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        thread = threading.Thread(target=self._watch, name="loop-lag-watch", daemon=True)
+        thread.start()
+        try:
+            while True:
+                started = loop.time()
+                await asyncio.sleep(self.interval)
+                lag = max(loop.time() - started - self.interval, 0.0)
+                self._heartbeat = time.monotonic()
+                self.max_lag = max(self.max_lag, lag)
+                metrics.set_gauge("loop_lag_seconds", lag)
+                if lag >= self.threshold:
+                    metrics.inc("loop_lag_slow")
+                    print(f"⚠️ Задержка event loop: {lag:.3f} с")
+                if self.watchdog:
+                    sd_notify("WATCHDOG=1")
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        """Поток-наблюдатель: печатает стек главного потока, пока loop заблокирован"""
+        reported = False
+        check_every = max(self.threshold / 2, 0.05)
+        while not self._stop.wait(check_every):
+            stalled = time.monotonic() - self._heartbeat - self.interval
+            if stalled < self.threshold:
+                reported = False
+                continue
+            if reported:
+                continue
+            # Один отчет на каждое зависание
+            reported = True
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = "".join(traceback.format_stack(frame))
+            print(f"⚠️ Event loop заблокирован более {stalled:.3f} с, стек:\n{stack}")